@@ -1,10 +1,23 @@
 import type { VercelRequest, VercelResponse } from '@vercel/node';
+import { randomBytes } from 'crypto';
 import { checkRateLimit, getClientIP } from './utils/rateLimit.js';
 
 const PRINTER_API_URL = process.env.PRINTER_API_URL || 'https://apiticket.alsatechnologies.com';
 // Forzar ticket_prod para Oficina, ignorar variable de entorno
 const PRINTER_API_URL_2 = 'https://ticket_prod.alsatechnologies.com';
 
+// Header W3C traceparent: se reenvía el del cliente o se crea uno nuevo, para
+// correlacionar esta solicitud con los tiempos por etapa del servidor de impresión
+const TRACEPARENT_RE = /^[0-9a-f]{2}-[0-9a-f]{32}-[0-9a-f]{16}-[0-9a-f]{2}$/;
+
+function getTraceparent(req: VercelRequest): string {
+  const incoming = req.headers['traceparent'];
+  if (typeof incoming === 'string' && TRACEPARENT_RE.test(incoming.trim().toLowerCase())) {
+    return incoming.trim().toLowerCase();
+  }
+  return `00-${randomBytes(16).toString('hex')}-${randomBytes(8).toString('hex')}-01`;
+}
+
 export default async function handler(
   req: VercelRequest,
   res: VercelResponse
@@ -13,7 +26,7 @@ export default async function handler(
   if (req.method === 'OPTIONS') {
     res.setHeader('Access-Control-Allow-Origin', '*');
     res.setHeader('Access-Control-Allow-Methods', 'POST, OPTIONS');
-    res.setHeader('Access-Control-Allow-Headers', 'Content-Type');
+    res.setHeader('Access-Control-Allow-Headers', 'Content-Type, Idempotency-Key, traceparent');
     return res.status(200).end();
   }
 
@@ -47,8 +60,11 @@ export default async function handler(
     const controller = new AbortController();
     const timeoutId = setTimeout(() => controller.abort(), 15000);
 
+    const traceparent = getTraceparent(req);
+    const traceId = traceparent.split('-')[1];
+
     // Log para debugging
-    console.log('🔧 [PRINT-TICKET] Enviando a:', apiUrl);
+    console.log('🔧 [PRINT-TICKET] Enviando a:', apiUrl, 'trace_id:', traceId);
     console.log('🔧 [PRINT-TICKET] Configuración impresora:', {
       connection_type: printData.printer_config?.connection_type,
       printer_name: printData.printer_config?.printer_name,
@@ -56,11 +72,19 @@ export default async function handler(
     });
 
     // Hacer la solicitud al servidor de impresión (sin incluir rol_usuario en el body)
+    // Reenviar la clave de idempotencia para que un reintento no vuelva a imprimir
+    const headers: Record<string, string> = {
+      'Content-Type': 'application/json',
+      traceparent,
+    };
+    const idempotencyKey = req.headers['idempotency-key'];
+    if (typeof idempotencyKey === 'string' && idempotencyKey) {
+      headers['Idempotency-Key'] = idempotencyKey;
+    }
+
     const response = await fetch(`${apiUrl}/api/printer/print-ticket`, {
       method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
+      headers,
       body: JSON.stringify(printData),
       signal: controller.signal,
     }).catch((fetchError: any) => {
@@ -107,7 +131,8 @@ export default async function handler(
     // Retornar la respuesta con los headers CORS necesarios
     res.setHeader('Access-Control-Allow-Origin', '*');
     res.setHeader('Access-Control-Allow-Methods', 'POST, OPTIONS');
-    res.setHeader('Access-Control-Allow-Headers', 'Content-Type');
+    res.setHeader('Access-Control-Allow-Headers', 'Content-Type, Idempotency-Key, traceparent');
+    res.setHeader('X-Trace-Id', traceId);
 
     if (!response.ok) {
       return res.status(response.status).json({
@@ -0,0 +1,245 @@
+"""
+Servicio combinado de boletas: la API de impresión (main_updated.py) y el generador de
+certificados (api_certificados_corregida.py) en un solo proceso, más /api/boleta/complete,
+que con una sola solicitud imprime el ticket y genera el certificado en paralelo.
+
+Ambos servicios comparten en este proceso el registro de impresoras, los codificadores de
+página de códigos, los logos en memoria, el caché de tickets para reimpresión y los cachés
+de imágenes del PDF. Los endpoints de los dos servicios siguen disponibles con las mismas rutas.
+
+Uso:
+    python api_boleta_completa.py            (puerto 8003)
+    uvicorn api_boleta_completa:app --port 8003
+
+Requisitos:
+    Los de main_updated.py y api_certificados_corregida.py
+"""
+
+import asyncio
+import base64
+import io
+import logging
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime
+from typing import List, Literal, Optional
+
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute, APIWebSocketRoute
+from pydantic import BaseModel, Field
+
+import api_certificados_corregida as certificados
+import main_updated as impresion
+from api_certificados_corregida import CertificadoRequest, ThermalCertificateRequest
+from main_updated import BoletaCodeOptions, PrinterConfig, TicketPrintRequest
+
+logger = logging.getLogger(__name__)
+
+# Rutas de los servicios que no se montaron por coincidir con otra (ver merge_routes);
+# se registran en el arranque, cuando el logging ya está configurado
+route_collisions: List[tuple] = []
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Arranque explícito de ambos servicios (registro de impresoras, afinidad de workers,
+    # monitor del event loop y warm-up de ReportLab); se detienen en orden inverso
+    async with AsyncExitStack() as stack:
+        await stack.enter_async_context(impresion.lifespan(app))
+        await stack.enter_async_context(certificados.lifespan(app))
+        for path, methods, service, owner in route_collisions:
+            if owner == app.title:
+                logger.info("%s %s de '%s' reemplazada por la del servicio combinado", methods, path, service)
+            else:
+                logger.warning("%s %s de '%s' omitida: ya la define '%s'", methods, path, service, owner)
+        yield
+
+app = FastAPI(
+    title="API de Boletas (impresión + certificados)",
+    description="Ticket ESC/POS y certificado de una boleta desde un solo servicio",
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+def route_key(route) -> tuple:
+    # Dos rutas chocan si tienen la misma ruta y algún método en común (los WebSocket no tienen métodos)
+    return route.path, frozenset(getattr(route, "methods", None) or {"WEBSOCKET"})
+
+class BoletaCompleteRequest(BaseModel):
+    printer_config: PrinterConfig
+    certificado: CertificadoRequest
+    cliente: Optional[str] = Field(None, description="Cliente del ticket (por defecto el productor)")
+    destino: Optional[str] = Field(None, description="Destino del ticket (por defecto la procedencia)")
+    copias: int = Field(default=1, ge=1, le=100, description="Copias del ticket (1-100)")
+    logo: Optional[str] = Field(None, description="Logo del ticket en base64 (opcional)")
+    codigo_boleta: Optional[BoletaCodeOptions] = Field(None, description="Código de barras o QR en el ticket (opcional)")
+    idempotency_key: Optional[str] = Field(None, description="Clave de idempotencia del ticket (opcional)")
+    certificado_salida: Literal["pdf", "thermal", "none"] = Field(
+        default="pdf", description="pdf: se devuelve en base64; thermal: se imprime; none: solo el ticket")
+    pdf_profile: Optional[str] = Field(None, description="Perfil del PDF (print, screen, archive)")
+    certificado_printer_config: Optional[PrinterConfig] = Field(
+        None, description="Impresora del certificado térmico (por defecto la del ticket)")
+    copias_certificado: int = Field(default=1, ge=1, le=100, description="Copias del certificado térmico")
+
+def ticket_request(request: BoletaCompleteRequest) -> TicketPrintRequest:
+    """
+    Ticket a partir de los datos ya validados del certificado (sin volver a validarlos)
+    """
+    certificado = request.certificado
+    return TicketPrintRequest.model_construct(
+        printer_config=request.printer_config,
+        producto=certificado.producto,
+        fecha=certificado.fecha,
+        boleta=certificado.boleta_no,
+        cliente=request.cliente or certificado.productor,
+        destino=request.destino or certificado.procedencia,
+        placas=certificado.placas,
+        vehiculo=certificado.vehiculo,
+        chofer=certificado.chofer,
+        copias=request.copias,
+        logo=request.logo,
+        codigo_boleta=request.codigo_boleta,
+        idempotency_key=request.idempotency_key
+    )
+
+async def render_certificate_pdf(certificado: CertificadoRequest, profile_name: Optional[str]) -> dict:
+    """
+    Genera el PDF en memoria con el mismo control de admisión que /generate-certificate
+    """
+    profile = certificados.resolve_pdf_profile(profile_name)
+    buffer = io.BytesIO()
+    render_start = time.perf_counter()
+    async with certificados.render_admission.slot():
+        await certificados.render_pdf(certificado, buffer, profile)
+    pdf_data = buffer.getvalue()
+    logger.info("Certificado %s: %d bytes, %.1f ms", certificado.boleta_no, len(pdf_data),
+                (time.perf_counter() - render_start) * 1000)
+    fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return {
+        "success": True,
+        "message": "Certificado generado",
+        "filename": f"Boleta_Entrada_{certificado.boleta_no}-{fecha_actual}.pdf",
+        "profile": profile.name,
+        "bytes": len(pdf_data),
+        "pdf_base64": base64.b64encode(pdf_data).decode("ascii"),
+    }
+
+def part_result(result) -> dict:
+    """
+    Resultado de una de las dos partes: la respuesta o el error (sin cancelar la otra)
+    """
+    if isinstance(result, HTTPException):
+        return {"success": False, "status_code": result.status_code, "message": str(result.detail)}
+    if isinstance(result, Exception):
+        # El detalle (con traceback) queda en el log; al cliente no se le expone el error interno
+        logger.exception("Error en /api/boleta/complete", exc_info=result)
+        return {"success": False, "status_code": 500, "message": "Error interno al procesar esta parte de la boleta"}
+    if isinstance(result, BaseModel):
+        return result.model_dump()
+    return result
+
+@app.post("/api/boleta/complete")
+async def complete_boleta(request: BoletaCompleteRequest, response: Response,
+                          idempotency_key: Optional[str] = Header(None)):
+    """
+    Cierra una boleta con una sola solicitud: valida los datos una vez, imprime el ticket
+    y genera (o imprime) el certificado al mismo tiempo, y devuelve ambos resultados.
+    Si falla solo una parte la otra se completa igual; la respuesta es 500 solo si fallan ambas.
+    """
+    num_tipos = len(request.certificado.analisis or [])
+    if num_tipos > 14:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Se permiten máximo 14 tipos de análisis. Se recibieron: {num_tipos}"
+        )
+    if request.certificado_salida == "pdf":
+        # Perfil inválido: error inmediato, antes de imprimir nada
+        certificados.resolve_pdf_profile(request.pdf_profile)
+
+    jobs = [impresion.submit_print_job(ticket_request(request), idempotency_key)]
+    if request.certificado_salida == "pdf":
+        jobs.append(render_certificate_pdf(request.certificado, request.pdf_profile))
+    elif request.certificado_salida == "thermal":
+        jobs.append(certificados.print_thermal_certificate(ThermalCertificateRequest.model_construct(
+            printer_config=request.certificado_printer_config or request.printer_config,
+            certificado=request.certificado,
+            copias=request.copias_certificado
+        )))
+
+    results = [part_result(result) for result in await asyncio.gather(*jobs, return_exceptions=True)]
+    ticket = results[0]
+    certificado = results[1] if len(results) > 1 else None
+    success = all(result["success"] for result in results)
+    if not any(result["success"] for result in results):
+        response.status_code = 500
+    return {
+        "success": success,
+        "message": "Boleta completada" if success else "Boleta completada con errores",
+        "boleta": request.certificado.boleta_no,
+        "ticket": ticket,
+        "certificado": certificado,
+        "timestamp": datetime.now().isoformat(),
+    }
+
+@app.get("/")
+async def root():
+    return {
+        "message": "API de Boletas (impresión + certificados)",
+        "version": "1.0.0",
+        "endpoints": {
+            "complete": "/api/boleta/complete",
+            "print_ticket": "/api/printer/print-ticket",
+            "events": "/api/printer/events",
+            "certificate": "/generate-certificate",
+            "certificate_thermal": "/generate-certificate/thermal",
+            "ready": "/ready",
+            "metrics": "/metrics",
+            "docs": "/docs"
+        }
+    }
+
+@app.get("/health")
+async def health_check():
+    return {"status": "ok", "services": ["printer", "certificates"], "timestamp": datetime.now().isoformat()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Métricas Prometheus de ambos servicios: impresión y control de admisión de certificados"""
+    return PlainTextResponse(impresion.metrics.render() + certificados.render_admission.render(),
+                             media_type="text/plain; version=0.0.4")
+
+def merge_services(*services: FastAPI):
+    """
+    Copia las rutas y los middleware de cada servicio en esta app. Se copian en lugar de
+    usar include_router o mount, que encadenarían los lifespan de cada servicio (aquí se
+    arrancan una sola vez desde lifespan()) o cambiarían sus rutas.
+    - Las rutas de este módulo (/, /health y /metrics, que cubren el servicio combinado) tienen
+      prioridad; ante cualquier otra coincidencia gana el primer servicio. Las omitidas
+      quedan en route_collisions y se registran al arrancar.
+    - Los middleware (p. ej. trace_requests de la API de impresión) envuelven toda la app
+      combinada, así que también trazan las rutas del servicio de certificados.
+    """
+    owners = {}
+    for route in app.router.routes:
+        if isinstance(route, (APIRoute, APIWebSocketRoute)):
+            owners[route_key(route)] = app.title
+    for service in services:
+        for route in service.router.routes:
+            if not isinstance(route, (APIRoute, APIWebSocketRoute)):
+                continue
+            path, methods = route_key(route)
+            owner = next((owners[(p, m)] for p, m in owners if p == path and m & methods), None)
+            if owner is not None:
+                route_collisions.append((path, ",".join(sorted(methods)), service.title, owner))
+                continue
+            owners[(path, methods)] = service.title
+            app.router.routes.append(route)
+        for middleware in service.user_middleware:
+            if all(tuple(middleware) != tuple(existing) for existing in app.user_middleware):
+                app.user_middleware.append(middleware)
+
+merge_services(impresion.app, certificados.app)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8003, log_config=None)
@@ -1,22 +1,118 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from __future__ import annotations
+
+import time
+
+PROCESS_START = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Query, Header
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
 import os
 import tempfile
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import Table, TableStyle
+import logging
+import hashlib
+import importlib
+import math
+import textwrap
+import io
+import json
+import threading
+from collections import OrderedDict, deque
+from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.lib.styles import ParagraphStyle
-from reportlab.platypus import Paragraph
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from reportlab.lib.utils import ImageReader
+from reportlab.lib.styles import ParagraphStyle
 import asyncio
 from datetime import datetime
-
-app = FastAPI(title="Generador de PDF de Certificados", version="1.0.0")
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Avisos de dependencias opcionales ausentes: se registran en el arranque (lifespan),
+# cuando el logging ya está configurado
+startup_warnings: List[str] = []
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+    startup_warnings.append("Pillow no disponible - las imágenes se incrustan sin redimensionar")
+
+try:
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+    startup_warnings.append("pypdfium2 no disponible - las vistas previas (/generate-certificate/preview) están deshabilitadas")
+
+try:
+    from scripts.convert_logo_escpos import pack_raster
+    RASTER_AVAILABLE = True
+except ImportError:
+    RASTER_AVAILABLE = False
+
+# Versión térmica del certificado: modelos y codificadores compartidos con la API de impresión.
+# El envío (main_updated: registro de impresoras, colas, ReportLab para códigos) se carga
+# al primer certificado térmico, ver printer_api()
+from escpos_common import ESCPOSCommands, PrinterConfig, PrintResponse, get_code_page_encoder
+
+try:
+    from scripts.structured_logging import configure_logging
+except ImportError:
+    configure_logging = None
+    logging.basicConfig(level=logging.INFO)
+    logger.warning("scripts/structured_logging.py no disponible - logging síncrono en texto")
+
+# pdfgen y platypus son la parte pesada de ReportLab: se importan en el warm-up
+# (o en el primer certificado) y no al cargar el módulo, para que /health responda de inmediato
+canvas = None
+Table = TableStyle = Paragraph = None
+
+_reportlab_lock = threading.Lock()
+
+def load_reportlab():
+    # Se llama desde hilos (warm-up y renders): canvas se asigna al final, cuando ya está todo
+    global canvas, Table, TableStyle, Paragraph
+    if canvas is not None:
+        return
+    with _reportlab_lock:
+        if canvas is not None:
+            return
+        from reportlab.platypus import Table, TableStyle, Paragraph
+        from reportlab import rl_config
+        # Streams binarios: ASCII85 (activo por defecto) infla imágenes y páginas un 25%
+        rl_config.useA85 = 0
+        from reportlab.pdfgen import canvas
+
+# Estado del arranque: /ready responde 200 solo cuando el warm-up terminó
+startup_state = {
+    "ready": False,
+    "error": None,
+    "import_s": None,
+    "warmup_s": None,
+    "first_certificate_ms": None,
+    "time_to_first_certificate_s": None,
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_state["import_s"] = round(time.perf_counter() - PROCESS_START, 3)
+    # Logging no bloqueante (el de main_updated se carga solo con el primer certificado térmico)
+    if configure_logging is not None:
+        configure_logging()
+    for message in startup_warnings:
+        logger.warning(message)
+    # En segundo plano: el servidor acepta conexiones (y /health) mientras se calienta
+    warmup_task = asyncio.create_task(warm_up())
+    yield
+    if _printer_api is not None:
+        _printer_api.printer_registry.stop()
+    warmup_task.cancel()
+
+app = FastAPI(title="Generador de PDF de Certificados", version="1.0.0", lifespan=lifespan)
 
 class Cabezera1(BaseModel):
     boleta_no: str
@@ -79,23 +175,234 @@ texto_hoja_2 = ["CONTABILIDAD","ARCHIVO"]
 # texto_hoja_1 = ["CLIENTE","CHOFER"]
 # texto_hoja_2 = ["CONTABILIDAD","ARCHIVO"]
 
+# Estilos de párrafo compartidos por todas las hojas (se crean una sola vez)
+
+info_style = ParagraphStyle(
+    name="Info",
+    alignment=TA_LEFT,
+    leading=10,
+    leftIndent=0,
+    rightIndent=0,
+    textColor=(0,0,0),
+    fontName="Helvetica",
+    fontSize=9
+)
+
+main_value_style = ParagraphStyle(
+    name='MainValue',
+    alignment=TA_CENTER,
+    fontSize=9,
+    fontName='Helvetica-Bold',
+    leading=6,
+    spaceAfter=1
+)
+
+subtext_style = ParagraphStyle(
+    name='Subtext',
+    alignment=TA_CENTER,
+    fontSize=6,
+    fontName='Helvetica',
+    leading=10
+)
+
+observaciones_style = ParagraphStyle(
+    name='Observaciones',
+    alignment=TA_LEFT,
+    fontSize=8,
+    fontName='Helvetica',
+    leading=10,
+    leftIndent=0,
+    rightIndent=0
+)
+
+# Estilos de tabla por color: TableStyle vive en platypus (carga diferida),
+# así que se construyen en el primer uso y se reutilizan en todos los certificados
+
+@lru_cache(maxsize=None)
+def analisis_table_style(color) -> TableStyle:
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), color),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 7),
+        ('GRID', (0, 0), (-1, -1), 1, color),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ])
+
+@lru_cache(maxsize=None)
+def pesos_table_style(color) -> TableStyle:
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (0, 0), color),
+        ('BACKGROUND', (0, 2), (0, 2), color),
+        ('BACKGROUND', (0, 4), (0, 4), color),
+        ('TEXTCOLOR', (0, 0), (0, 0), colors.whitesmoke),
+        ('TEXTCOLOR', (0, 2), (0, 2), colors.whitesmoke),
+        ('TEXTCOLOR', (0, 4), (0, 4), colors.whitesmoke),
+        ('BACKGROUND', (0, 1), (0, 1), colors.white),
+        ('BACKGROUND', (0, 3), (0, 3), colors.white),
+        ('BACKGROUND', (0, 5), (0, 5), colors.white),
+        ('ALIGN', (0, 1), (0, 1), 'CENTER'),
+        ('ALIGN', (0, 3), (0, 3), 'CENTER'),
+        ('ALIGN', (0, 5), (0, 5), 'CENTER'),
+        ('VALIGN', (0, 1), (0, 1), 'MIDDLE'),
+        ('VALIGN', (0, 3), (0, 3), 'MIDDLE'),
+        ('VALIGN', (0, 5), (0, 5), 'MIDDLE'),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 1, color),
+    ])
+
+@lru_cache(maxsize=None)
+def deduction_table_style(color) -> TableStyle:
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (0, 0), color),
+        ('BACKGROUND', (0, 2), (0, 2), color),
+        ('TEXTCOLOR', (0, 0), (0, 0), colors.whitesmoke),
+        ('TEXTCOLOR', (0, 2), (0, 2), colors.whitesmoke),
+        ('BACKGROUND', (0, 1), (0, 1), colors.white),
+        ('BACKGROUND', (0, 3), (0, 3), colors.white),
+        ('ALIGN', (0, 1), (0, 1), 'CENTER'),
+        ('ALIGN', (0, 3), (0, 3), 'CENTER'),
+        ('VALIGN', (0, 1), (0, 1), 'MIDDLE'),
+        ('VALIGN', (0, 3), (0, 3), 'MIDDLE'),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 1, color),
+    ])
+
+class LayoutCache:
+    """
+    Caché de maquetación de un render: cada párrafo o celda se construye (y se
+    envuelve con wrap) una sola vez por contenido y estilo, y el mismo flowable
+    se dibuja en todas sus colocaciones (mitad superior e inferior de ambas hojas)
+    """
+    def __init__(self, c: canvas.Canvas):
+        self.canv = c
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def memo(self, key, build):
+        if key in self._entries:
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        value = self._entries[key] = build()
+        return value
+
+    def wrapped(self, key, build, avail_width: float, avail_height: float):
+        """Devuelve (flowable, ancho, alto) con el wrap ya calculado"""
+        def build_and_wrap():
+            flowable = build()
+            width, height = flowable.wrapOn(self.canv, avail_width, avail_height)
+            return flowable, width, height
+        return self.memo(("wrap", key, avail_width, avail_height), build_and_wrap)
+
+    def paragraph(self, text: str, style: ParagraphStyle, avail_width: float, avail_height: float):
+        return self.wrapped(("paragraph", text, style.name), lambda: Paragraph(text, style), avail_width, avail_height)
+
+LOGO_PATH = os.environ.get("CERT_LOGO_PATH", "C:/API/pdf-entradas/imagenes/logo.png")
+
+class PdfOutputProfile:
+    """
+    Perfil de salida del PDF: compresión de páginas y tratamiento de imágenes.
+    image_dpi=None incrusta la imagen original; con un valor, la imagen se reduce
+    a la resolución del tamaño al que se dibuja (nunca se amplía).
+    jpeg_quality recomprime como JPEG las imágenes que se dibujan sin transparencia.
+    """
+    def __init__(self, name: str, page_compression: bool = True,
+                 image_dpi: Optional[int] = None, jpeg_quality: Optional[int] = None):
+        self.name = name
+        self.page_compression = page_compression
+        self.image_dpi = image_dpi
+        self.jpeg_quality = jpeg_quality
+
+PDF_PROFILES = {
+    # Impresión láser/inyección: 300 dpi sin pérdida
+    "print": PdfOutputProfile("print", image_dpi=300),
+    # Envío por correo/visualización: 150 dpi y JPEG donde no hay transparencia
+    "screen": PdfOutputProfile("screen", image_dpi=150, jpeg_quality=75),
+    # Archivo: imágenes originales sin recomprimir
+    "archive": PdfOutputProfile("archive"),
+}
+DEFAULT_PDF_PROFILE = os.environ.get("CERT_PDF_PROFILE", "print")
+IMAGE_CACHE_DIR = os.environ.get("CERT_IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "cert_images"))
+
+def resolve_pdf_profile(name: Optional[str]) -> PdfOutputProfile:
+    """Obtiene el perfil de salida por nombre (None = perfil por defecto)"""
+    profile = PDF_PROFILES.get(name or DEFAULT_PDF_PROFILE)
+    if profile is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Perfil de PDF desconocido: {name}. Disponibles: {', '.join(PDF_PROFILES)}"
+        )
+    return profile
+
+# (ruta, mtime, tamaño, perfil, ancho, alto, transparencia) -> ruta de la imagen preparada
+_prepared_images = {}
+
+def prepare_image(path: str, width: float, height: float, profile: PdfOutputProfile, keep_alpha: bool) -> str:
+    """
+    Devuelve la ruta de la imagen a incrustar para un tamaño dibujado (en puntos).
+    La versión reducida se guarda en disco y se reutiliza entre certificados; como
+    ReportLab identifica las imágenes por ruta, cada colocación del mismo archivo
+    en el documento comparte un único XObject.
+    """
+    if profile.image_dpi is None or not PIL_AVAILABLE:
+        return path
+
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size, profile.name, width, height, keep_alpha)
+    prepared = _prepared_images.get(key)
+    if prepared and os.path.exists(prepared):
+        return prepared
+
+    with Image.open(path) as img:
+        target = (math.ceil(width / 72 * profile.image_dpi), math.ceil(height / 72 * profile.image_dpi))
+        has_alpha = img.mode in ("RGBA", "LA", "P")
+        use_jpeg = profile.jpeg_quality is not None and not (keep_alpha and has_alpha)
+        if target[0] >= img.width and target[1] >= img.height and not use_jpeg:
+            _prepared_images[key] = path
+            return path
+
+        img.load()
+        if target[0] < img.width or target[1] < img.height:
+            img = img.resize(target, Image.LANCZOS)
+
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        prepared = os.path.join(IMAGE_CACHE_DIR, f"{digest}.{'jpg' if use_jpeg else 'png'}")
+        tmp_path = prepared + f".{os.getpid()}.{threading.get_ident()}.tmp"
+        if use_jpeg:
+            # Sin máscara ReportLab ignora el canal alfa: se descarta igual que en el original
+            img.convert("RGB").save(tmp_path, "JPEG", quality=profile.jpeg_quality, optimize=True)
+        else:
+            img.save(tmp_path, "PNG", optimize=True)
+        os.replace(tmp_path, prepared)
+
+    _prepared_images[key] = prepared
+    return prepared
+
 # Funciones del código original (copiadas tal como están)
 
-async def draw_logo(c: canvas.Canvas, logo_color: int):
-    logo_path = "C:/API/pdf-entradas/imagenes/logo.png" #if logo_color == 1 else "C:/API/pdf-entradas/imagenes/logo_gray.png"
+def draw_logo(c: canvas.Canvas, logo_color: int, profile: PdfOutputProfile = PDF_PROFILES["archive"]):
     # logo_path_second = "C:/API/pdf-entradas/imagenes/logo_gray.png"
     logo_width = 78
     logo_height = 60
+    logo_path = prepare_image(LOGO_PATH, logo_width, logo_height, profile, keep_alpha=False) #if logo_color == 1 else "C:/API/pdf-entradas/imagenes/logo_gray.png"
 
     # Dibujar logo en la parte superior e inferior   
     c.drawImage(logo_path, 25, letter[1] - 80, width=logo_width, height=logo_height)
     c.drawImage(logo_path, 25, (letter[1] / 2) - 80, width=logo_width, height=logo_height)
 
-async def draw_background(c: canvas.Canvas, logo_color: int):
-    background_path = "C:/API/pdf-entradas/imagenes/logo.png" #if logo_color == 1 else "C:/API/pdf-entradas/imagenes/logo_gray.png"
+def draw_background(c: canvas.Canvas, logo_color: int, profile: PdfOutputProfile = PDF_PROFILES["archive"]):
     # background_path_second = "C:/API/pdf-entradas/imagenes/logo_gray.png" 
     background_width = 240
     background_height = 200
+    background_path = prepare_image(LOGO_PATH, background_width, background_height, profile, keep_alpha=True) #if logo_color == 1 else "C:/API/pdf-entradas/imagenes/logo_gray.png"
 
     # Dibujar fondo en la parte superior e inferior
     c.setFillAlpha(0.1)
@@ -105,7 +412,7 @@ async def draw_background(c: canvas.Canvas, logo_color: int):
     c.setFillColorRGB(0, 0, 0)
     c.setFillAlpha(1)
 
-async def draw_infoCompany(c: canvas.Canvas, data: Cabezera1, page_color: int):
+def draw_infoCompany(c: canvas.Canvas, data: Cabezera1, page_color: int):
     w, h = letter
     # Parte superior
 
@@ -220,41 +527,22 @@ async def draw_infoCompany(c: canvas.Canvas, data: Cabezera1, page_color: int):
     c.setFont("Helvetica", 9)
     c.drawString((w / 2) + 205, (h / 2) - 380, data.lote)
 
-async def draw_infoShipment(c: canvas.Canvas, data: Cabezera2, page_color: int):
+def draw_infoShipment(c: canvas.Canvas, data: Cabezera2, page_color: int, layout: Optional[LayoutCache] = None):
     w, h = letter
     color = rojo_color if page_color == 1 else (0,0,0)
+    layout = layout or LayoutCache(c)
     # Parte superior
 
     # Estilo para las info data
 
-    info_style_top = ParagraphStyle(
-        name="",
-        alignment=TA_LEFT,
-        leading=10,
-        leftIndent=0,
-        rightIndent=0,
-        textColor=(0,0,0),
-        fontName="Helvetica",
-        fontSize=9
-    )
-
-    info_style_bottom = ParagraphStyle(
-        name="",
-        alignment=TA_LEFT,
-        leading=10,
-        leftIndent=0,
-        rightIndent=0,
-        textColor=(0,0,0),
-        fontName="Helvetica",
-        fontSize=9
-    )
+    info_style_top = info_style
+    info_style_bottom = info_style
 
     def drawInfoStringTop(x: float, text : str, style : any):
-        obs_paragraph_top = Paragraph(text, style)
         obs_width = 130
         obs_max_height = 1  # Altura máxima disponible
         
-        w_para, h_para = obs_paragraph_top.wrap(obs_width, obs_max_height)
+        obs_paragraph_top, w_para, h_para = layout.paragraph(text, style, obs_width, obs_max_height)
 
         y_param_top = h - 102
         if(h_para != info_style_top.leading):
@@ -263,11 +551,10 @@ async def draw_infoShipment(c: canvas.Canvas, data: Cabezera2, page_color: int):
         return obs_paragraph_top.drawOn(c, x, y_param_top)
     
     def drawInfoStringBottom(x: float, text : str, style : any):
-        obs_paragraph_top = Paragraph(text, style)
         obs_width = 130
         obs_max_height = 1  # Altura máxima disponible
         
-        w_para, h_para = obs_paragraph_top.wrap(obs_width, obs_max_height)
+        obs_paragraph_top, w_para, h_para = layout.paragraph(text, style, obs_width, obs_max_height)
 
         y_param_top = (h / 2) - 102
         if(h_para != info_style_top.leading):
@@ -361,23 +648,36 @@ async def draw_infoShipment(c: canvas.Canvas, data: Cabezera2, page_color: int):
     c.drawString((w / 2) - 250, (h / 2) - 370, "ENTRADAS")
     c.setFillAlpha(1)
 
-async def draw_analisisTable(c: canvas.Canvas, data: CertificadoRequest, page_color: int):
+def build_analisis_rows(analisis_items: List[AnalisisItem]):
+    """Filas de la tabla de análisis y comandos para marcar en gris las filas sin datos"""
+    analisis_data = [['ANALISIS', '%', 'CASTIGOS (KG)']]
+    for item in analisis_items:
+        tipo = (item.tipo or "").upper()
+        porcentaje = f"{item.porcentaje}" if item.porcentaje is not None else "-"
+        castigo = f"{item.castigo}" if item.castigo is not None else "-"
+        analisis_data.append([tipo, porcentaje, castigo])
+
+    empty_rows = [
+        ('BACKGROUND', (0, i), (-1, i), colors.lightgrey)
+        for i in range(1, len(analisis_data))
+        if analisis_data[i][1] == "-" and analisis_data[i][2] == "-"
+    ]
+    return analisis_data, empty_rows
+
+def draw_analisisTable(c: canvas.Canvas, data: CertificadoRequest, page_color: int, layout: Optional[LayoutCache] = None):
     w, h = letter
     color_top = rojo_color if page_color == 1 else azul_color
     color_bottom = verde_color if page_color == 1 else rosa_color
+    layout = layout or LayoutCache(c)
 
     # Obtener lista de análisis
 
     analisis_items = data.analisis or []
 
-    # Construir filas de la tabla
+    # Construir filas de la tabla (una vez por render)
 
-    analisis_data = [['ANALISIS', '%', 'CASTIGOS (KG)']]
-    for item in analisis_items:
-        tipo = (item.tipo or "").upper()
-        porcentaje = f"{item.porcentaje}" if item.porcentaje is not None else "-"
-        castigo = f"{item.castigo}" if item.castigo is not None else "-"
-        analisis_data.append([tipo, porcentaje, castigo])
+    rows_key = repr(analisis_items)
+    analisis_data, empty_rows = layout.memo(("analisis_rows", rows_key), lambda: build_analisis_rows(analisis_items))
 
     # Calcular posición Y según número de items
 
@@ -392,79 +692,37 @@ async def draw_analisisTable(c: canvas.Canvas, data: CertificadoRequest, page_co
 
     # TABLA SUPERIOR (color principal)
 
-    analisis_table_top = Table(analisis_data, colWidths=[90, 50, 70], rowHeights=13)
-    
-    table_style_top = [
-        ('BACKGROUND', (0, 0), (-1, 0), color_top),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 7),
-        ('GRID', (0, 0), (-1, -1), 1, color_top),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]
-
-    # Marcar filas sin datos en gris claro
-
-    for i in range(1, len(analisis_data)):
-        if analisis_data[i][1] == "-" and analisis_data[i][2] == "-":
-            table_style_top.append(('BACKGROUND', (0, i), (-1, i), colors.lightgrey))
+    def build_table(color):
+        analisis_table = Table(analisis_data, colWidths=[90, 50, 70], rowHeights=13)
+        analisis_table.setStyle(analisis_table_style(color))
+        # Marcar filas sin datos en gris claro
+        if empty_rows:
+            analisis_table.setStyle(empty_rows)
+        return analisis_table
 
-    analisis_table_top.setStyle(TableStyle(table_style_top))
-    analisis_table_top.wrapOn(c, w, h)
+    analisis_table_top, _, _ = layout.wrapped(("analisis", rows_key, color_top), lambda: build_table(color_top), w, h)
     analisis_table_top.drawOn(c, 30, y_pos_top)
 
-    # TABLA INFERIOR (color secundario) - CREAR NUEVA TABLA
-
-    analisis_table_bottom = Table(analisis_data, colWidths=[90, 50, 70], rowHeights=13)
-    
-    table_style_bottom = [
-        ('BACKGROUND', (0, 0), (-1, 0), color_bottom),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 7),
-        ('GRID', (0, 0), (-1, -1), 1, color_bottom),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]
-
-    for i in range(1, len(analisis_data)):
-        if analisis_data[i][1] == "-" and analisis_data[i][2] == "-":
-            table_style_bottom.append(('BACKGROUND', (0, i), (-1, i), colors.lightgrey))
+    # TABLA INFERIOR (color secundario)
 
-    analisis_table_bottom.setStyle(TableStyle(table_style_bottom))
-    analisis_table_bottom.wrapOn(c, w, h)
+    analisis_table_bottom, _, _ = layout.wrapped(("analisis", rows_key, color_bottom), lambda: build_table(color_bottom), w, h)
     analisis_table_bottom.drawOn(c, 30, y_pos_bottom)
 
-async def draw_pesosTable(c: canvas.Canvas, data: PesosInfo1, page_color: int):
+def draw_pesosTable(c: canvas.Canvas, data: PesosInfo1, page_color: int, layout: Optional[LayoutCache] = None):
     w, h = letter
     color_top = rojo_color if page_color == 1 else azul_color
     color_bottom = verde_color if page_color == 1 else rosa_color
     header_height = 17
     value_height = 27
-
-    main_value_style = ParagraphStyle(
-        name='MainValue',
-        alignment=TA_CENTER,
-        fontSize=9,
-        fontName='Helvetica-Bold',
-        leading=6,
-        spaceAfter=1
-    )
-
-    subtext_style = ParagraphStyle(
-        name='Subtext',
-        alignment=TA_CENTER,
-        fontSize=6,
-        fontName='Helvetica',
-        leading=10
-    )
+    layout = layout or LayoutCache(c)
 
     def create_value_cell(main_text, sub_text):
-        main_para = Paragraph(f"{main_text}", main_value_style)
-        sub_para = Paragraph(sub_text, subtext_style)
-        inner_table = Table([[main_para], [sub_para]], colWidths=[120])
-        return inner_table
+        def build():
+            main_para = Paragraph(f"{main_text}", main_value_style)
+            sub_para = Paragraph(sub_text, subtext_style)
+            return Table([[main_para], [sub_para]], colWidths=[120])
+        # La misma celda se comparte entre la tabla superior, la inferior y ambas hojas
+        return layout.memo(("pesos_cell", main_text, sub_text), build)
 
     # Preparar datos de la tabla
 
@@ -485,95 +743,32 @@ async def draw_pesosTable(c: canvas.Canvas, data: PesosInfo1, page_color: int):
 
     # TABLA SUPERIOR (color principal)
 
-    pesos_table_top = Table(pesos_data, colWidths=[120], rowHeights=row_heights)
+    def build_table(color):
+        pesos_table = Table(pesos_data, colWidths=[120], rowHeights=row_heights)
+        pesos_table.setStyle(pesos_table_style(color))
+        return pesos_table
 
-    table_style_top = [
-        ('BACKGROUND', (0, 0), (0, 0), color_top),
-        ('BACKGROUND', (0, 2), (0, 2), color_top),
-        ('BACKGROUND', (0, 4), (0, 4), color_top),
-        ('TEXTCOLOR', (0, 0), (0, 0), colors.whitesmoke),
-        ('TEXTCOLOR', (0, 2), (0, 2), colors.whitesmoke),
-        ('TEXTCOLOR', (0, 4), (0, 4), colors.whitesmoke),
-        ('BACKGROUND', (0, 1), (0, 1), colors.white),
-        ('BACKGROUND', (0, 3), (0, 3), colors.white),
-        ('BACKGROUND', (0, 5), (0, 5), colors.white),
-        ('ALIGN', (0, 1), (0, 1), 'CENTER'),
-        ('ALIGN', (0, 3), (0, 3), 'CENTER'),
-        ('ALIGN', (0, 5), (0, 5), 'CENTER'),
-        ('VALIGN', (0, 1), (0, 1), 'MIDDLE'),
-        ('VALIGN', (0, 3), (0, 3), 'MIDDLE'),
-        ('VALIGN', (0, 5), (0, 5), 'MIDDLE'),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, color_top),
-    ]
-
-    pesos_table_top.setStyle(TableStyle(table_style_top))
-    pesos_table_top.wrapOn(c, w, h)
+    pesos_table_top, _, _ = layout.wrapped(("pesos", repr(data), color_top), lambda: build_table(color_top), w, h)
     pesos_table_top.drawOn(c, (w / 2) - 20, h - 280)
 
-    # TABLA INFERIOR (color secundario) - CREAR NUEVA TABLA
-
-    # Recrear las celdas para evitar problemas de reutilización
+    # TABLA INFERIOR (color secundario)
 
-    pesos_data_bottom = [
-        ["PESO BRUTO (KG)"],
-        [create_value_cell(f"{data.peso_bruto:,.3f}", data.fechabruto + " " + data.horabruto)],
-        ["PESO TARA (KG)"],
-        [create_value_cell(f"{data.peso_tara:,.3f}", data.fechatara + " " + data.horatara)],
-        ["PESO NETO (KG)"],
-        [create_value_cell(f"{data.peso_neto:,.3f}", data.fechaneto)]
-    ]
-    
-    pesos_table_bottom = Table(pesos_data_bottom, colWidths=[120], rowHeights=row_heights)
-    
-    table_style_bottom = [
-        ('BACKGROUND', (0, 0), (0, 0), color_bottom),
-        ('BACKGROUND', (0, 2), (0, 2), color_bottom),
-        ('BACKGROUND', (0, 4), (0, 4), color_bottom),
-        ('TEXTCOLOR', (0, 0), (0, 0), colors.whitesmoke),
-        ('TEXTCOLOR', (0, 2), (0, 2), colors.whitesmoke),
-        ('TEXTCOLOR', (0, 4), (0, 4), colors.whitesmoke),
-        ('BACKGROUND', (0, 1), (0, 1), colors.white),
-        ('BACKGROUND', (0, 3), (0, 3), colors.white),
-        ('BACKGROUND', (0, 5), (0, 5), colors.white),
-        ('ALIGN', (0, 1), (0, 1), 'CENTER'),
-        ('ALIGN', (0, 3), (0, 3), 'CENTER'),
-        ('ALIGN', (0, 5), (0, 5), 'CENTER'),
-        ('VALIGN', (0, 1), (0, 1), 'MIDDLE'),
-        ('VALIGN', (0, 3), (0, 3), 'MIDDLE'),
-        ('VALIGN', (0, 5), (0, 5), 'MIDDLE'),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, color_bottom),
-    ]
-    
-    pesos_table_bottom.setStyle(TableStyle(table_style_bottom))
-    pesos_table_bottom.wrapOn(c, w, h)
+    pesos_table_bottom, _, _ = layout.wrapped(("pesos", repr(data), color_bottom), lambda: build_table(color_bottom), w, h)
     pesos_table_bottom.drawOn(c, (w / 2) - 20, (h / 2) - 280)
 
-async def draw_deductionTable(c: canvas.Canvas, data: PesosInfo2, page_color: int):
+def draw_deductionTable(c: canvas.Canvas, data: PesosInfo2, page_color: int, layout: Optional[LayoutCache] = None):
     w, h = letter
     color_top = rojo_color if page_color == 1 else azul_color
     color_bottom = verde_color if page_color == 1 else rosa_color
     header_height = 17
     value_height = 20
-
-    main_value_style = ParagraphStyle(
-        name='MainValue',
-        alignment=TA_CENTER,
-        fontSize=9,
-        fontName='Helvetica-Bold',
-        leading=6,
-        spaceAfter=1
-    )
+    layout = layout or LayoutCache(c)
 
     def create_value_cell(main_text):
-        main_para = Paragraph(f"{main_text}", main_value_style)
-        inner_table = Table([[main_para]], colWidths=[130])
-        return inner_table
+        def build():
+            main_para = Paragraph(f"{main_text}", main_value_style)
+            return Table([[main_para]], colWidths=[130])
+        return layout.memo(("deduction_cell", main_text), build)
 
     pesos_data = [
         ["DEDUCCIÓN (KG)"],
@@ -587,74 +782,25 @@ async def draw_deductionTable(c: canvas.Canvas, data: PesosInfo2, page_color: in
         header_height, value_height
     ]
 
-    pesos_table_top = Table(pesos_data, colWidths=[130], rowHeights=row_heights)
-
-    table_style_top = [
-        ('BACKGROUND', (0, 0), (0, 0), color_top),
-        ('BACKGROUND', (0, 2), (0, 2), color_top),
-        ('TEXTCOLOR', (0, 0), (0, 0), colors.whitesmoke),
-        ('TEXTCOLOR', (0, 2), (0, 2), colors.whitesmoke),
-        ('BACKGROUND', (0, 1), (0, 1), colors.white),
-        ('BACKGROUND', (0, 3), (0, 3), colors.white),
-        ('ALIGN', (0, 1), (0, 1), 'CENTER'),
-        ('ALIGN', (0, 3), (0, 3), 'CENTER'),
-        ('VALIGN', (0, 1), (0, 1), 'MIDDLE'),
-        ('VALIGN', (0, 3), (0, 3), 'MIDDLE'),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, color_top),
-    ]
+    def build_table(color):
+        pesos_table = Table(pesos_data, colWidths=[130], rowHeights=row_heights)
+        pesos_table.setStyle(deduction_table_style(color))
+        return pesos_table
 
-    pesos_table_top.setStyle(TableStyle(table_style_top))
-    pesos_table_top.wrapOn(c, w, h)
+    pesos_table_top, _, _ = layout.wrapped(("deduction", repr(data), color_top), lambda: build_table(color_top), w, h)
     pesos_table_top.drawOn(c, (w - 180), h - 250)
 
     # Parte inferior
 
-    pesos_data_second = [
-        ["DEDUCCIÓN (KG)"],
-        [create_value_cell(f"{data.deduccion:,.3f}")],
-        ["PESO NETO ANALIZADO (KG)"],
-        [create_value_cell(f"{data.peso_neto_analizado:,.3f}")]
-    ]
-    pesos_table_second = Table(pesos_data_second, colWidths=[130], rowHeights=row_heights)
-    table_style_second = [
-        ('BACKGROUND', (0, 0), (0, 0), color_bottom),
-        ('BACKGROUND', (0, 2), (0, 2), color_bottom),
-        ('TEXTCOLOR', (0, 0), (0, 0), colors.whitesmoke),
-        ('TEXTCOLOR', (0, 2), (0, 2), colors.whitesmoke),
-        ('BACKGROUND', (0, 1), (0, 1), colors.white),
-        ('BACKGROUND', (0, 3), (0, 3), colors.white),
-        ('ALIGN', (0, 1), (0, 1), 'CENTER'),
-        ('ALIGN', (0, 3), (0, 3), 'CENTER'),
-        ('VALIGN', (0, 1), (0, 1), 'MIDDLE'),
-        ('VALIGN', (0, 3), (0, 3), 'MIDDLE'),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 1, color_bottom),
-    ]
-
-    pesos_table_second.setStyle(TableStyle(table_style_second))
-    pesos_table_second.wrapOn(c, w, h)
+    pesos_table_second, _, _ = layout.wrapped(("deduction", repr(data), color_bottom), lambda: build_table(color_bottom), w, h)
     pesos_table_second.drawOn(c, (w - 180), (h / 2) - 250)
     
 
-async def draw_signs(c: canvas.Canvas, observaciones: str = "", page_num: int = 1):
+def draw_signs(c: canvas.Canvas, observaciones: str = "", page_num: int = 1, layout: Optional[LayoutCache] = None):
     w, h = letter
-    
-    # Estilo para las observaciones
-
-    observaciones_style = ParagraphStyle(
-        name='Observaciones',
-        alignment=TA_LEFT,
-        fontSize=8,
-        fontName='Helvetica',
-        leading=10,
-        leftIndent=0,
-        rightIndent=0
-    )
+    layout = layout or LayoutCache(c)
+    obs_width = 270
+    obs_max_height = 40  # Altura máxima disponible
     
     # PARTE SUPERIOR
 
@@ -677,13 +823,9 @@ async def draw_signs(c: canvas.Canvas, observaciones: str = "", page_num: int =
     # Dibujar observaciones (parte superior)
 
     if observaciones:
-        obs_paragraph_top = Paragraph(observaciones, observaciones_style)
-        obs_width = 270
-        obs_max_height = 40  # Altura máxima disponible
-        
-        # Calcular altura real necesaria
+        # Calcular altura real necesaria (el párrafo se envuelve una sola vez por render)
 
-        w_para, h_para = obs_paragraph_top.wrap(obs_width, obs_max_height)
+        obs_paragraph_top, w_para, h_para = layout.paragraph(observaciones, observaciones_style, obs_width, obs_max_height)
         
         # Posición Y: justo debajo de "Observaciones:" menos la altura real del párrafo
 
@@ -712,11 +854,9 @@ async def draw_signs(c: canvas.Canvas, observaciones: str = "", page_num: int =
     # Dibujar observaciones (parte inferior)
 
     if observaciones:
-        obs_paragraph_bottom = Paragraph(observaciones, observaciones_style)
-        
-        # Calcular altura real necesaria
+        # Mismo párrafo ya envuelto que en la parte superior
 
-        w_para, h_para = obs_paragraph_bottom.wrap(obs_width, obs_max_height)
+        obs_paragraph_bottom, w_para, h_para = layout.paragraph(observaciones, observaciones_style, obs_width, obs_max_height)
         
         # Posición Y: justo debajo de "Observaciones:" menos la altura real del párrafo
 
@@ -747,40 +887,379 @@ async def draw_signs(c: canvas.Canvas, observaciones: str = "", page_num: int =
     c.setFillColor((0,0,0))
     c.restoreState()
 
-async def create_pdf_page(c: canvas.Canvas, data: CertificadoRequest, page_color: int):
+def create_pdf_page(c: canvas.Canvas, data: CertificadoRequest, page_color: int,
+                          profile: PdfOutputProfile = PDF_PROFILES["archive"], layout: Optional[LayoutCache] = None):
     w, h = letter
-    await draw_logo(c, page_color)
-    await draw_background(c, page_color)
-    await draw_infoCompany(c, Cabezera1(boleta_no=data.boleta_no, fecha=data.fecha, lote=data.lote), page_color)
-    await draw_infoShipment(c, Cabezera2(
+    layout = layout or LayoutCache(c)
+    draw_logo(c, page_color, profile)
+    draw_background(c, page_color, profile)
+    draw_infoCompany(c, Cabezera1(boleta_no=data.boleta_no, fecha=data.fecha, lote=data.lote), page_color)
+    draw_infoShipment(c, Cabezera2(
         productor=data.productor,
         producto=data.producto,
         procedencia=data.procedencia,
         vehiculo=data.vehiculo,
         placas=data.placas,
         chofer=data.chofer
-    ), page_color)
-    await draw_analisisTable(c, data, page_color)
-    await draw_pesosTable(c, data.pesos_info1, page_color)
-    await draw_deductionTable(c, data.pesos_info2, page_color)
-    await draw_signs(c, data.observaciones, page_color)  # Pasar observaciones aquí
+    ), page_color, layout)
+    draw_analisisTable(c, data, page_color, layout)
+    draw_pesosTable(c, data.pesos_info1, page_color, layout)
+    draw_deductionTable(c, data.pesos_info2, page_color, layout)
+    draw_signs(c, data.observaciones, page_color, layout)  # Pasar observaciones aquí
 
     c.line(-w, (h / 2), w, (h / 2))
     c.showPage()
 
-async def second_page(data: CertificadoRequest, filename: str):
-    """Función equivalente a second_page del código original"""
-    c = canvas.Canvas(filename, pagesize=letter)
-    await create_pdf_page(c, data, page_color=1)
-    await create_pdf_page(c, data, page_color=2)
+def second_page(data: CertificadoRequest, filename: str, profile: Optional[PdfOutputProfile] = None):
+    """Función equivalente a second_page del código original (síncrona: render_pdf la llama en un hilo)"""
+    load_reportlab()
+    profile = profile or resolve_pdf_profile(None)
+    c = canvas.Canvas(filename, pagesize=letter, pageCompression=1 if profile.page_compression else 0)
+    # Caché de maquetación compartida por las dos hojas de este certificado
+    layout = LayoutCache(c)
+    create_pdf_page(c, data, page_color=1, profile=profile, layout=layout)
+    create_pdf_page(c, data, page_color=2, profile=profile, layout=layout)
     c.save()
 
+# Certificado térmico: columnas por defecto (80 mm, fuente A); al imprimir se usan las del
+# perfil de la impresora (PrinterProfile.columns, 32 en 58 mm)
+THERMAL_COLUMNS = 48
+THERMAL_LOGO_WIDTH = int(os.environ.get("CERT_THERMAL_LOGO_WIDTH", "300"))
+
+@lru_cache(maxsize=1)
+def thermal_logo() -> bytes:
+    """Logo del certificado como raster GS v 0 (se convierte una sola vez por proceso)"""
+    if not RASTER_AVAILABLE or not os.path.exists(LOGO_PATH):
+        logger.warning("Sin logo para el certificado térmico (falta Pillow o CERT_LOGO_PATH)")
+        return b''
+    with Image.open(LOGO_PATH) as img:
+        escpos_data, _, _ = pack_raster(img, THERMAL_LOGO_WIDTH)
+    return escpos_data
+
+def generate_certificate_escpos(data: CertificadoRequest, code_page: str = "cp850",
+                                logo_data: Optional[bytes] = None, columns: int = THERMAL_COLUMNS) -> bytes:
+    """
+    Genera el certificado en formato compacto ESC/POS (texto nativo de la impresora
+    más el logo en raster), sin pasar por el PDF, a 'columns' caracteres por línea
+    """
+    cmd = ESCPOSCommands
+    encoder = get_code_page_encoder(code_page)
+    encode = encoder.encode
+    width = columns
+    separator = encode("-" * width + "\n")
+    ticket = cmd.INIT + encoder.select_command
+
+    if logo_data:
+        ticket += cmd.ALIGN_CENTER + logo_data + cmd.LINE_FEED
+
+    # Encabezado
+    ticket += cmd.ALIGN_CENTER + cmd.BOLD_ON
+    ticket += encode("\n".join(textwrap.wrap("ACEITES Y PROTEINAS, S.A. DE C.V.", width)) + "\n")
+    ticket += encode("CERTIFICADO DE PESO Y CALIDAD\n")
+    ticket += cmd.DOUBLE_HEIGHT + encode(f"BOLETA {data.boleta_no}\n") + cmd.NORMAL_SIZE
+    ticket += cmd.BOLD_OFF
+    ticket += encode(f"Fecha: {data.fecha}   Lote: {data.lote}\n")
+    ticket += cmd.ALIGN_LEFT + separator
+
+    def info_line(label, value):
+        return cmd.BOLD_ON + encode(f"{label:<12}: ") + cmd.BOLD_OFF + encode(f"{value}\n")
+
+    ticket += info_line("PRODUCTOR", data.productor)
+    ticket += info_line("PRODUCTO", data.producto)
+    ticket += info_line("PROCEDENCIA", data.procedencia)
+    ticket += info_line("VEHICULO", data.vehiculo)
+    ticket += info_line("PLACAS", data.placas)
+    ticket += info_line("CHOFER", data.chofer)
+
+    # Análisis: mismas filas que la tabla del PDF
+    analisis_data, _ = build_analisis_rows(data.analisis or [])
+    if len(analisis_data) > 1:
+        ticket += separator
+        porcentaje_width, castigo_width = (10, 14) if width >= 48 else (6, 14)
+        tipo_width = width - porcentaje_width - castigo_width
+        for i, (tipo, porcentaje, castigo) in enumerate(analisis_data):
+            row = f"{tipo[:tipo_width]:<{tipo_width}}{porcentaje:>{porcentaje_width}}{castigo:>{castigo_width}}\n"
+            ticket += (cmd.BOLD_ON + encode(row) + cmd.BOLD_OFF) if i == 0 else encode(row)
+
+    # Pesos
+    pesos = data.pesos_info1
+    deduccion = data.pesos_info2
+
+    def peso_line(label, value, bold=False):
+        amount = f"{value:,.3f}"
+        if len(label) + 1 + len(amount) <= width:
+            line = encode(f"{label}{amount:>{width - len(label)}}\n")
+        else:
+            # Papel angosto: la cantidad va alineada a la derecha en la línea siguiente
+            line = encode(f"{label}\n{amount:>{width}}\n")
+        return cmd.BOLD_ON + line + cmd.BOLD_OFF if bold else line
+
+    ticket += separator
+    ticket += peso_line("PESO BRUTO (KG)", pesos.peso_bruto)
+    ticket += encode(f"  {pesos.fechabruto} {pesos.horabruto}\n")
+    ticket += peso_line("PESO TARA (KG)", pesos.peso_tara)
+    ticket += encode(f"  {pesos.fechatara} {pesos.horatara}\n")
+    ticket += peso_line("PESO NETO (KG)", pesos.peso_neto)
+    ticket += encode(f"  {pesos.fechaneto}\n")
+    ticket += peso_line("DEDUCCION (KG)", deduccion.deduccion)
+    ticket += peso_line("PESO NETO ANALIZADO (KG)", deduccion.peso_neto_analizado, bold=True)
+
+    if data.observaciones:
+        ticket += separator
+        ticket += cmd.BOLD_ON + encode("Observaciones:\n") + cmd.BOLD_OFF
+        for line in textwrap.wrap(data.observaciones, width):
+            ticket += encode(line + "\n")
+
+    # Firmas
+    ticket += separator
+    for firma in ("PESADOR", "ANALIZADOR", "CHOFER"):
+        ticket += cmd.LINE_FEED * 2
+        ticket += cmd.ALIGN_CENTER + encode("_" * 28 + "\n") + encode(firma + "\n")
+
+    ticket += cmd.LINE_FEED * 5
+    ticket += cmd.CUT_PAPER
+    return ticket
+
+class ThermalCertificateRequest(BaseModel):
+    printer_config: PrinterConfig
+    certificado: CertificadoRequest
+    copias: int = Field(default=1, ge=1, le=100, description="Número de copias (1-100)")
+
+class AdmissionController:
+    """
+    Control de admisión para el render de certificados: como máximo max_concurrent
+    renders a la vez y max_queue solicitudes esperando turno. Lo que exceda la cola
+    (o espere más de max_wait_s) se rechaza con 503 + Retry-After en lugar de acumular
+    latencia hasta que el proxy de Vercel corte por timeout.
+    """
+
+    # Límites superiores (segundos) del histograma de espera en cola
+    WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, max_concurrent: int = 2, max_queue: int = 16, max_wait_s: float = 10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.waiting = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_histogram = [0] * (len(self.WAIT_BUCKETS) + 1)
+        self.wait_sum = 0.0
+        self._recent_waits = deque(maxlen=256)
+        # Promedio móvil del tiempo de render, para estimar Retry-After
+        self.avg_service_s = 0.1
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que se libere la cola actual"""
+        pending = self.waiting + self.active
+        return max(1, math.ceil(pending / self.max_concurrent * self.avg_service_s))
+
+    def _reject(self, reason: str):
+        raise HTTPException(
+            status_code=503,
+            detail=f"Servicio saturado ({reason}), reintente más tarde",
+            headers={"Retry-After": str(self.retry_after())}
+        )
+
+    def _record_wait(self, waited: float):
+        self.wait_sum += waited
+        self._recent_waits.append(waited)
+        for i, bound in enumerate(self.WAIT_BUCKETS):
+            if waited <= bound:
+                self.wait_histogram[i] += 1
+                return
+        self.wait_histogram[-1] += 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """Reserva un turno de render (o lanza 503 si la cola está llena o la espera es excesiva)"""
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            self._reject(f"{self.waiting} solicitudes en cola")
+
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.max_wait_s)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            self._reject(f"más de {self.max_wait_s:g} s en cola")
+        finally:
+            self.waiting -= 1
+
+        self._record_wait(time.perf_counter() - start)
+        self.admitted += 1
+        self.active += 1
+        service_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+            self.avg_service_s = 0.8 * self.avg_service_s + 0.2 * (time.perf_counter() - service_start)
+
+    def render(self, prefix: str = "certificate_admission") -> str:
+        """Mismos contadores en formato de exposición de Prometheus (para /metrics)"""
+        lines = []
+        for name, kind, help_text, value in (
+            ("queue_depth", "gauge", "Solicitudes de render esperando turno", self.waiting),
+            ("in_flight", "gauge", "Renders de certificados en curso", self.active),
+            ("max_concurrent", "gauge", "Renders simultáneos permitidos", self.max_concurrent),
+            ("max_queue", "gauge", "Solicitudes en cola permitidas", self.max_queue),
+            ("admitted_total", "counter", "Solicitudes admitidas al render", self.admitted),
+            ("rejected_total", "counter", "Solicitudes rechazadas con 503 por cola llena", self.rejected),
+            ("timed_out_total", "counter", "Solicitudes rechazadas con 503 por espera excesiva", self.timed_out),
+            ("avg_render_seconds", "gauge", "Promedio móvil del tiempo de render", self.avg_service_s),
+        ):
+            lines += [f"# HELP {prefix}_{name} {help_text}", f"# TYPE {prefix}_{name} {kind}",
+                      f"{prefix}_{name} {value}"]
+        name = f"{prefix}_wait_seconds"
+        lines += [f"# HELP {name} Espera en cola hasta obtener turno de render", f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.WAIT_BUCKETS, self.wait_histogram):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound:g}"}} {cumulative}')
+        cumulative += self.wait_histogram[-1]
+        lines += [f'{name}_bucket{{le="+Inf"}} {cumulative}', f"{name}_sum {self.wait_sum}",
+                  f"{name}_count {cumulative}"]
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        recent = sorted(self._recent_waits)
+
+        def percentile(q):
+            return round(recent[min(len(recent) - 1, int(q * len(recent)))], 4) if recent else None
+
+        buckets = {}
+        cumulative = 0
+        for bound, count in zip(self.WAIT_BUCKETS, self.wait_histogram):
+            cumulative += count
+            buckets[f"le_{bound:g}"] = cumulative
+        buckets["le_inf"] = cumulative + self.wait_histogram[-1]
+
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "max_wait_s": self.max_wait_s,
+            "queue_depth": self.waiting,
+            "in_flight": self.active,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected,
+            "rejected_wait_timeout": self.timed_out,
+            "avg_render_s": round(self.avg_service_s, 4),
+            "wait_seconds": {
+                "count": buckets["le_inf"],
+                "sum": round(self.wait_sum, 4),
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "buckets": buckets,
+            },
+        }
+
+render_admission = AdmissionController(
+    max_concurrent=int(os.environ.get("CERT_MAX_CONCURRENT", "2")),
+    max_queue=int(os.environ.get("CERT_MAX_QUEUE", "16")),
+    max_wait_s=float(os.environ.get("CERT_MAX_QUEUE_WAIT_S", "10")),
+)
+
+async def render_pdf(data: CertificadoRequest, filename, profile: Optional[PdfOutputProfile] = None):
+    """
+    Genera el PDF en un hilo: el dibujo es CPU puro y bloquearía el event loop,
+    que debe seguir atendiendo /health, /ready y los rechazos 503 durante una ráfaga
+    """
+    await asyncio.to_thread(second_page, data, filename, profile)
+
+class PreviewCache:
+    """
+    Caché LRU de vistas previas, acotado por bytes totales.
+    Clave: hash del certificado + formato + resolución; valor: imágenes de cada página.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, List[bytes]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[List[bytes]]:
+        pages = self._entries.get(key)
+        if pages is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return pages
+
+    def put(self, key: str, pages: List[bytes]):
+        size = sum(len(p) for p in pages)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= sum(len(p) for p in old)
+        self._entries[key] = pages
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= sum(len(p) for p in evicted)
+
+preview_cache = PreviewCache(int(os.environ.get("CERT_PREVIEW_CACHE_MB", "32")) * 1024 * 1024)
+
+PREVIEW_MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+def preview_key(data: CertificadoRequest, image_format: str, dpi: int) -> str:
+    """Hash del contenido del certificado (y del logo vigente) para la caché de vistas previas"""
+    try:
+        logo_mtime = os.stat(LOGO_PATH).st_mtime_ns
+    except OSError:
+        logo_mtime = None
+    payload = json.dumps([data.model_dump(), image_format, dpi, logo_mtime], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# pdfium no es thread-safe: una sola rasterización a la vez
+_pdfium_lock = threading.Lock()
+
+async def render_preview(data: CertificadoRequest, image_format: str, dpi: int) -> List[bytes]:
+    """
+    Genera las imágenes de ambas hojas en memoria: el mismo código de dibujo sobre un PDF
+    en memoria (perfil screen, sin archivo temporal) rasterizado en el proceso
+    """
+    pdf_buffer = io.BytesIO()
+    await render_pdf(data, pdf_buffer, PDF_PROFILES["screen"])
+    return await asyncio.to_thread(rasterize_pdf, pdf_buffer.getvalue(), image_format, dpi)
+
+def rasterize_pdf(pdf_data: bytes, image_format: str, dpi: int) -> List[bytes]:
+    pages = []
+    with _pdfium_lock:
+        document = pdfium.PdfDocument(pdf_data)
+        try:
+            for page in document:
+                # Paleta de 32 colores: el certificado es texto y colores planos
+                image = page.render(scale=dpi / 72).to_pil().quantize(32)
+                out = io.BytesIO()
+                if image_format == "webp":
+                    image.convert("RGB").save(out, "WEBP", lossless=True, method=4)
+                else:
+                    image.save(out, "PNG", optimize=True)
+                pages.append(out.getvalue())
+        finally:
+            document.close()
+    return pages
+
 @app.post("/generate-certificate")
-async def generate_certificate(certificado: CertificadoRequest):
+async def generate_certificate(certificado: CertificadoRequest, profile: Optional[str] = Query(None)):
     """
     Endpoint para generar el certificado PDF
     Recibe todos los datos necesarios y devuelve el archivo PDF
+    profile: perfil de salida (print, screen, archive); por defecto CERT_PDF_PROFILE
     """
+    pdf_profile = resolve_pdf_profile(profile)
+
     # Validación: máximo 14 tipos de análisis
     num_tipos = len(certificado.analisis or [])
     if num_tipos > 14:
@@ -790,12 +1269,20 @@ async def generate_certificate(certificado: CertificadoRequest):
         )
     
     try:
-        # Crear un archivo temporal
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            temp_filename = tmp_file.name
-        
-        # Generar el PDF usando la función second_page (equivalente a second_table)
-        await second_page(certificado, temp_filename)
+        # Turno de render (503 + Retry-After si el servicio está saturado)
+        async with render_admission.slot():
+            # Crear un archivo temporal
+            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+                temp_filename = tmp_file.name
+            
+            # Generar el PDF usando la función second_page (equivalente a second_table)
+            render_start = time.perf_counter()
+            await render_pdf(certificado, temp_filename, pdf_profile)
+        if startup_state["first_certificate_ms"] is None:
+            startup_state["first_certificate_ms"] = round((time.perf_counter() - render_start) * 1000, 1)
+            startup_state["time_to_first_certificate_s"] = round(time.perf_counter() - PROCESS_START, 3)
+            logger.info("Primer certificado: %s ms de render, %s s desde el arranque",
+                        startup_state["first_certificate_ms"], startup_state["time_to_first_certificate_s"])
         
         # Nombre del archivo final
         fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -806,7 +1293,11 @@ async def generate_certificate(certificado: CertificadoRequest):
             path=temp_filename,
             filename=final_filename,
             media_type='application/pdf',
-            headers={"Content-Disposition": f"attachment; filename={final_filename}"}
+            headers={
+                "Content-Disposition": f"attachment; filename={final_filename}",
+                "X-PDF-Profile": pdf_profile.name,
+                "X-PDF-Bytes": str(os.path.getsize(temp_filename)),
+            }
         )
     
     except HTTPException:
@@ -817,6 +1308,97 @@ async def generate_certificate(certificado: CertificadoRequest):
             os.unlink(temp_filename)
         raise HTTPException(status_code=500, detail=f"Error generando el PDF: {str(e)}")
 
+@app.post("/generate-certificate/preview")
+async def preview_certificate(
+    certificado: CertificadoRequest,
+    page: int = Query(1, ge=1, le=2, description="Hoja a devolver (1 o 2)"),
+    format: str = Query("webp", description="Formato de imagen: webp o png"),
+    dpi: int = Query(60, ge=20, le=150, description="Resolución de la vista previa"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Vista previa de baja resolución de una hoja del certificado (para BoletaPreviewDialog).
+    Se cachea por hash del certificado: la segunda hoja y las repeticiones no vuelven a generarse.
+    """
+    if not PDFIUM_AVAILABLE:
+        raise HTTPException(status_code=503, detail="pypdfium2 no está instalado en el servidor")
+    if format not in PREVIEW_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {format}. Use webp o png")
+
+    key = preview_key(certificado, format, dpi)
+    etag = f'"{key[:32]}-{page}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    pages = preview_cache.get(key)
+    cache_status = "hit"
+    if pages is None:
+        cache_status = "miss"
+        try:
+            render_start = time.perf_counter()
+            async with render_admission.slot():
+                pages = await render_preview(certificado, format, dpi)
+            logger.info("Vista previa %s: %d hoja(s), %.1f ms", certificado.boleta_no, len(pages),
+                        (time.perf_counter() - render_start) * 1000)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error generando la vista previa: {str(e)}")
+        preview_cache.put(key, pages)
+
+    return Response(
+        content=pages[page - 1],
+        media_type=PREVIEW_MEDIA_TYPES[format],
+        headers={
+            "ETag": etag,
+            "Cache-Control": "private, max-age=300",
+            "X-Preview-Cache": cache_status,
+        }
+    )
+
+_printer_api = None
+
+async def printer_api():
+    """
+    API de impresión (main_updated) con su registro de impresoras ya iniciado. Se importa
+    (en un hilo) con el primer certificado térmico y no al arrancar el servicio de PDF
+    """
+    global _printer_api
+    if _printer_api is None:
+        module = await asyncio.to_thread(importlib.import_module, "main_updated")
+        await module.printer_registry.start()
+        _printer_api = module
+    return _printer_api
+
+@app.post("/generate-certificate/thermal", response_model=PrintResponse)
+async def print_thermal_certificate(request: ThermalCertificateRequest):
+    """
+    Imprime el certificado en la impresora térmica de 80 mm (ESC/POS) en lugar de generar el PDF
+    """
+    num_tipos = len(request.certificado.analisis or [])
+    if num_tipos > 14:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Se permiten máximo 14 tipos de análisis. Se recibieron: {num_tipos}"
+        )
+
+    try:
+        impresion = await printer_api()
+        printer_config = impresion.resolve_printer_config(request.printer_config)
+        profile = impresion.resolve_printer_profile(printer_config)
+        render_start = time.perf_counter()
+        escpos_data = generate_certificate_escpos(request.certificado, profile.code_page,
+                                                  impresion.profile_raster(thermal_logo(), profile),
+                                                  columns=profile.columns)
+        logger.info("Certificado térmico %s: %d bytes, %.1f ms", request.certificado.boleta_no, len(escpos_data),
+                    (time.perf_counter() - render_start) * 1000)
+        return await impresion.send_print_copies(printer_config, profile, escpos_data, request.copias, "Certificado")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error imprimiendo certificado térmico: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error al imprimir certificado: {str(e)}")
+
 @app.get("/")
 async def root():
     """Endpoint de salud para verificar que la API está funcionando"""
@@ -827,6 +1409,55 @@ async def health_check():
     """Endpoint de verificación de salud"""
     return {"status": "healthy", "service": "PDF Certificate Generator"}
 
+@app.get("/metrics/admission")
+async def admission_metrics():
+    """Profundidad de cola, renders en curso, rechazos y tiempos de espera del control de admisión"""
+    return render_admission.snapshot()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Métricas del control de admisión en formato Prometheus (de este proceso/worker)"""
+    return PlainTextResponse(render_admission.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+async def readiness_check():
+    """
+    Listo para recibir tráfico: ReportLab cargado y un certificado sintético ya generado.
+    Devuelve 503 mientras el warm-up no ha terminado (o si falló).
+    """
+    if not startup_state["ready"]:
+        status = "warmup_failed" if startup_state["error"] else "warming_up"
+        return JSONResponse(status_code=503, content={"status": status, **startup_state})
+    return {"status": "ready", **startup_state}
+
+async def warm_up():
+    """
+    Genera un certificado sintético (el de /example-request) para cargar ReportLab,
+    métricas de fuentes, el logo y la maquinaria de tablas antes del primer certificado real
+    """
+    start = time.perf_counter()
+    temp_filename = None
+    try:
+        # Importar y dibujar es CPU puro: en hilos, para que /health y /ready respondan mientras tanto
+        await asyncio.to_thread(load_reportlab)
+        sample = CertificadoRequest(**(await example_request()))
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+            temp_filename = tmp_file.name
+        await render_pdf(sample, temp_filename)
+        if PDFIUM_AVAILABLE:
+            # Carga pdfium y deja en caché la vista previa del ejemplo
+            preview_cache.put(preview_key(sample, "webp", 60), await render_preview(sample, "webp", 60))
+        startup_state["warmup_s"] = round(time.perf_counter() - start, 3)
+        startup_state["ready"] = True
+        logger.info("Warm-up completado en %s s (%.3f s desde el arranque)",
+                    startup_state["warmup_s"], time.perf_counter() - PROCESS_START)
+    except Exception as e:
+        startup_state["error"] = str(e)
+        logger.error("Error en el warm-up del generador de certificados: %s", e)
+    finally:
+        if temp_filename and os.path.exists(temp_filename):
+            os.unlink(temp_filename)
+
 # Ejemplo de uso del endpoint
 @app.get("/example-request")
 async def example_request():
@@ -875,5 +1506,5 @@ async def example_request():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002)
+    uvicorn.run(app, host="0.0.0.0", port=8002, log_config=None)
 
@@ -0,0 +1,164 @@
+"""
+Piezas ESC/POS compartidas por la API de impresión (main_updated.py) y la de certificados
+(api_certificados_corregida.py): configuración de impresora, respuesta de impresión,
+comandos, perfiles y codificadores de página de códigos. Es ligero a propósito (solo
+pydantic y biblioteca estándar): importarlo no carga la API de impresión ni ReportLab.
+"""
+
+from functools import lru_cache
+from typing import Literal, Optional
+import unicodedata
+
+from pydantic import BaseModel, Field
+
+class PrinterConfig(BaseModel):
+    printer_id: Optional[str] = Field(None, description="Id de una impresora del registro del servidor (reemplaza los demás campos)")
+    connection_type: Literal["network", "usb"] = Field(default="network", description="Tipo de conexión")
+    ip: Optional[str] = Field(None, description="Dirección IP (solo para network)")
+    port: int = Field(default=9100, description="Puerto TCP (solo para network)")
+    timeout: int = Field(default=10, description="Timeout máximo en segundos (el de conexión se ajusta a la latencia medida)")
+    printer_name: Optional[str] = Field(None, description="Nombre de la impresora USB")
+    profile: str = Field(default="default", description="Perfil de impresora (define la página de códigos)")
+    code_page: Optional[str] = Field(None, description="Página de códigos a usar en lugar de la del perfil (ej. cp850, cp858, cp437)")
+
+class PrintResponse(BaseModel):
+    success: bool
+    message: str
+    printer_ip: str
+    timestamp: str
+    idempotency_key: Optional[str] = None
+    reused: bool = Field(default=False, description="True si se devolvió un trabajo ya en curso o completado")
+
+class ESCPOSCommands:
+    """Comandos ESC/POS básicos"""
+    INIT = b'\x1B\x40'  # Inicializar impresora
+    ALIGN_LEFT = b'\x1B\x61\x00'
+    ALIGN_CENTER = b'\x1B\x61\x01'
+    ALIGN_RIGHT = b'\x1B\x61\x02'
+    BOLD_ON = b'\x1B\x45\x01'
+    BOLD_OFF = b'\x1B\x45\x00'
+    UNDERLINE_ON = b'\x1B\x2D\x01'
+    UNDERLINE_OFF = b'\x1B\x2D\x00'
+    FONT_SMALL = b'\x1B\x4D\x01'
+    FONT_NORMAL = b'\x1B\x4D\x00'
+    LINE_FEED = b'\x0A'
+    CUT_PAPER = b'\x1D\x56\x41\x00'  # Corte total
+    DOUBLE_HEIGHT = b'\x1B\x21\x10'
+    DOUBLE_WIDTH = b'\x1B\x21\x20'
+    NORMAL_SIZE = b'\x1B\x21\x00'
+    SELECT_CODE_PAGE = b'\x1B\x74'  # ESC t n (seleccionar página de códigos)
+    STATUS_PRINTER = b'\x10\x04\x01'  # DLE EOT 1 (estado de la impresora, tiempo real)
+
+class PrinterProfile(BaseModel):
+    name: str
+    code_page: str = "cp850"
+    chunk_size: int = Field(default=4096, ge=64, description="Tamaño de bloque al enviar por TCP (bytes)")
+    status_polling: bool = Field(default=True, description="Consultar estado con DLE EOT antes de enviar cada trabajo")
+    native_barcodes: bool = Field(default=True, description="Soporta códigos de barras nativos (GS k)")
+    native_2d: bool = Field(default=True, description="Soporta QR y PDF417 nativos (GS ( k)")
+    dots_per_line: int = Field(default=576, description="Ancho imprimible en puntos (576 = 80 mm, 384 = 58 mm)")
+    compact_raster: bool = Field(default=True, description="Enviar logos y códigos raster compactados (bordes recortados, escala de la impresora)")
+    feed_in_dots: bool = Field(default=False, description="ESC J n avanza n puntos (unidad vertical de GS P = paso del punto): las filas en blanco del raster se envían como avances")
+    graphics_buffer: bool = Field(default=False, description="Soporta gráficos GS ( L / GS 8 L (función 112); si no, se usa GS v 0")
+    raster_band_height: int = Field(default=256, ge=8, description="Alto máximo de cada banda raster (puntos)")
+
+    @property
+    def columns(self) -> int:
+        """Columnas de texto con la fuente A (12 puntos por carácter): 576 -> 48, 384 -> 32"""
+        return self.dots_per_line // 12
+
+# Perfiles conocidos; el perfil "default" conserva el comportamiento original (cp850)
+PRINTER_PROFILES = {
+    "default": PrinterProfile(name="default", code_page="cp850"),
+    "pc437": PrinterProfile(name="pc437", code_page="cp437"),
+    "pc858": PrinterProfile(name="pc858", code_page="cp858"),
+    "wpc1252": PrinterProfile(name="wpc1252", code_page="cp1252"),
+    # Térmicas económicas de 58 mm: sin QR/PDF417 nativos (se imprimen como raster)
+    "basic58": PrinterProfile(name="basic58", code_page="cp437", native_2d=False, dots_per_line=384),
+}
+
+class CodePageEncoder:
+    """
+    Codifica texto para una página de códigos ESC/POS usando tablas precalculadas.
+    Cada carácter se traduce con str.translate a un carácter cuyo ordinal es el byte
+    destino y el resultado se codifica como latin-1, de modo que codificar es una
+    simple búsqueda en tabla. Los caracteres que la página no soporta se translitera
+    (ej. 'ñ' -> 'n' en páginas sin ñ, '“' -> '"') y el resto se sustituye por '?'.
+    """
+
+    # Valor n de ESC t n para cada página de códigos (tabla estándar Epson)
+    ESC_T_NUMBERS = {
+        "cp437": 0,
+        "cp850": 2,
+        "cp860": 3,
+        "cp863": 4,
+        "cp865": 5,
+        "cp1252": 16,
+        "cp866": 17,
+        "cp852": 18,
+        "cp858": 19,
+    }
+
+    # Sustituciones para caracteres frecuentes que la descomposición Unicode no resuelve
+    TRANSLITERATIONS = {
+        "“": '"', "”": '"', "„": '"', "«": '"', "»": '"',
+        "‘": "'", "’": "'", "‚": "'",
+        "–": "-", "—": "-", "…": "...", "•": "*",
+        "€": "EUR", "°": "o", "º": "o", "ª": "a",
+        "¿": "?", "¡": "!", "×": "x", "ß": "ss",
+        "Æ": "AE", "æ": "ae", "Œ": "OE", "œ": "oe",
+        "Ø": "O", "ø": "o", "Ł": "L", "ł": "l", "Đ": "D", "đ": "d",
+    }
+
+    def __init__(self, code_page: str):
+        if code_page not in self.ESC_T_NUMBERS:
+            raise ValueError(f"Página de códigos no soportada: {code_page}")
+        self.code_page = code_page
+        self.select_command = ESCPOSCommands.SELECT_CODE_PAGE + bytes([self.ESC_T_NUMBERS[code_page]])
+        self._table = self._build_table(code_page)
+
+    @classmethod
+    def _build_table(cls, code_page: str) -> dict:
+        table = {}
+
+        # Caracteres que la página de códigos sí tiene (bytes 0x80-0xFF)
+        for byte in range(0x80, 0x100):
+            try:
+                char = bytes([byte]).decode(code_page)
+            except UnicodeDecodeError:
+                continue
+            table.setdefault(ord(char), chr(byte))
+
+        def encode_fallback(text: str) -> Optional[str]:
+            # La sustitución también debe poder representarse en la página de códigos
+            if all(ord(ch) < 0x80 or ord(ch) in table for ch in text):
+                return "".join(table.get(ord(ch), ch) for ch in text)
+            return None
+
+        # Transliteraciones para lo que falte en Latin-1/Latin Extended y signos tipográficos
+        candidates = [chr(cp) for cp in range(0x80, 0x250)] + list(cls.TRANSLITERATIONS)
+        for char in candidates:
+            if ord(char) in table:
+                continue
+            fallback = None
+            if char in cls.TRANSLITERATIONS:
+                fallback = encode_fallback(cls.TRANSLITERATIONS[char])
+            if fallback is None:
+                ascii_form = unicodedata.normalize('NFKD', char).encode('ascii', 'ignore').decode('ascii')
+                fallback = encode_fallback(ascii_form) if ascii_form else None
+            table[ord(char)] = fallback if fallback else "?"
+
+        return table
+
+    def encode(self, text: str) -> bytes:
+        # La mayoría de los campos (placas, boleta, fecha, separadores) son ASCII puro
+        if text.isascii():
+            return text.encode('ascii')
+        return text.translate(self._table).encode('latin-1', errors='replace')
+
+@lru_cache(maxsize=None)
+def get_code_page_encoder(code_page: str) -> CodePageEncoder:
+    """
+    Devuelve el codificador (con sus tablas ya construidas) para una página de códigos
+    """
+    return CodePageEncoder(code_page)
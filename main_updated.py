@@ -1,34 +1,116 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
-from typing import Optional, Literal
+from fastapi import FastAPI, HTTPException, Header, Query, Request, Response, Form, File, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Optional, List, Literal, Callable, Awaitable
+from collections import OrderedDict, deque
 import socket
 import asyncio
+import atexit
+import queue
 from datetime import datetime
 import logging
 import subprocess
 import platform
 import base64
+import hashlib
+import time
+import os
+import json
+import tempfile
+import ipaddress
+import sys
+import threading
+from functools import lru_cache
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+# Modelos, comandos, perfiles y codificadores compartidos con la API de certificados
+from escpos_common import (
+    ESCPOSCommands, PRINTER_PROFILES, CodePageEncoder, PrintResponse, PrinterConfig, PrinterProfile,
+    get_code_page_encoder
+)
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Avisos de dependencias opcionales ausentes: se registran en el arranque (lifespan),
+# cuando el logging ya está configurado
+startup_warnings: List[str] = []
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    from scripts.escpos_barcodes import symbol_image, symbol_width
+    from scripts.convert_logo_escpos import pack_raster
+    SYMBOL_RASTER_AVAILABLE = True
+except ImportError:
+    SYMBOL_RASTER_AVAILABLE = False
+    startup_warnings.append("reportlab/Pillow no disponibles - los códigos de boleta solo se imprimen con comandos nativos")
+
+try:
+    from scripts.escpos_raster import compact_escpos_raster
+    RASTER_COMPACT_AVAILABLE = True
+except ImportError:
+    RASTER_COMPACT_AVAILABLE = False
+    startup_warnings.append("scripts/escpos_raster.py no disponible - los logos se envían como un solo bloque GS v 0")
+
+try:
+    from scripts import ipp_protocol as ipp
+    IPP_AVAILABLE = True
+except ImportError:
+    IPP_AVAILABLE = False
+    startup_warnings.append("scripts/ipp_protocol.py no disponible - la impresión USB en macOS/Linux usa 'lp'")
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    from scripts.structured_logging import configure_logging
+except ImportError:
+    configure_logging = None
+    logging.basicConfig(level=logging.INFO)
+    logger.warning("scripts/structured_logging.py no disponible - logging síncrono en texto")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # En el lifespan (no al importar): cada worker configura su propio hilo de logging
+    if configure_logging is not None:
+        configure_logging(context=log_context)
+    for message in startup_warnings:
+        logger.warning(message)
+    logo_manifest.load()
+    await printer_registry.start()
+    await worker_affinity.start()
+    loop_lag_monitor.start()
+    yield
+    loop_lag_monitor.stop()
+    await worker_affinity.stop()
+    printer_registry.stop()
+
 app = FastAPI(
     title="ESC/POS Printer API",
     description="API para envío de comandos ESC/POS a impresoras térmicas via TCP o USB",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-class PrinterConfig(BaseModel):
-    connection_type: Literal["network", "usb"] = Field(default="network", description="Tipo de conexión")
-    ip: Optional[str] = Field(None, description="Dirección IP (solo para network)")
-    port: int = Field(default=9100, description="Puerto TCP (solo para network)")
-    timeout: int = Field(default=10, description="Timeout de conexión en segundos")
-    printer_name: Optional[str] = Field(None, description="Nombre de la impresora USB")
+class BoletaCodeOptions(BaseModel):
+    symbology: Literal["code128", "code39", "qr", "pdf417"] = Field(default="code128", description="Tipo de código")
+    module_size: int = Field(default=3, ge=1, le=16, description="Ancho del módulo en puntos (barras 2-6, QR 1-16, PDF417 2-8)")
+    height: int = Field(default=80, ge=1, le=255, description="Alto de las barras en puntos (solo CODE128/CODE39)")
+    error_correction: Literal["L", "M", "Q", "H"] = Field(default="M", description="Corrección de errores (QR y PDF417)")
+    hri: bool = Field(default=True, description="Imprimir el número legible bajo el código de barras")
 
 class TicketPrintRequest(BaseModel):
     printer_config: PrinterConfig
     producto: str
-    fecha: strhaa
+    fecha: str
     boleta: str
     cliente: str
     destino: str
@@ -37,30 +119,1167 @@ class TicketPrintRequest(BaseModel):
     chofer: str
     copias: int = Field(default=1, ge=1, le=100, description="Número de copias (1-100)")
     logo: Optional[str] = Field(None, description="Logo en formato base64 (opcional)")
+    codigo_boleta: Optional[BoletaCodeOptions] = Field(None, description="Código de barras o QR con el número de boleta (opcional)")
+    idempotency_key: Optional[str] = Field(None, description="Clave de idempotencia (opcional, se deriva de boleta+copias+destino)")
+
+class ReprintRequest(BaseModel):
+    printer_config: PrinterConfig
+    copias: int = Field(default=1, ge=1, le=100, description="Número de copias (1-100)")
+
+def resolve_printer_profile(config: PrinterConfig) -> PrinterProfile:
+    """
+    Determina el perfil efectivo (con la página de códigos del override, si existe)
+    """
+    if config.printer_id:
+        return printer_registry.get(config.printer_id)["profile"]
+    profile = PRINTER_PROFILES.get(config.profile)
+    if profile is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Perfil de impresora desconocido: '{config.profile}'"
+        )
+    code_page = (config.code_page or profile.code_page).lower()
+    if code_page not in CodePageEncoder.ESC_T_NUMBERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Página de códigos no soportada: '{code_page}'"
+        )
+    return profile.model_copy(update={"code_page": code_page})
+
+@lru_cache(maxsize=64)
+def _compact_raster(data: bytes, band_height: int, graphics_buffer: bool, feed_in_dots: bool) -> bytes:
+    return compact_escpos_raster(data, band_height, graphics_buffer, dot_feed=feed_in_dots)
+
+def profile_raster(data: bytes, profile: PrinterProfile) -> bytes:
+    """
+    Raster GS v 0 compactado según el perfil (ver scripts/escpos_raster.py): imprime lo mismo
+    con menos bytes. Cualquier otro contenido se devuelve sin cambios.
+    """
+    if not data or not profile.compact_raster or not RASTER_COMPACT_AVAILABLE:
+        return data
+    return _compact_raster(data, profile.raster_band_height, profile.graphics_buffer, profile.feed_in_dots)
+
+def rendered_variant(profile: PrinterProfile) -> str:
+    """
+    Variante del ticket guardado para reimprimir: todo lo del perfil que cambia sus bytes
+    (página de códigos, ancho en puntos del logo y los códigos, modo raster con o sin
+    avances ESC J y comandos nativos), para no reimprimirlo en una impresora con la que
+    no es compatible
+    """
+    if not profile.compact_raster:
+        raster = "v0"
+    else:
+        raster = "gs(L" if profile.graphics_buffer else "compact"
+        if profile.feed_in_dots:
+            raster += "+J"
+    native = f"{int(profile.native_barcodes)}{int(profile.native_2d)}"
+    return f"{profile.code_page}|{profile.dots_per_line}|{raster}|{native}"
+
+
+# Ancho en módulos de los códigos de barras nativos (para ajustarlos al papel)
+def _native_1d_modules(symbology: str, data: str) -> int:
+    if symbology == "code128":
+        # inicio + datos + verificador (11 módulos cada uno) + parada (13)
+        return 11 * (len(data) + 2) + 13
+    # CODE39: 16 módulos por carácter (con el separador) incluyendo los asteriscos de inicio y fin
+    return 16 * (len(data) + 2) - 1
+
+CODE39_CHARS = set("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ -.$/+%")
+QR_EC_LEVELS = "LMQH"
+# Nivel de corrección de PDF417 equivalente a cada letra del QR
+PDF417_EC_LEVELS = {"L": 1, "M": 2, "Q": 4, "H": 6}
+
+def _gs_k_2d(cn: int, fn: int, params: bytes) -> bytes:
+    # GS ( k pL pH cn fn [parámetros]
+    body = bytes([cn, fn]) + params
+    return b'\x1D\x28\x6B' + len(body).to_bytes(2, 'little') + body
+
+@lru_cache(maxsize=256)
+def _symbol_raster(symbology: str, data: str, module_size: int, height: int,
+                   error_correction: str, max_width: int) -> bytes:
+    module = module_size
+    while module > 1 and symbol_width(symbology, data, module, error_correction) > max_width:
+        module -= 1
+    image = symbol_image(symbology, data, module, height, error_correction)
+    raster, _, _ = pack_raster(image, max_width=max_width)
+    return raster
+
+def boleta_symbol_escpos(boleta: str, options: "BoletaCodeOptions", profile: PrinterProfile,
+                         encoder: CodePageEncoder) -> bytes:
+    """
+    Código de barras o QR con el número de boleta, centrado.
+    Con soporte nativo la impresora genera el símbolo (GS k / GS ( k, unas decenas de bytes);
+    si el perfil no lo tiene se envía como raster GS v 0 (PDF417 se sustituye por QR).
+    """
+    symbology = options.symbology
+    two_d = symbology in ("qr", "pdf417")
+    data = boleta.upper() if symbology == "code39" else boleta
+    if symbology == "code39" and not set(data) <= CODE39_CHARS:
+        raise HTTPException(status_code=400, detail=f"La boleta '{boleta}' tiene caracteres no válidos para CODE39")
+    if symbology == "code128" and not all(32 <= ord(ch) < 127 for ch in data):
+        raise HTTPException(status_code=400, detail=f"La boleta '{boleta}' tiene caracteres no válidos para CODE128")
+    raw = data.encode('utf-8')
+    native = profile.native_2d if two_d else profile.native_barcodes
+    if native and not two_d:
+        # GS k lleva la longitud en un byte y el módulo mínimo de GS w es 2 puntos
+        payload = b'{B' + raw.replace(b'{', b'{{') if symbology == "code128" else raw
+        if len(payload) > 255:
+            raise HTTPException(status_code=400, detail=f"La boleta '{boleta}' es demasiado larga para {symbology.upper()}")
+        if _native_1d_modules(symbology, data) * 2 > profile.dots_per_line:
+            raise HTTPException(
+                status_code=400,
+                detail=f"El código {symbology.upper()} de la boleta '{boleta}' no cabe en "
+                       f"{profile.dots_per_line} puntos; use symbology 'qr'"
+            )
+
+    cmd = ESCPOSCommands
+    out = cmd.ALIGN_CENTER
+    if native and symbology == "qr":
+        out += _gs_k_2d(49, 65, b'\x32\x00')  # modelo 2
+        out += _gs_k_2d(49, 67, bytes([min(16, options.module_size)]))
+        out += _gs_k_2d(49, 69, bytes([48 + QR_EC_LEVELS.index(options.error_correction)]))
+        out += _gs_k_2d(49, 80, b'\x30' + raw)
+        out += _gs_k_2d(49, 81, b'\x30')
+    elif native and symbology == "pdf417":
+        out += _gs_k_2d(48, 65, b'\x00')  # columnas automáticas
+        out += _gs_k_2d(48, 66, b'\x00')  # filas automáticas
+        out += _gs_k_2d(48, 67, bytes([min(8, max(2, options.module_size))]))
+        out += _gs_k_2d(48, 68, b'\x03')  # alto de fila (x ancho del módulo)
+        out += _gs_k_2d(48, 69, bytes([48, 48 + PDF417_EC_LEVELS[options.error_correction]]))
+        out += _gs_k_2d(48, 80, b'\x30' + raw)
+        out += _gs_k_2d(48, 81, b'\x30')
+    elif native:
+        module = min(6, max(2, options.module_size))
+        while module > 2 and _native_1d_modules(symbology, data) * module > profile.dots_per_line:
+            module -= 1
+        out += b'\x1D\x68' + bytes([options.height])           # GS h: alto
+        out += b'\x1D\x77' + bytes([module])                   # GS w: ancho del módulo
+        out += b'\x1D\x48' + bytes([2 if options.hri else 0])  # GS H: texto legible debajo
+        out += b'\x1D\x6B' + bytes([73 if symbology == "code128" else 69, len(payload)]) + payload
+    elif SYMBOL_RASTER_AVAILABLE:
+        fallback = "qr" if symbology == "pdf417" else symbology
+        out += profile_raster(_symbol_raster(fallback, data, options.module_size, options.height,
+                                             options.error_correction, profile.dots_per_line), profile)
+        if options.hri and not two_d:
+            out += encoder.encode(data + "\n")
+    else:
+        logger.warning("El perfil '%s' no imprime %s de forma nativa y no hay reportlab/Pillow "
+                       "para generarlo como imagen; se omite el código", profile.name, symbology)
+        return b''
+    return out + cmd.LINE_FEED + cmd.ALIGN_LEFT
+
+class PrinterThroughputStats:
+    """
+    Mide el rendimiento de envío (bytes/segundo) por impresora
+    """
+
+    # Peso de la última medición en el promedio móvil
+    EWMA_ALPHA = 0.3
+
+    def __init__(self):
+        self._stats = {}
+
+    def record(self, target: str, bytes_sent: int, seconds: float) -> float:
+        bytes_per_second = bytes_sent / seconds if seconds > 0 else 0.0
+        stats = self._stats.get(target)
+        if stats is None:
+            stats = {"jobs": 0, "bytes_sent": 0, "seconds": 0.0, "avg_bytes_per_second": bytes_per_second}
+            self._stats[target] = stats
+        else:
+            stats["avg_bytes_per_second"] += self.EWMA_ALPHA * (bytes_per_second - stats["avg_bytes_per_second"])
+        stats["jobs"] += 1
+        stats["bytes_sent"] += bytes_sent
+        stats["seconds"] += seconds
+        stats["last_bytes_per_second"] = bytes_per_second
+        return bytes_per_second
+
+    def snapshot(self) -> dict:
+        return {target: dict(stats) for target, stats in self._stats.items()}
+
+throughput_stats = PrinterThroughputStats()
+
+class PrinterPacing:
+    """
+    Aprende por impresora la latencia de conexión y el ritmo real de impresión para
+    espaciar las copias y ajustar los timeouts a lo medido (en lugar de 0.5 s fijos
+    entre copias y del timeout estático de PrinterConfig).
+    - Si la impresora responde a DLE EOT, la siguiente copia sale en cuanto reporta estar
+      lista (la consulta de estado previa a cada envío ya espera si está fuera de línea).
+    - Si no responde, la pausa es el tiempo de impresión que falta según el ritmo aprendido.
+      El ritmo se mide en los envíos en que la impresora frenó al emisor por control de
+      flujo TCP (su buffer se llenó), porque entonces los bytes/s son los de impresión.
+    - El timeout de conexión sigue la fórmula de TCP (RFC 6298): srtt + 4·rttvar, con
+      PrinterConfig.timeout como tope y valor sin datos. Justo después de un envío se usa
+      el tope: muchas impresoras no aceptan otra conexión hasta terminar de imprimir.
+    - La espera de respuesta a DLE EOT crece con la latencia medida (enlaces lentos/VPN),
+      para no tomar por "sin soporte de estado" a una impresora que solo está lejos.
+    """
+
+    # Sin datos de la impresora se conserva la pausa original entre copias
+    DEFAULT_COPY_GAP = 0.5
+    MAX_COPY_GAP = 5.0
+    MIN_TIMEOUT = 1.0
+    RTT_ALPHA = 0.125
+    RTT_BETA = 0.25
+    RATE_ALPHA = 0.3
+
+    def __init__(self):
+        self._stats = {}
+
+    def _get(self, target: str) -> dict:
+        stats = self._stats.get(target)
+        if stats is None:
+            stats = {"srtt": None, "rttvar": None, "print_bytes_per_second": None,
+                     "status_supported": None, "last_sent_at": None}
+            self._stats[target] = stats
+        return stats
+
+    def _rto(self, stats: dict) -> float:
+        return stats["srtt"] + 4 * stats["rttvar"]
+
+    def connect_timeout(self, target: str, cap: float) -> float:
+        stats = self._stats.get(target)
+        if stats is None or stats["srtt"] is None:
+            return cap
+        if stats["last_sent_at"] is not None and time.monotonic() - stats["last_sent_at"] < cap:
+            return cap
+        return min(cap, max(self.MIN_TIMEOUT, self._rto(stats)))
+
+    def status_timeout(self, target: str, cap: float) -> float:
+        stats = self._stats.get(target)
+        if stats is None or stats["srtt"] is None:
+            return ESCPOSStreamWriter.STATUS_REPLY_TIMEOUT
+        return min(cap, max(ESCPOSStreamWriter.STATUS_REPLY_TIMEOUT, self._rto(stats)))
+
+    def record_connect(self, target: str, seconds: float):
+        stats = self._get(target)
+        if stats["srtt"] is None:
+            stats["srtt"], stats["rttvar"] = seconds, seconds / 2
+        else:
+            stats["rttvar"] += self.RTT_BETA * (abs(stats["srtt"] - seconds) - stats["rttvar"])
+            stats["srtt"] += self.RTT_ALPHA * (seconds - stats["srtt"])
+
+    def record_timeout(self, target: str):
+        """
+        Tras un timeout se descarta la latencia aprendida: el siguiente intento usa el tope
+        """
+        stats = self._get(target)
+        stats["srtt"] = stats["rttvar"] = None
+
+    def record_send(self, target: str, result: dict):
+        stats = self._get(target)
+        stats["last_sent_at"] = time.monotonic()
+        if "status_supported" in result:
+            stats["status_supported"] = result["status_supported"]
+        if result.get("stalled") and result.get("bytes_per_second"):
+            rate = result["bytes_per_second"]
+            current = stats["print_bytes_per_second"]
+            stats["print_bytes_per_second"] = rate if current is None else current + self.RATE_ALPHA * (rate - current)
+
+    def copy_gap(self, target: str, bytes_sent: int, send_seconds: float) -> float:
+        """
+        Pausa antes de la siguiente copia
+        """
+        stats = self._stats.get(target)
+        if stats is None:
+            return self.DEFAULT_COPY_GAP
+        if stats["status_supported"]:
+            return 0.0
+        if stats["print_bytes_per_second"]:
+            remaining = bytes_sent / stats["print_bytes_per_second"] - send_seconds
+            return min(self.MAX_COPY_GAP, max(0.0, remaining))
+        return self.DEFAULT_COPY_GAP
+
+    def snapshot(self) -> dict:
+        return {target: {k: v for k, v in stats.items() if k != "last_sent_at"} for target, stats in self._stats.items()}
+
+printer_pacing = PrinterPacing()
+
+class MetricsRegistry:
+    """
+    Métricas en memoria con el formato de exposición de Prometheus (sin dependencias).
+    Contadores, gauges e histogramas con etiquetas; cada observación es una búsqueda
+    en un diccionario y unas sumas, así que puede quedar activo en producción.
+    """
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        # nombre -> (tipo, descripción, buckets)
+        self._meta = OrderedDict()
+        # nombre -> {etiquetas -> valor | [conteos por bucket, suma, total]}
+        self._series = {}
+
+    def _register(self, name: str, kind: str, help_text: str, buckets=None):
+        self._meta[name] = (kind, help_text, buckets)
+        self._series[name] = {}
+
+    def counter(self, name: str, help_text: str):
+        self._register(name, "counter", help_text)
+
+    def gauge(self, name: str, help_text: str):
+        self._register(name, "gauge", help_text)
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self._register(name, "histogram", help_text, tuple(buckets))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        series = self._series[name]
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        self._series[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self._meta[name][2]
+        series = self._series[name]
+        key = tuple(sorted(labels.items()))
+        data = series.get(key)
+        if data is None:
+            data = series[key] = [[0] * len(buckets), 0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                data[0][i] += 1
+                break
+        data[1] += value
+        data[2] += 1
+
+    @staticmethod
+    def _labels(pairs) -> str:
+        if not pairs:
+            return ""
+        escaped = (
+            f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+            for k, v in pairs
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_text, buckets) in self._meta.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in self._series[name].items():
+                if kind != "histogram":
+                    lines.append(f"{name}{self._labels(key)} {value}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{self._labels(key + (('le', f'{bound:g}'),))} {cumulative}")
+                lines.append(f"{name}_bucket{self._labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{self._labels(key)} {total}")
+                lines.append(f"{name}_count{self._labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.histogram("printer_connect_seconds", "Tiempo de conexión TCP con la impresora")
+metrics.histogram("printer_send_seconds", "Tiempo de envío de una copia (conexión incluida)")
+metrics.histogram("printer_job_seconds", "Duración total de un trabajo (espera de la impresora, copias y pausas)")
+metrics.histogram("printer_lease_wait_seconds", "Espera hasta obtener la impresora (otro trabajo en curso)")
+metrics.counter("printer_copies_total", "Copias enviadas correctamente")
+metrics.counter("printer_bytes_total", "Bytes ESC/POS enviados")
+metrics.counter("printer_failures_total", "Envíos fallidos por motivo (timeout, refused, dns, busy, error)")
+metrics.gauge("printer_bytes_per_second", "Rendimiento de envío de la última copia")
+metrics.gauge("printer_jobs_in_flight", "Trabajos de impresión en curso en este proceso")
+metrics.counter("printer_reprint_cache_total", "Búsquedas de tickets para reimpresión por resultado (memory, disk, miss)")
+metrics.histogram("event_loop_lag_seconds", "Retraso del event loop respecto al intervalo de muestreo",
+                  buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+metrics.gauge("event_loop_lag_last_seconds", "Último retraso medido del event loop")
+metrics.set("printer_jobs_in_flight", 0)
+
+class EventLoopLagMonitor:
+    """
+    Mide cuánto se retrasa un sleep corto respecto a lo pedido: si el event loop
+    está bloqueado (p. ej. por trabajo de CPU) el retraso sube
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            metrics.observe("event_loop_lag_seconds", lag)
+            metrics.set("event_loop_lag_last_seconds", lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+loop_lag_monitor = EventLoopLagMonitor()
+
+# Trazas por etapa: "none" (desactivado), "console" (stdout) o "file" (JSON por línea en PRINTER_TRACE_FILE)
+PRINTER_TRACE_EXPORTER = os.environ.get("PRINTER_TRACE_EXPORTER", "none")
+PRINTER_TRACE_FILE = os.environ.get("PRINTER_TRACE_FILE", "printer_traces.jsonl")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+class Span:
+    """Un tramo de la traza (mismos campos que un span de OpenTelemetry en OTLP/JSON)"""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_span_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_span_id: Optional[str],
+                 start_ns: int, attributes: dict):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.start_ns = start_ns
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self, service_name: str) -> dict:
+        return {
+            "resource": {"service.name": service_name},
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "kind": f"SPAN_KIND_{self.kind}",
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": dict(self.attributes),
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error else {"code": "STATUS_CODE_OK"},
+        }
+
+class Tracer:
+    """
+    Trazas compatibles con OpenTelemetry sin dependencias ni colector: cada etapa del flujo
+    de impresión es un span con trace_id/span_id W3C. El trace_id se toma del header
+    'traceparent' entrante (p. ej. el del proxy de Vercel) para correlacionar ambos lados.
+    Los spans terminados se escriben como una línea JSON en consola o en un archivo desde
+    un hilo propio (cola acotada, como el logging): end() no escribe ni hace flush en el
+    event loop. Con la cola llena los spans se descartan y se cuentan en 'dropped'.
+    """
+
+    QUEUE_SIZE = 10000
+
+    def __init__(self, service_name: str, exporter: str = "none", path: Optional[str] = None):
+        self.service_name = service_name
+        self.exporter = exporter
+        self.path = path
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(self.QUEUE_SIZE)
+        self._writer = None
+
+    @staticmethod
+    def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+        """
+        Devuelve (trace_id, parent_span_id) de un header W3C 'traceparent' válido, o None
+        """
+        if not header:
+            return None
+        parts = header.strip().lower().split("-")
+        if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+            return None
+        trace_id, parent_id = parts[1], parts[2]
+        if len(trace_id) != 32 or len(parent_id) != 16:
+            return None
+        try:
+            int(trace_id, 16)
+            int(parent_id, 16)
+        except ValueError:
+            return None
+        if trace_id == "0" * 32 or parent_id == "0" * 16:
+            return None
+        return trace_id, parent_id
+
+    def start_span(self, name: str, traceparent: Optional[str] = None, kind: str = "INTERNAL",
+                   start_ns: Optional[int] = None, **attributes) -> Span:
+        remote = self.parse_traceparent(traceparent)
+        if remote is not None:
+            trace_id, parent_id = remote
+        else:
+            parent = _current_span.get()
+            if parent is not None:
+                trace_id, parent_id = parent.trace_id, parent.span_id
+            else:
+                trace_id, parent_id = os.urandom(16).hex(), None
+        return Span(name, kind, trace_id, parent_id, start_ns or time.time_ns(), attributes)
+
+    @contextmanager
+    def span(self, name: str, traceparent: Optional[str] = None, kind: str = "INTERNAL", **attributes):
+        """
+        Abre un span hijo del actual (o de 'traceparent') mientras dura el bloque
+        """
+        span = self.start_span(name, traceparent, kind, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = str(e) or type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end(span)
+
+    def record(self, name: str, start_ns: int, **attributes):
+        """
+        Registra a posteriori una etapa que ya terminó (p. ej. la espera de un lock)
+        """
+        self.end(self.start_span(name, start_ns=start_ns, **attributes))
+
+    def end(self, span: Span):
+        span.end_ns = time.time_ns()
+        if self.exporter == "none":
+            return
+        if self._writer is None:
+            self._start_writer()
+        try:
+            # El JSON se arma en el hilo escritor
+            self._queue.put_nowait(span.to_dict(self.service_name))
+        except queue.Full:
+            self.dropped += 1
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_spans, name="trace-exporter", daemon=True)
+                self._writer.start()
+                # Al salir se escriben los spans pendientes
+                atexit.register(self.close)
+
+    def _write_spans(self):
+        output = sys.stdout if self.exporter == "console" else open(self.path, "a", encoding="utf-8")
+        try:
+            while True:
+                entry = self._queue.get()
+                if entry is None:
+                    break
+                output.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+                # Un flush por ráfaga de spans, no por cada uno
+                if self._queue.empty():
+                    output.flush()
+        finally:
+            output.flush()
+            if output is not sys.stdout:
+                output.close()
+
+    def close(self, timeout: float = 5.0):
+        """
+        Escribe los spans pendientes y detiene el hilo escritor
+        """
+        writer = self._writer
+        if writer is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        writer.join(timeout)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+tracer = Tracer("printer-api", PRINTER_TRACE_EXPORTER, PRINTER_TRACE_FILE)
+
+# Eventos de trabajos e impresoras para clientes suscritos (SSE y WebSocket)
+PRINTER_EVENTS_HISTORY = int(os.environ.get("PRINTER_EVENTS_HISTORY", "256"))
+PRINTER_EVENTS_QUEUE_SIZE = int(os.environ.get("PRINTER_EVENTS_QUEUE_SIZE", "100"))
+PRINTER_EVENTS_HEARTBEAT = float(os.environ.get("PRINTER_EVENTS_HEARTBEAT", "15"))
+
+# Trabajo en curso (job_id = clave de idempotencia, boleta): lo heredan las tareas del trabajo
+current_print_job: ContextVar[dict] = ContextVar("current_print_job", default={})
+
+def log_context() -> dict:
+    """Campos que se añaden a cada registro de log: trabajo en curso y trace_id"""
+    context = dict(current_print_job.get())
+    span = _current_span.get()
+    if span is not None:
+        context["trace_id"] = span.trace_id
+    return context
+
+class EventSubscription:
+    """
+    Suscripción a eventos con filtros opcionales (impresoras, boletas, trabajos).
+    Cada suscriptor tiene su propia cola acotada: si un cliente lento la llena se
+    descartan sus eventos más antiguos y el resto de los suscriptores no se ve afectado.
+    """
+
+    def __init__(self, bus: "PrinterEventBus", printers=None, boletas=None, job_ids=None,
+                 queue_size: int = 100):
+        self.bus = bus
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.set_filters(printers, boletas, job_ids)
+
+    def set_filters(self, printers=None, boletas=None, job_ids=None):
+        self.printers = set(printers or ())
+        self.boletas = set(boletas or ())
+        self.job_ids = set(job_ids or ())
+
+    def matches(self, event: dict) -> bool:
+        if self.printers and event.get("printer") not in self.printers and event.get("printer_id") not in self.printers:
+            return False
+        if self.boletas and event.get("boleta") not in self.boletas:
+            return False
+        if self.job_ids and event.get("job_id") not in self.job_ids:
+            return False
+        return True
+
+    def put(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """
+        Siguiente evento, o None si no llega ninguno en 'timeout' segundos
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus._subscribers.discard(self)
+
+class PrinterEventBus:
+    """
+    Difunde los eventos de trabajos (job.queued, job.sending, job.printed, job.failed) y de
+    impresoras (printer.offline, printer.online) a los clientes suscritos por
+    /api/printer/events (SSE) o /api/printer/events/ws, para que la interfaz no tenga que
+    consultar periódicamente. Guarda los últimos eventos para que un cliente que se
+    reconecta (Last-Event-ID) o que se suscribe a un trabajo ya lanzado no pierda ninguno.
+    Con varios workers, cada evento se reenvía a los demás (ver WorkerAffinity.broadcast);
+    la numeración (seq / Last-Event-ID) es la del worker que atiende la conexión.
+    """
+
+    def __init__(self, history: int = 256, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._seq = 0
+        self._printer_online = {}
+
+    def _deliver(self, event: dict):
+        self._seq += 1
+        event = {"seq": self._seq, **event}
+        self._history.append(event)
+        for subscription in list(self._subscribers):
+            if subscription.matches(event):
+                subscription.put(event)
+
+    def publish(self, event_type: str, printer: Optional[str] = None, **fields):
+        event = {
+            "type": event_type,
+            "timestamp": datetime.now().isoformat(),
+            "printer": printer,
+            **current_print_job.get(),
+            **fields,
+        }
+        self._deliver(event)
+        worker_affinity.broadcast(event)
+
+    def receive(self, event: dict):
+        """
+        Evento publicado por otro worker
+        """
+        self._deliver(event)
+
+    def printer_status(self, printer: str, online: bool, message: str = "", **fields):
+        """
+        Publica printer.offline / printer.online solo cuando cambia el estado conocido
+        """
+        previous = self._printer_online.get(printer)
+        self._printer_online[printer] = online
+        if previous is None and online or previous == online:
+            return
+        self.publish("printer.online" if online else "printer.offline", printer, message=message, **fields)
+
+    def subscribe(self, printers=None, boletas=None, job_ids=None,
+                  last_event_id: Optional[int] = None) -> EventSubscription:
+        """
+        Registra un suscriptor. Recibe de inmediato los eventos guardados posteriores a
+        last_event_id, o todos los guardados del trabajo/boleta si filtra por ellos.
+        """
+        subscription = EventSubscription(self, printers, boletas, job_ids, self.queue_size)
+        if last_event_id is not None or subscription.job_ids or subscription.boletas:
+            after = last_event_id or 0
+            for event in self._history:
+                if event["seq"] > after and subscription.matches(event):
+                    subscription.put(event)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def snapshot(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "last_event_id": self._seq,
+            "printers_offline": [printer for printer, online in self._printer_online.items() if not online],
+        }
+
+event_bus = PrinterEventBus(PRINTER_EVENTS_HISTORY, PRINTER_EVENTS_QUEUE_SIZE)
+
+class ESCPOSStreamWriter:
+    """
+    Envía un payload ESC/POS por bloques con control de flujo.
+    Cada bloque se entrega completo al socket antes de escribir el siguiente (drain con
+    límite de buffer 0), así una impresora lenta frena al emisor en lugar de desbordar su
+    buffer de recepción y las escrituras parciales no truncan el ticket. Si la impresora
+    responde a DLE EOT 1, antes de enviar el trabajo se espera a que no reporte estar fuera
+    de línea. El estado solo se consulta al inicio: un DLE EOT entre bloques podría caer
+    dentro de un raster GS v 0 y la impresora lo tomaría como datos de imagen.
+    """
+
+    # Impresoras que no respondieron a DLE EOT -> momento del fallo (time.monotonic()).
+    # No se consulta su estado hasta pasados STATUS_RETRY_AFTER segundos: la falta de
+    # respuesta puede ser pasajera (impresora reiniciando, red con pérdidas)
+    status_unsupported = {}
+    STATUS_RETRY_AFTER = 300.0
+
+    STATUS_REPLY_TIMEOUT = 0.5
+    BUSY_POLL_INTERVAL = 0.1
+    # Un drain que tarda más que esto indica que la impresora cerró la ventana TCP (buffer lleno)
+    STALL_THRESHOLD = 0.02
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, target: str,
+                 chunk_size: int = 4096, timeout: float = 10, status_polling: bool = True,
+                 status_timeout: Optional[float] = None):
+        self.reader = reader
+        self.writer = writer
+        self.target = target
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.status_timeout = status_timeout or self.STATUS_REPLY_TIMEOUT
+        self.status_polling = status_polling and not self.status_probe_suspended(target)
+        # Resultado de la consulta de estado (None si no se consultó) y tiempo frenado por la impresora
+        self.status_supported = None
+        self.stalled_seconds = 0.0
+        # Sin buffer en el transporte: drain() espera a que el bloque llegue al kernel
+        writer.transport.set_write_buffer_limits(high=0)
+        # Y un buffer de envío del kernel del tamaño de un bloque, para que el freno de la
+        # impresora (ventana TCP llena) se note en drain() en lugar de quedar oculto ahí
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, chunk_size)
+            except OSError:
+                pass
+
+    async def _query_status(self) -> Optional[int]:
+        self.writer.write(ESCPOSCommands.STATUS_PRINTER)
+        await self.writer.drain()
+        try:
+            reply = await asyncio.wait_for(self.reader.read(1), self.status_timeout)
+        except asyncio.TimeoutError:
+            reply = b''
+        # Una respuesta válida de DLE EOT tiene el patrón 0xx1xx10
+        if not reply or (reply[0] & 0x93) != 0x12:
+            logger.info("Impresora %s no responde a DLE EOT, se envía sin consultar estado", self.target,
+                        extra={"printer": self.target})
+            self.status_unsupported[self.target] = time.monotonic()
+            self.status_polling = False
+            return None
+        self.status_unsupported.pop(self.target, None)
+        return reply[0]
+
+    @classmethod
+    def status_probe_suspended(cls, target: str) -> bool:
+        """
+        True si la impresora no respondió a DLE EOT hace menos de STATUS_RETRY_AFTER segundos
+        """
+        failed_at = cls.status_unsupported.get(target)
+        if failed_at is None:
+            return False
+        if time.monotonic() - failed_at >= cls.STATUS_RETRY_AFTER:
+            cls.status_unsupported.pop(target, None)
+            return False
+        return True
+
+    async def _wait_until_ready(self):
+        deadline = time.monotonic() + self.timeout
+        while self.status_polling:
+            status = await self._query_status()
+            self.status_supported = status is not None
+            # bit 3: fuera de línea (tapa abierta, sin papel, alimentando, buffer lleno)
+            if status is None or not status & 0x08:
+                return
+            if time.monotonic() >= deadline:
+                raise asyncio.TimeoutError(f"Impresora {self.target} ocupada o fuera de línea")
+            await asyncio.sleep(self.BUSY_POLL_INTERVAL)
+
+    async def write_all(self, data: bytes) -> int:
+        """
+        Envía todo el payload y devuelve los bytes escritos
+        """
+        view = memoryview(data)
+        sent = 0
+        await self._wait_until_ready()
+        while sent < len(data):
+            chunk = view[sent:sent + self.chunk_size]
+            self.writer.write(chunk)
+            drain_started = time.perf_counter()
+            await asyncio.wait_for(self.writer.drain(), self.timeout)
+            drained = time.perf_counter() - drain_started
+            if drained > self.STALL_THRESHOLD:
+                self.stalled_seconds += drained
+            sent += len(chunk)
+        return sent
+
+CUPS_IPP_MODE = os.environ.get("PRINTER_CUPS_IPP", "auto")  # auto | off
+CUPS_SERVER = os.environ.get("CUPS_SERVER", "")
+CUPS_JOB_TIMEOUT = float(os.environ.get("PRINTER_CUPS_JOB_TIMEOUT", "60"))
+CUPS_POLL_INTERVAL = float(os.environ.get("PRINTER_CUPS_POLL_INTERVAL", "0.25"))
+
+class CUPSTimeoutError(Exception):
+    """cupsd aceptó la solicitud pero no respondió a tiempo (el trabajo pudo quedar en cola)"""
+
+class CUPSIPPClient:
+    """
+    Cliente IPP asíncrono para el cupsd local: envía trabajos raw con Print-Job y sigue su
+    estado con Get-Jobs, en lugar de lanzar 'lp' y parsear 'lpstat' por cada ticket.
+    Una sola tarea consulta Get-Jobs (los trabajos no terminados de todas las colas) por
+    intervalo, sin importar cuántos trabajos se esperan; los que salen de la lista se
+    confirman con Get-Job-Attributes (completed, aborted o canceled).
+    CUPS_SERVER acepta 'host[:puerto]' o la ruta del socket Unix (como en CUPS); por defecto
+    se usa /run/cups/cups.sock si existe, si no localhost:631.
+    """
+
+    UNAVAILABLE_RETRY = 30.0
+
+    def __init__(self, server: str = "", job_timeout: float = 60.0, poll_interval: float = 0.25,
+                 request_timeout: float = 10.0):
+        if not server:
+            server = "/run/cups/cups.sock" if os.path.exists("/run/cups/cups.sock") else "localhost:631"
+        if server.startswith("/"):
+            self.socket_path, self.host, self.port = server, "localhost", 631
+        else:
+            host, _, port = server.partition(":")
+            self.socket_path, self.host, self.port = None, host, int(port or 631)
+        self.job_timeout = job_timeout
+        self.poll_interval = poll_interval
+        self.request_timeout = request_timeout
+        self.user = os.environ.get("USER") or "escpos-api"
+        self._request_id = 0
+        self._waiters = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._unavailable_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return IPP_AVAILABLE and time.monotonic() >= self._unavailable_until
+
+    def printer_uri(self, printer_name: str) -> str:
+        return f"ipp://localhost/printers/{printer_name}"
+
+    async def _call(self, operation: int, attributes: list, path: str = "/", data: bytes = b'',
+                    job_attributes: Optional[list] = None, connect_timeout: Optional[float] = None,
+                    timeout: Optional[float] = None):
+        """
+        Envía una solicitud IPP por HTTP (POST application/ipp) y devuelve la respuesta decodificada.
+        Si cupsd no acepta la conexión en connect_timeout se lanza ConnectionError; si no
+        responde en timeout, CUPSTimeoutError (así un cupsd colgado no retiene la impresora).
+        """
+        self._request_id += 1
+        groups = [(ipp.TAG_OPERATION, ipp.operation_attributes(user=self.user) + attributes)]
+        if job_attributes:
+            groups.append((ipp.TAG_JOB, job_attributes))
+        body = ipp.encode_message(operation, self._request_id, groups, data)
+        connect_timeout = connect_timeout or self.request_timeout
+        timeout = timeout or self.request_timeout
+        try:
+            if self.socket_path:
+                connect = asyncio.open_unix_connection(self.socket_path)
+            else:
+                connect = asyncio.open_connection(self.host, self.port)
+            reader, writer = await asyncio.wait_for(connect, connect_timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"cupsd no aceptó la conexión en {connect_timeout:.1f} s") from None
+        try:
+            status_line, payload = await asyncio.wait_for(self._exchange(reader, writer, path, body), timeout)
+        except asyncio.TimeoutError:
+            raise CUPSTimeoutError(f"cupsd no respondió en {timeout:.1f} s") from None
+        finally:
+            writer.close()
+        http_status = status_line.split(b" ")[1:2]
+        if http_status != [b"200"]:
+            raise ConnectionError(f"CUPS respondió {status_line.decode('latin-1').strip()}")
+        return ipp.decode_message(bytes(payload))
+
+    async def _exchange(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                        path: str, body: bytes) -> tuple:
+        # POST y lectura de la respuesta HTTP (línea de estado y cuerpo)
+        writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: localhost:{self.port}\r\n"
+            f"Content-Type: application/ipp\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("ascii") + body
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if "chunked" in headers.get("transfer-encoding", ""):
+            payload = bytearray()
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    break
+                payload += await reader.readexactly(size)
+                await reader.readline()
+        elif "content-length" in headers:
+            payload = await reader.readexactly(int(headers["content-length"]))
+        else:
+            payload = await reader.read()
+        return status_line, payload
+
+    @staticmethod
+    def _status_message(response) -> str:
+        message = response.attribute("status-message", ipp.TAG_OPERATION)
+        return message or f"estado IPP 0x{response.code:04x}"
+
+    async def print_job(self, printer_name: str, data: bytes, job_name: str = "Ticket",
+                        connect_timeout: Optional[float] = None, timeout: Optional[float] = None) -> dict:
+        """
+        Envía un trabajo raw (application/vnd.cups-raw) y devuelve su job-id y estado inicial
+        """
+        response = await self._call(
+            ipp.OP_PRINT_JOB,
+            [
+                ("printer-uri", ipp.TAG_URI, self.printer_uri(printer_name)),
+                ("job-name", ipp.TAG_NAME, job_name),
+                ("document-format", ipp.TAG_MIME_TYPE, "application/vnd.cups-raw"),
+            ],
+            path=f"/printers/{printer_name}",
+            data=data,
+            connect_timeout=connect_timeout,
+            timeout=timeout
+        )
+        if response.code > ipp.STATUS_OK_IGNORED:
+            return {"success": False, "message": self._status_message(response)}
+        return {
+            "success": True,
+            "job_id": response.attribute("job-id", ipp.TAG_JOB),
+            "job_state": response.attribute("job-state", ipp.TAG_JOB, ipp.JOB_PENDING),
+        }
+
+    async def get_jobs(self) -> dict:
+        """
+        Trabajos no terminados de todas las colas: {job_id: job_state}
+        """
+        response = await self._call(ipp.OP_GET_JOBS, [
+            ("printer-uri", ipp.TAG_URI, "ipp://localhost/"),
+            ("which-jobs", ipp.TAG_KEYWORD, "not-completed"),
+            ("requested-attributes", ipp.TAG_KEYWORD, ["job-id", "job-state"]),
+        ])
+        return {job["job-id"][0]: job.get("job-state", [ipp.JOB_PENDING])[0]
+                for job in response.group_list(ipp.TAG_JOB) if "job-id" in job}
+
+    async def get_job_state(self, job_id: int) -> tuple:
+        response = await self._call(ipp.OP_GET_JOB_ATTRIBUTES, [
+            ("job-uri", ipp.TAG_URI, f"ipp://localhost/jobs/{job_id}"),
+            ("requested-attributes", ipp.TAG_KEYWORD, ["job-state", "job-state-reasons"]),
+        ])
+        if response.code > ipp.STATUS_OK_IGNORED:
+            return None, self._status_message(response)
+        reasons = response.group_list(ipp.TAG_JOB)[0].get("job-state-reasons", []) if response.group_list(ipp.TAG_JOB) else []
+        return response.attribute("job-state", ipp.TAG_JOB), ", ".join(r for r in reasons if r)
+
+    async def get_printers(self) -> list:
+        """
+        Colas de CUPS con su estado (CUPS-Get-Printers)
+        """
+        response = await self._call(ipp.OP_CUPS_GET_PRINTERS, [
+            ("requested-attributes", ipp.TAG_KEYWORD,
+             ["printer-name", "printer-state", "printer-is-accepting-jobs", "printer-state-message"]),
+        ])
+        return [
+            {
+                "name": printer["printer-name"][0],
+                "state": ipp.PRINTER_STATE_NAMES.get(printer.get("printer-state", [None])[0], "unknown"),
+                "accepting_jobs": printer.get("printer-is-accepting-jobs", [True])[0],
+                "message": printer.get("printer-state-message", [""])[0],
+            }
+            for printer in response.group_list(ipp.TAG_PRINTER) if "printer-name" in printer
+        ]
+
+    async def _poll(self):
+        """
+        Resuelve las esperas de todos los trabajos con una consulta Get-Jobs por intervalo
+        """
+        try:
+            while self._waiters:
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    active = await self.get_jobs()
+                except (OSError, ValueError, CUPSTimeoutError) as e:
+                    logger.warning("Error consultando trabajos en CUPS: %s", e)
+                    continue
+                for job_id in list(self._waiters):
+                    if job_id in active and active[job_id] not in ipp.TERMINAL_JOB_STATES:
+                        continue
+                    try:
+                        state, reasons = await self.get_job_state(job_id)
+                    except (OSError, ValueError, CUPSTimeoutError) as e:
+                        logger.warning("Error consultando el trabajo %s en CUPS: %s", job_id, e)
+                        continue
+                    future = self._waiters.pop(job_id, None)
+                    if future is not None and not future.done():
+                        future.set_result((state, reasons))
+        finally:
+            self._poller = None
+
+    async def wait_job(self, job_id: int, timeout: float) -> tuple:
+        """
+        Espera el estado final del trabajo: (job_state, motivos). Si vence el plazo
+        devuelve el último estado conocido (el trabajo sigue en la cola de CUPS).
+        """
+        future = self._waiters.get(job_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[job_id] = future
+        if self._poller is None:
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self._waiters.pop(job_id, None)
+            return ipp.JOB_PROCESSING, "timeout"
+
+    async def print_raw(self, printer_name: str, data: bytes, connect_timeout: Optional[float] = None,
+                        timeout: Optional[float] = None) -> Optional[dict]:
+        """
+        Imprime y espera a que CUPS termine el trabajo. Devuelve None si cupsd no responde
+        (el llamador usa 'lp'); mientras tanto no se vuelve a intentar por UNAVAILABLE_RETRY segundos.
+        Si cupsd acepta la conexión pero no responde en timeout se devuelve un error con
+        reason "timeout" sin usar 'lp', porque el trabajo pudo quedar en cola (evita duplicados).
+        """
+        try:
+            with tracer.span("cups.print_job", printer=printer_name) as span:
+                submitted = await self.print_job(printer_name, data, connect_timeout=connect_timeout, timeout=timeout)
+                if submitted["success"]:
+                    span.set(job_id=submitted["job_id"])
+        except CUPSTimeoutError as e:
+            logger.warning("CUPS no respondió al enviar a '%s': %s", printer_name, e)
+            self._unavailable_until = time.monotonic() + self.UNAVAILABLE_RETRY
+            return {"success": False, "reason": "timeout",
+                    "message": f"Timeout esperando respuesta de CUPS para '{printer_name}': {e}"}
+        except (OSError, ValueError) as e:
+            logger.warning("CUPS no disponible por IPP (%s), se usa 'lp'", e)
+            self._unavailable_until = time.monotonic() + self.UNAVAILABLE_RETRY
+            return None
+        if not submitted["success"]:
+            return {"success": False, "message": f"CUPS rechazó el trabajo: {submitted['message']}"}
+
+        job_id = submitted["job_id"]
+        state = submitted["job_state"]
+        reasons = ""
+        if state not in ipp.TERMINAL_JOB_STATES:
+            with tracer.span("cups.wait_job", job_id=job_id):
+                state, reasons = await self.wait_job(job_id, self.job_timeout)
+        state_name = ipp.JOB_STATE_NAMES.get(state, "unknown")
+        result = {"job_id": job_id, "job_state": state_name, "bytes_sent": len(data)}
+        if state in (ipp.JOB_ABORTED, ipp.JOB_CANCELED):
+            detail = f" ({reasons})" if reasons else ""
+            return {**result, "success": False, "reason": "error",
+                    "message": f"Trabajo {job_id} {state_name} en '{printer_name}'{detail}"}
+        if state == ipp.JOB_COMPLETED:
+            # CUPS ya entregó el trabajo completo: no hace falta pausar entre copias
+            return {**result, "success": True, "status_supported": True,
+                    "message": f"Ticket impreso en impresora USB '{printer_name}' (trabajo {job_id})"}
+        return {**result, "success": True,
+                "message": f"Ticket en cola de '{printer_name}' (trabajo {job_id}, {state_name})"}
+
+cups_client = CUPSIPPClient(CUPS_SERVER, CUPS_JOB_TIMEOUT, CUPS_POLL_INTERVAL)
+
+def cups_ipp_enabled() -> bool:
+    return CUPS_IPP_MODE != "off" and platform.system() != "Windows" and cups_client.available
+
+TICKET_LOGO_PATH = "logo_escpos.bin"
+
+class FileAssetCache:
+    """
+    Archivos de apoyo (logos ESC/POS) en memoria: se leen una vez y se vuelven a leer
+    solo si cambia su fecha de modificación. Lo comparten todos los servicios del proceso.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def read(self, path: str) -> Optional[bytes]:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._entries.pop(path, None)
+            return None
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != mtime:
+            with open(path, "rb") as f:
+                entry = (mtime, f.read())
+            self._entries[path] = entry
+        return entry[1]
+
+asset_cache = FileAssetCache()
+
+# Logos convertidos por perfil de impresora (scripts/convert_logo_escpos.py en modo por lotes)
+PRINTER_LOGO_MANIFEST = os.environ.get("PRINTER_LOGO_MANIFEST", os.path.join("logos_escpos", "manifest.json"))
+PRINTER_LOGO_NAME = os.environ.get("PRINTER_LOGO_NAME", "logo")
+
+class LogoManifest:
+    """
+    Manifiesto de logos por perfil: se carga al arrancar y, para cada ticket sin logo
+    propio, da el logo convertido para el ancho de la impresora (58 u 80 mm, 203 o 300 dpi).
+    Sin manifiesto (o sin entrada para ese ancho) se usa logo_escpos.bin como hasta ahora.
+    """
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+        self._by_width = {}
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f).get("logos", {}).get(self.name, {})
+        except FileNotFoundError:
+            self._by_width = {}
+            return
+        except (OSError, ValueError, AttributeError) as e:
+            logger.error("Manifiesto de logos %s inválido, se usa logo_escpos.bin: %s", self.path, e)
+            return
+        base_dir = os.path.dirname(self.path)
+        by_width = {}
+        # Si hay varios perfiles con el mismo ancho (p. ej. umbral y tramado) gana el primero
+        for entry in entries.values():
+            by_width.setdefault(entry["dots_per_line"], os.path.join(base_dir, entry["file"]))
+        self._by_width = by_width
+        logger.info("Manifiesto de logos cargado: '%s' para %s puntos por línea", self.name, sorted(by_width))
 
-class PrintResponse(BaseModel):
-    success: bool
-    message: str
-    printer_ip: str
-    timestamp: str
-
-class ESCPOSCommands:
-    """Comandos ESC/POS básicos"""
-    INIT = b'\x1B\x40'  # Inicializar impresora
-    ALIGN_LEFT = b'\x1B\x61\x00'
-    ALIGN_CENTER = b'\x1B\x61\x01'
-    ALIGN_RIGHT = b'\x1B\x61\x02'
-    BOLD_ON = b'\x1B\x45\x01'
-    BOLD_OFF = b'\x1B\x45\x00'
-    UNDERLINE_ON = b'\x1B\x2D\x01'
-    UNDERLINE_OFF = b'\x1B\x2D\x00'
-    FONT_SMALL = b'\x1B\x4D\x01'
-    FONT_NORMAL = b'\x1B\x4D\x00'
-    LINE_FEED = b'\x0A'
-    CUT_PAPER = b'\x1D\x56\x41\x00'  # Corte total
-    DOUBLE_HEIGHT = b'\x1B\x21\x10'
-    DOUBLE_WIDTH = b'\x1B\x21\x20'
-    NORMAL_SIZE = b'\x1B\x21\x00'
+    def logo_for(self, dots_per_line: int) -> Optional[bytes]:
+        path = self._by_width.get(dots_per_line)
+        return asset_cache.read(path) if path else None
+
+logo_manifest = LogoManifest(PRINTER_LOGO_MANIFEST, PRINTER_LOGO_NAME)
 
 class ESCPOSPrinterService:
 
@@ -106,15 +1325,18 @@ class ESCPOSPrinterService:
             return []
             
         except Exception as e:
-            logger.error(f"Error listando impresoras: {e}")
+            logger.error("Error listando impresoras: %s", e)
             return []
 
     @staticmethod
-    async def send_to_usb_printer(printer_name: str, data: bytes) -> dict:
+    async def send_to_usb_printer(printer_name: str, data: bytes, timeout: Optional[float] = None,
+                                  connect_timeout: Optional[float] = None) -> dict:
         """
         Envía datos directamente a impresora USB
-        Soporta Windows, macOS y Linux
+        Soporta Windows, macOS y Linux (por IPP a CUPS, o 'lp' si cupsd no responde por IPP)
+        timeout y connect_timeout limitan la espera de cupsd (como en el envío por TCP)
         """
+        started = time.perf_counter()
         try:
             system = platform.system()
             
@@ -135,7 +1357,8 @@ class ESCPOSPrinterService:
                             win32print.EndPagePrinter(hPrinter)
                         finally:
                             win32print.EndDocPrinter(hPrinter)
-                            
+                        
+                        throughput_stats.record(f"USB:{printer_name}", len(data), time.perf_counter() - started)
                         return {
                             "success": True,
                             "message": f"Ticket enviado a impresora USB '{printer_name}'",
@@ -157,6 +1380,15 @@ class ESCPOSPrinterService:
                     }
             
             else:  # macOS y Linux
+                if cups_ipp_enabled():
+                    result = await cups_client.print_raw(
+                        printer_name, data, connect_timeout=connect_timeout, timeout=timeout
+                    )
+                    if result is not None:
+                        if result["success"]:
+                            throughput_stats.record(f"USB:{printer_name}", len(data), time.perf_counter() - started)
+                        return result
+
                 process = subprocess.Popen(
                     ['lp', '-d', printer_name, '-o', 'raw'],
                     stdin=subprocess.PIPE,
@@ -167,6 +1399,7 @@ class ESCPOSPrinterService:
                 stdout, stderr = process.communicate(input=data)
                 
                 if process.returncode == 0:
+                    throughput_stats.record(f"USB:{printer_name}", len(data), time.perf_counter() - started)
                     return {
                         "success": True,
                         "message": f"Ticket enviado a impresora USB '{printer_name}'",
@@ -181,121 +1414,166 @@ class ESCPOSPrinterService:
                     
         except Exception as e:
             error_msg = f"Error al enviar a impresora USB: {str(e)}"
-            logger.error(error_msg)
+            logger.error("Error al enviar a impresora USB %s: %s", printer_name, e,
+                         extra={"printer": f"USB:{printer_name}", "reason": "error"})
             return {"success": False, "message": error_msg}
 
     @staticmethod
-    async def send_escpos_command(ip: str, port: int, escpos_data: bytes, timeout: int = 10) -> dict:
+    async def send_escpos_command(ip: str, port: int, escpos_data: bytes, timeout: int = 10,
+                                  chunk_size: int = 4096, status_polling: bool = True,
+                                  connect_timeout: Optional[float] = None,
+                                  status_timeout: Optional[float] = None) -> dict:
         """
-        Envía comandos ESC/POS a la impresora via TCP
+        Envía comandos ESC/POS a la impresora via TCP, por bloques y con control de flujo.
+        connect_timeout acota la conexión (por defecto 'timeout') y status_timeout la espera
+        de respuesta a DLE EOT; 'timeout' sigue limitando cada bloque y la espera a que esté lista.
         """
+        target = f"{ip}:{port}"
+        writer = None
+        connect_timeout = connect_timeout or timeout
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(timeout)
+            logger.info("Conectando a impresora %s", target, extra={"printer": target})
+            connect_started = time.perf_counter()
+            with tracer.span("printer.connect", timeout=connect_timeout,
+                             **{"net.peer.name": ip, "net.peer.port": port}):
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), connect_timeout)
+            connect_seconds = time.perf_counter() - connect_started
             
-            logger.info(f"Conectando a impresora {ip}:{port}")
-            sock.connect((ip, port))
-            
-            sock.send(escpos_data)
-            logger.info(f"Enviado {len(escpos_data)} bytes de comandos ESC/POS")
-            
-            sock.close()
+            started = time.perf_counter()
+            with tracer.span("printer.send", bytes=len(escpos_data), chunk_size=chunk_size,
+                             status_polling=status_polling) as span:
+                stream = ESCPOSStreamWriter(
+                    reader, writer, target,
+                    chunk_size=chunk_size, timeout=timeout, status_polling=status_polling,
+                    status_timeout=status_timeout
+                )
+                bytes_sent = await stream.write_all(escpos_data)
+                # close() vacía lo pendiente antes de cerrar la conexión
+                writer.close()
+                await asyncio.wait_for(writer.wait_closed(), timeout)
+                span.set(stalled_seconds=round(stream.stalled_seconds, 4))
+            send_seconds = time.perf_counter() - started
+            bytes_per_second = throughput_stats.record(target, bytes_sent, send_seconds)
+            logger.info("Enviado %d bytes de comandos ESC/POS a %s (%.0f B/s)", bytes_sent, target, bytes_per_second,
+                        extra={"printer": target, "bytes": bytes_sent, "send_seconds": round(send_seconds, 4)})
             
-            return {
+            result = {
                 "success": True,
-                "message": f"Ticket enviado exitosamente a {ip}:{port}",
-                "bytes_sent": len(escpos_data)
+                "message": f"Ticket enviado exitosamente a {target}",
+                "bytes_sent": bytes_sent,
+                "bytes_per_second": bytes_per_second,
+                "connect_seconds": connect_seconds,
+                "send_seconds": send_seconds,
+                "stalled": stream.stalled_seconds > 0
             }
+            if stream.status_supported is not None:
+                result["status_supported"] = stream.status_supported
+            elif ESCPOSStreamWriter.status_probe_suspended(target):
+                result["status_supported"] = False
+            return result
             
-        except socket.timeout:
-            error_msg = f"Timeout al conectar con impresora {ip}:{port}"
-            logger.error(error_msg)
-            return {"success": False, "message": error_msg}
+        except (socket.timeout, asyncio.TimeoutError) as e:
+            error_msg = str(e) or f"Timeout al conectar con impresora {target}"
+            logger.error("Timeout con impresora %s: %s", target, error_msg, extra={"printer": target, "reason": "timeout"})
+            return {"success": False, "message": error_msg, "reason": "timeout"}
             
         except socket.gaierror as e:
             error_msg = f"Error de resolución DNS para {ip}: {str(e)}"
-            logger.error(error_msg)
-            return {"success": False, "message": error_msg}
+            logger.error("Error de resolución DNS para %s", ip, extra={"printer": target, "reason": "dns"})
+            return {"success": False, "message": error_msg, "reason": "dns"}
             
         except ConnectionRefusedError:
-            error_msg = f"Conexión rechazada por impresora {ip}:{port}"
-            logger.error(error_msg)
-            return {"success": False, "message": error_msg}
+            error_msg = f"Conexión rechazada por impresora {target}"
+            logger.error("Conexión rechazada por impresora %s", target, extra={"printer": target, "reason": "refused"})
+            return {"success": False, "message": error_msg, "reason": "refused"}
             
         except Exception as e:
             error_msg = f"Error inesperado: {str(e)}"
-            logger.error(error_msg)
-            return {"success": False, "message": error_msg}
+            logger.error("Error inesperado con impresora %s: %s", target, type(e).__name__,
+                         extra={"printer": target, "reason": "error", "error": str(e)})
+            return {"success": False, "message": error_msg, "reason": "error"}
         
         finally:
-            try:
-                sock.close()
-            except:
-                pass
+            if writer is not None and not writer.is_closing():
+                writer.close()
     
     def generate_ticket_escpos(self, producto: str, fecha: str, boleta: str, 
                                cliente: str, destino: str, placas: str, 
-                               vehiculo: str, chofer: str, logo_base64: Optional[str] = None) -> bytes:
+                               vehiculo: str, chofer: str, logo_base64: Optional[str] = None,
+                               code_page: str = "cp850", logo_data: Optional[bytes] = None,
+                               symbol_data: Optional[bytes] = None,
+                               raster_profile: Optional[PrinterProfile] = None) -> bytes:
         """
         Genera un ticket en formato ESC/POS incluyendo el logo al inicio.
-        Si se proporciona logo_base64, se usa ese. Si no, intenta cargar desde archivo.
+        Si se proporciona logo_data (binario) o logo_base64, se usa ese. Si no, intenta cargar desde archivo.
+        El texto se codifica con la página de códigos indicada, que se selecciona con ESC t n.
+        symbol_data (ver boleta_symbol_escpos) se imprime al final, antes del corte.
+        Con raster_profile el logo se compacta para esa impresora (ver profile_raster).
         """
         cmd = ESCPOSCommands
+        encoder = get_code_page_encoder(code_page)
+        encode = encoder.encode
         ticket = b''
         
-        # Inicializar impresora
+        # Inicializar impresora y seleccionar página de códigos (una vez por trabajo)
         ticket += cmd.INIT
+        ticket += encoder.select_command
 
         # Logo centrado
         logo_added = False
+
+        def add_logo(data: bytes) -> bytes:
+            return cmd.ALIGN_CENTER + (profile_raster(data, raster_profile) if raster_profile else data) + cmd.LINE_FEED
         
+        # Logo binario (subida multipart o manifiesto de logos): se usa tal cual, sin decodificar
+        if logo_data:
+            ticket += add_logo(logo_data)
+            logger.info("Logo binario: %d bytes", len(logo_data))
+            logo_added = True
+
         # Intentar usar logo del request (base64)
-        if logo_base64:
+        if logo_base64 and not logo_added:
             try:
                 # Decodificar base64
-                logo_data = base64.b64decode(logo_base64)
-                ticket += cmd.ALIGN_CENTER
-                ticket += logo_data
-                ticket += cmd.LINE_FEED
-                logger.info(f"Logo cargado desde request: {len(logo_data)} bytes")
+                with tracer.span("ticket.logo_decode", base64_chars=len(logo_base64)):
+                    logo_data = base64.b64decode(logo_base64)
+                ticket += add_logo(logo_data)
+                logger.info("Logo cargado desde request: %d bytes", len(logo_data))
                 logo_added = True
             except Exception as e:
-                logger.warning(f"Error al decodificar logo del request: {e}")
+                logger.warning("Error al decodificar logo del request: %s", e)
         
         # Si no se pudo usar el logo del request, intentar cargar desde archivo
         if not logo_added:
-            try:
-                with open("logo_escpos.bin", "rb") as f:
-                    logo_data = f.read()
-                ticket += cmd.ALIGN_CENTER
-                ticket += logo_data
-                ticket += cmd.LINE_FEED
-                logger.info(f"Logo cargado desde archivo: {len(logo_data)} bytes")
-            except FileNotFoundError:
+            logo_data = asset_cache.read(TICKET_LOGO_PATH)
+            if logo_data is not None:
+                ticket += add_logo(logo_data)
+                logger.info("Logo cargado desde archivo: %d bytes", len(logo_data))
+            else:
                 logger.warning("No se encontró logo_escpos.bin, se omitirá el logo")
 
         # Encabezado
         ticket += cmd.ALIGN_CENTER
         ticket += cmd.BOLD_ON
         ticket += cmd.DOUBLE_HEIGHT
-        ticket += "Aceites y Proteínas\n".encode('cp850', errors='replace')
+        ticket += encode("Aceites y Proteínas\n")
         ticket += cmd.NORMAL_SIZE
-        ticket += "S.A. de C.V.\n".encode('cp850', errors='replace')
+        ticket += encode("S.A. de C.V.\n")
         ticket += cmd.BOLD_OFF
         ticket += cmd.LINE_FEED
 
         # Línea separadora
         ticket += cmd.ALIGN_LEFT
-        ticket += ("=" * 48 + "\n").encode('cp850', errors='replace')
+        ticket += encode("=" * 48 + "\n")
 
         # Datos del ticket
         def info_line(label, value):
-            return cmd.BOLD_ON + f"{label:<9}: ".encode('cp850', errors='replace') + cmd.BOLD_OFF + f"{value}\n".encode('cp850', errors='replace')
+            return cmd.BOLD_ON + encode(f"{label:<9}: ") + cmd.BOLD_OFF + encode(f"{value}\n")
 
         ticket += info_line("PRODUCTO", producto)
         ticket += info_line("FECHA", fecha)
         ticket += info_line("BOLETA", boleta)
-        ticket += ("=" * 48 + "\n").encode('cp850', errors='replace')
+        ticket += encode("=" * 48 + "\n")
         ticket += info_line("CLIENTE", cliente)
         ticket += info_line("DESTINO", destino)
         ticket += info_line("PLACAS", placas)
@@ -303,7 +1581,12 @@ class ESCPOSPrinterService:
         ticket += info_line("CHOFER", chofer)
 
         # Línea separadora final
-        ticket += ("=" * 48 + "\n").encode('cp850', errors='replace')
+        ticket += encode("=" * 48 + "\n")
+
+        # Código de la boleta (código de barras o QR)
+        if symbol_data:
+            ticket += cmd.LINE_FEED
+            ticket += symbol_data
 
         # Espacio y corte
         ticket += cmd.LINE_FEED * 5
@@ -311,102 +1594,1067 @@ class ESCPOSPrinterService:
 
         return ticket
 
-printer_service = ESCPOSPrinterService()
+class PrintJobCache:
+    """
+    Caché acotado (TTL + tamaño máximo) de trabajos de impresión en curso y completados.
+    Si el cliente reintenta el mismo ticket (p. ej. tras el timeout del proxy de Vercel)
+    se devuelve el resultado existente o se espera al trabajo en curso en lugar de imprimir de nuevo.
+    """
 
-@app.post("/api/printer/print-ticket", response_model=PrintResponse)
-async def print_ticket(request: TicketPrintRequest):
+    def __init__(self, ttl_seconds: float = 120.0, max_entries: int = 512):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # clave -> (tarea, instante de expiración; None mientras está en curso)
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+
+    def _purge(self):
+        now = time.monotonic()
+        for key in list(self._entries):
+            task, expires_at = self._entries[key]
+            if expires_at is not None and expires_at <= now:
+                del self._entries[key]
+
+        # Si sigue lleno, descartar los completados más antiguos (nunca los que están en curso)
+        if len(self._entries) > self.max_entries:
+            for key in list(self._entries):
+                if len(self._entries) <= self.max_entries:
+                    break
+                if self._entries[key][0].done():
+                    del self._entries[key]
+
+    def _on_done(self, key: str, task: asyncio.Task):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is not task:
+            return
+        # Los trabajos fallidos o cancelados no se guardan: un reintento debe volver a imprimir
+        if task.cancelled() or task.exception() is not None:
+            del self._entries[key]
+        else:
+            entry[1] = time.monotonic() + self.ttl_seconds
+
+    def get_or_start(self, key: str, job_factory: Callable[[], Awaitable["PrintResponse"]]) -> tuple:
+        """
+        Devuelve (tarea, reutilizada). Si ya existe un trabajo vigente con la misma clave
+        se devuelve ese; si no, se lanza uno nuevo con job_factory.
+        """
+        self._purge()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry[0], True
+
+        task = asyncio.ensure_future(job_factory())
+        self._entries[key] = [task, None]
+        task.add_done_callback(lambda t: self._on_done(key, t))
+        return task, False
+
+def derive_idempotency_key(request: TicketPrintRequest) -> str:
     """
-    Imprime un ticket térmico con información de boleta
+    Deriva una clave de idempotencia a partir de boleta + copias + destino de impresión
     """
-    try:
-        escpos_data = printer_service.generate_ticket_escpos(
-            producto=request.producto,
-            fecha=request.fecha,
-            boleta=request.boleta,
-            cliente=request.cliente,
-            destino=request.destino,
-            placas=request.placas,
-            vehiculo=request.vehiculo,
-            chofer=request.chofer,
-            logo_base64=request.logo
-        )
-        
-        if request.printer_config.connection_type == "usb":
-            if not request.printer_config.printer_name:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Debe especificar 'printer_name' para conexión USB"
-                )
-            
-            for i in range(request.copias):
-                result = await printer_service.send_to_usb_printer(
-                    printer_name=request.printer_config.printer_name,
-                    data=escpos_data
-                )
-                if not result["success"]:
-                    raise HTTPException(
-                        status_code=500,
-                        detail=f"Error en copia {i+1}: {result['message']}"
-                    )
-                if i < request.copias - 1:
-                    await asyncio.sleep(0.5)
-            
-            return PrintResponse(
-                success=True,
-                message=f"Ticket impreso exitosamente ({request.copias} copia(s))",
-                printer_ip=f"USB:{request.printer_config.printer_name}",
-                timestamp=datetime.now().isoformat()
+    config = request.printer_config
+    if config.printer_id:
+        target = f"printer:{config.printer_id}"
+    elif config.connection_type == "usb":
+        target = f"usb:{config.printer_name}"
+    else:
+        target = f"network:{config.ip}:{config.port}"
+    raw = f"{request.boleta}|{request.copias}|{target}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def printer_target(config: PrinterConfig) -> str:
+    """
+    Identificador de la impresora destino ('IP:PUERTO' o 'USB:NOMBRE')
+    """
+    if config.connection_type == "usb":
+        if not config.printer_name:
+            raise HTTPException(
+                status_code=400,
+                detail="Debe especificar 'printer_name' para conexión USB"
             )
-        
+        return f"USB:{config.printer_name}"
+    if not config.ip:
+        raise HTTPException(
+            status_code=400,
+            detail="Debe especificar 'ip' para conexión de red"
+        )
+    return f"{config.ip}:{config.port}"
+
+# Directorio compartido por todos los workers para locks y sockets internos
+PRINTER_REGISTRY_PATH = os.environ.get("PRINTER_REGISTRY_PATH", "printers.json")
+PRINTER_REGISTRY_POLL_INTERVAL = float(os.environ.get("PRINTER_REGISTRY_POLL_INTERVAL", "2"))
+PRINTER_DNS_TTL = float(os.environ.get("PRINTER_DNS_TTL", "300"))
+
+# Ancho imprimible (mm) de cada ancho de papel, como en scripts/convert_logo_escpos.py
+PRINTABLE_WIDTH_MM = {58: 48, 80: 72}
+
+class RegisteredPrinter(BaseModel):
+    """Impresora del registro del servidor (archivo JSON, ver printers.example.json)"""
+    connection_type: Literal["network", "usb"] = "network"
+    host: Optional[str] = Field(None, description="IP o nombre DNS (solo network)")
+    port: int = 9100
+    timeout: int = 10
+    printer_name: Optional[str] = Field(None, description="Nombre de la impresora USB")
+    profile: str = "default"
+    code_page: Optional[str] = None
+    paper_width_mm: Optional[int] = Field(None, description="Ancho del papel en mm (58 u 80)")
+    dpi: int = Field(default=203, description="Resolución del cabezal")
+    dots_per_line: Optional[int] = Field(None, description="Puntos por línea (si no, se calcula del papel y los dpi o se usa el del perfil)")
+    chunk_size: Optional[int] = Field(None, ge=64, description="Tamaño de bloque TCP (si no, el del perfil)")
+    status_polling: Optional[bool] = Field(None, description="Consultar DLE EOT (si no, lo que diga el perfil)")
+    native_barcodes: Optional[bool] = Field(None, description="Códigos de barras nativos GS k (si no, lo que diga el perfil)")
+    native_2d: Optional[bool] = Field(None, description="QR/PDF417 nativos GS ( k (si no, lo que diga el perfil)")
+    compact_raster: Optional[bool] = Field(None, description="Raster compactado (si no, lo que diga el perfil)")
+    graphics_buffer: Optional[bool] = Field(None, description="Gráficos GS ( L / GS 8 L (si no, lo que diga el perfil)")
+    feed_in_dots: Optional[bool] = Field(None, description="ESC J n avanza n puntos (si no, lo que diga el perfil)")
+    description: Optional[str] = None
+
+class PrinterRegistry:
+    """
+    Registro de impresoras por id lógico, leído de un archivo JSON que se recarga al cambiar.
+    Cada impresora se valida una vez al cargar (configuración y perfil ya resueltos) y su
+    nombre DNS se resuelve por adelantado y se renueva cada PRINTER_DNS_TTL segundos,
+    así las solicitudes solo mandan 'printer_id' y conectar no requiere resolver el nombre.
+    Si el archivo tiene errores se conserva el registro anterior; si una resolución falla
+    se sigue usando la última dirección conocida.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 2.0, dns_ttl: float = 300.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.dns_ttl = dns_ttl
+        self._printers = {}
+        self._mtime = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _build(self, printer_id: str, printer: RegisteredPrinter, address: Optional[str]) -> dict:
+        config = PrinterConfig(
+            printer_id=printer_id,
+            connection_type=printer.connection_type,
+            ip=address or printer.host,
+            port=printer.port,
+            timeout=printer.timeout,
+            printer_name=printer.printer_name,
+            profile=printer.profile,
+            code_page=printer.code_page
+        )
+        printer_target(config)
+        profile = resolve_printer_profile(config.model_copy(update={"printer_id": None}))
+        overrides = {k: getattr(printer, k) for k in ("chunk_size", "status_polling", "native_barcodes", "native_2d",
+                                                     "compact_raster", "graphics_buffer", "feed_in_dots")
+                     if getattr(printer, k) is not None}
+        dots_per_line = printer.dots_per_line
+        if dots_per_line is None and printer.paper_width_mm in PRINTABLE_WIDTH_MM:
+            dots_per_line = PRINTABLE_WIDTH_MM[printer.paper_width_mm] * round(printer.dpi / 25.4)
+        if dots_per_line is not None:
+            overrides["dots_per_line"] = dots_per_line
+        return {
+            "printer": printer,
+            "config": config,
+            "profile": profile.model_copy(update=overrides),
+            "address": address,
+            "resolved_at": time.monotonic() if address else None,
+        }
+
+    def load(self) -> bool:
+        """
+        Lee el archivo si cambió. Devuelve True si el registro se reemplazó.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            if self._printers:
+                logger.warning("Registro de impresoras %s eliminado, se vacía el registro", self.path)
+            self._printers, self._mtime = {}, None
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f).get("printers", {})
+        except (OSError, ValueError, AttributeError) as e:
+            logger.error("Registro de impresoras %s inválido, se conserva el anterior: %s", self.path, e)
+            return False
+
+        printers = {}
+        for printer_id, data in raw.items():
+            try:
+                printer = RegisteredPrinter(**data)
+                previous = self._printers.get(printer_id)
+                # Si el host no cambió se conserva la dirección ya resuelta
+                address = previous["address"] if previous and previous["printer"].host == printer.host else None
+                entry = self._build(printer_id, printer, address)
+                if address:
+                    entry["resolved_at"] = previous["resolved_at"]
+                printers[printer_id] = entry
+            except (ValidationError, HTTPException, TypeError) as e:
+                detail = getattr(e, "detail", e)
+                logger.error("Impresora '%s' del registro inválida, se omite: %s", printer_id, detail,
+                             extra={"printer": printer_id})
+        self._printers = printers
+        logger.info("Registro de impresoras cargado: %d impresora(s) desde %s", len(printers), self.path)
+        return True
+
+    async def _resolve(self, printer_id: str, entry: dict):
+        printer = entry["printer"]
+        try:
+            ipaddress.ip_address(printer.host)
+            address = printer.host
+        except ValueError:
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(printer.host, printer.port, type=socket.SOCK_STREAM)
+                address = infos[0][4][0]
+            except (socket.gaierror, OSError) as e:
+                logger.warning("No se pudo resolver %s (%s): %s; se usa la última dirección conocida",
+                               printer.host, printer_id, e, extra={"printer": printer_id, "reason": "dns"})
+                entry["resolved_at"] = time.monotonic()
+                return
+        if address != entry["address"]:
+            if entry["address"]:
+                logger.info("Impresora %s: %s ahora resuelve a %s", printer_id, printer.host, address,
+                            extra={"printer": printer_id})
+            entry["config"] = entry["config"].model_copy(update={"ip": address})
+            entry["address"] = address
+        entry["resolved_at"] = time.monotonic()
+
+    async def refresh(self, force: bool = False):
+        """
+        Recarga el archivo si cambió y renueva las direcciones con TTL vencido
+        (con force, relee el archivo y resuelve todas)
+        """
+        if force:
+            self._mtime = None
+        self.load()
+        now = time.monotonic()
+        pending = [
+            self._resolve(printer_id, entry) for printer_id, entry in self._printers.items()
+            if entry["printer"].connection_type == "network" and entry["printer"].host
+            and (force or entry["resolved_at"] is None or now - entry["resolved_at"] >= self.dns_ttl)
+        ]
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Error actualizando el registro de impresoras: %s", e)
+
+    async def start(self):
+        await self.refresh(force=True)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def get(self, printer_id: str) -> dict:
+        if self._task is None:
+            # Sin tarea de actualización (p. ej. importado desde otro servicio): se lee al usarlo
+            self.load()
+        entry = self._printers.get(printer_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail=f"Impresora no registrada: '{printer_id}'")
+        return entry
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            printer_id: {
+                **entry["printer"].model_dump(),
+                "address": entry["address"],
+                "resolved_age_s": round(now - entry["resolved_at"], 1) if entry["resolved_at"] else None,
+                "code_page": entry["profile"].code_page,
+                "chunk_size": entry["profile"].chunk_size,
+                "status_polling": entry["profile"].status_polling,
+            }
+            for printer_id, entry in self._printers.items()
+        }
+
+printer_registry = PrinterRegistry(PRINTER_REGISTRY_PATH, PRINTER_REGISTRY_POLL_INTERVAL, PRINTER_DNS_TTL)
+
+def resolve_printer_config(config: PrinterConfig) -> PrinterConfig:
+    """
+    Sustituye 'printer_id' por la configuración registrada (dirección ya resuelta)
+    """
+    if not config.printer_id:
+        return config
+    return printer_registry.get(config.printer_id)["config"]
+
+PRINTER_LOCK_DIR = os.environ.get("PRINTER_LOCK_DIR", os.path.join(tempfile.gettempdir(), "escpos_printer_locks"))
+
+class PrinterLease:
+    """
+    Exclusión por impresora entre procesos: un lock de archivo por impresora (flock en
+    Linux/macOS, msvcrt en Windows) más un asyncio.Lock para las solicitudes del mismo proceso.
+    Así varios workers de uvicorn nunca escriben a la vez en la misma impresora.
+    """
+
+    POLL_INTERVAL = 0.02
+
+    def __init__(self, lock_dir: str, timeout: float = 120.0):
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self._local_locks = {}
+
+    def _lock_path(self, target: str) -> str:
+        digest = hashlib.sha1(target.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.lock_dir, f"printer_{digest}.lock")
+
+    @staticmethod
+    def try_lock(fd: int) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def unlock(fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
         else:
-            if not request.printer_config.ip:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Debe especificar 'ip' para conexión de red"
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    @asynccontextmanager
+    async def hold(self, target: str):
+        deadline = time.monotonic() + self.timeout
+        local_lock = self._local_locks.setdefault(target, asyncio.Lock())
+        try:
+            await asyncio.wait_for(local_lock.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail=f"Impresora {target} ocupada, intente de nuevo")
+
+        fd = None
+        try:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            fd = os.open(self._lock_path(target), os.O_RDWR | os.O_CREAT, 0o644)
+            # Sin bloquear el event loop: se reintenta hasta obtener el lock de archivo
+            while not self.try_lock(fd):
+                if time.monotonic() >= deadline:
+                    raise HTTPException(status_code=503, detail=f"Impresora {target} ocupada por otro worker, intente de nuevo")
+                await asyncio.sleep(self.POLL_INTERVAL)
+            try:
+                yield
+            finally:
+                self.unlock(fd)
+        finally:
+            if fd is not None:
+                os.close(fd)
+            local_lock.release()
+
+class WorkerAffinity:
+    """
+    Con varios workers de uvicorn (WEB_CONCURRENCY > 1), cada impresora tiene un worker
+    dueño según un hash de su identificador. El worker que recibe la solicitud la reenvía
+    al dueño por un socket Unix interno, de modo que los trabajos de una impresora se
+    encolan en orden (FIFO) en un solo proceso y la deduplicación por idempotencia aplica
+    entre workers. El lock de archivo de PrinterLease sigue protegiendo si el dueño no responde.
+    """
+
+    def __init__(self, workers: int, lock_dir: str):
+        self.workers = workers
+        self.lock_dir = lock_dir
+        self.index = None
+        self._slot_fd = None
+        self._server = None
+        self._event_tasks = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.index is not None
+
+    def _socket_path(self, index: int) -> str:
+        return os.path.join(self.lock_dir, f"worker_{index}.sock")
+
+    async def start(self):
+        if self.workers <= 1 or fcntl is None or not hasattr(socket, "AF_UNIX"):
+            return
+        os.makedirs(self.lock_dir, exist_ok=True)
+        # Cada worker reclama el primer índice libre y lo conserva mientras vive
+        for index in range(self.workers):
+            fd = os.open(os.path.join(self.lock_dir, f"worker_slot_{index}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            if PrinterLease.try_lock(fd):
+                self._slot_fd = fd
+                self.index = index
+                break
+            os.close(fd)
+        if self.index is None:
+            logger.warning("No hay índice de worker libre, se desactiva la afinidad por impresora")
+            return
+        path = self._socket_path(self.index)
+        if os.path.exists(path):
+            os.unlink(path)
+        self._server = await asyncio.start_unix_server(self._handle, path=path)
+        logger.info("Worker %d/%d atendiendo impresoras asignadas en %s", self.index, self.workers, path)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._slot_fd is not None:
+            os.close(self._slot_fd)
+            self._slot_fd = None
+        self.index = None
+
+    def owner_of(self, target: str) -> int:
+        return int(hashlib.sha1(target.encode('utf-8')).hexdigest()[:8], 16) % self.workers
+
+    def is_remote(self, target: str) -> bool:
+        return self.enabled and self.owner_of(target) != self.index
+
+    async def forward(self, target: str, request: TicketPrintRequest, idempotency_key: str,
+                      logo_data: Optional[bytes]) -> Optional[PrintResponse]:
+        """
+        Reenvía el trabajo al worker dueño. Devuelve None si el dueño no está disponible.
+        """
+        owner = self.owner_of(target)
+        try:
+            reader, writer = await asyncio.open_unix_connection(self._socket_path(owner))
+        except OSError as e:
+            logger.warning("Worker %s no disponible para %s (%s), se imprime localmente", owner, target, e,
+                           extra={"printer": target})
+            return None
+        try:
+            with tracer.span("worker.forward", kind="CLIENT", worker=owner) as span:
+                header = {"request": request.model_dump(), "idempotency_key": idempotency_key,
+                          "logo_len": len(logo_data or b''), "traceparent": span.traceparent}
+                writer.write(json.dumps(header).encode('utf-8') + b"\n" + (logo_data or b''))
+                await writer.drain()
+                reply = json.loads(await reader.readline())
+        finally:
+            writer.close()
+        if reply["status_code"] != 200:
+            raise HTTPException(status_code=reply["status_code"], detail=reply["detail"])
+        return PrintResponse(**reply["response"])
+
+    async def _send_event(self, index: int, payload: bytes):
+        try:
+            _, writer = await asyncio.open_unix_connection(self._socket_path(index))
+        except OSError:
+            return
+        try:
+            writer.write(payload)
+            await writer.drain()
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    def broadcast(self, event: dict):
+        """
+        Reenvía un evento a los demás workers para sus suscriptores (sin esperar respuesta)
+        """
+        if not self.enabled:
+            return
+        payload = json.dumps({"event": event}).encode('utf-8') + b"\n"
+        loop = asyncio.get_running_loop()
+        for index in range(self.workers):
+            if index != self.index:
+                task = loop.create_task(self._send_event(index, payload))
+                self._event_tasks.add(task)
+                task.add_done_callback(self._event_tasks.discard)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            header = json.loads(await reader.readline())
+            if "event" in header:
+                event_bus.receive(header["event"])
+                return
+            logo_data = await reader.readexactly(header["logo_len"]) if header["logo_len"] else None
+            request = TicketPrintRequest(**header["request"])
+            with tracer.span("worker.forwarded_job", traceparent=header.get("traceparent"), kind="SERVER",
+                             worker=self.index):
+                try:
+                    response = await submit_print_job(request, header["idempotency_key"], logo_data, forwarded=True)
+                    reply = {"status_code": 200, "response": response.model_dump()}
+                except HTTPException as e:
+                    reply = {"status_code": e.status_code, "detail": e.detail}
+            writer.write(json.dumps(reply).encode('utf-8') + b"\n")
+            await writer.drain()
+        except Exception as e:
+            logger.error("Error atendiendo trabajo reenviado: %s", e)
+        finally:
+            writer.close()
+
+# Versión del diseño del ticket: subirla al cambiar generate_ticket_escpos invalida los tickets guardados
+TICKET_LAYOUT_VERSION = "1"
+
+class RenderedTicketCache:
+    """
+    Tickets ESC/POS ya generados, por boleta + página de códigos + versión del diseño, para
+    reimprimir sin volver a generar el ticket (ni decodificar el logo) ni recibir el payload.
+    LRU en memoria acotado por bytes y, si se configura un directorio, una copia en disco
+    que sobrevive a reinicios y se comparte entre workers. El disco se limita por número de archivos.
+    Con shared=True (varios workers) el disco es obligatorio y se lee siempre: el ticket lo guarda
+    el worker dueño de la impresora y la reimpresión puede llegar a cualquier otro worker.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 max_disk_entries: int = 5000, shared: bool = False):
+        if shared and not disk_dir:
+            raise ValueError("La caché de reimpresión compartida entre workers necesita un directorio")
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        self.max_disk_entries = max_disk_entries
+        self.shared = shared
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._disk_puts = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(boleta: str, variant: str) -> str:
+        return f"{TICKET_LAYOUT_VERSION}|{variant}|{boleta}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + ".bin")
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= len(old)
+        self._entries[key] = data
+        self.total_bytes += len(data)
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: str, data: bytes):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._disk_puts += 1
+        # Cada cierto número de escrituras se borran los más antiguos si se pasó del límite
+        if self._disk_puts % 100 == 0:
+            files = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith(".bin")]
+            if len(files) > self.max_disk_entries:
+                files.sort(key=lambda p: os.stat(p).st_mtime)
+                for old in files[:len(files) - self.max_disk_entries]:
+                    try:
+                        os.unlink(old)
+                    except OSError:
+                        pass
+
+    async def get(self, boleta: str, variant: str) -> Optional[bytes]:
+        key = self.key(boleta, variant)
+        # Compartida: la copia en memoria puede ser de otro ticket de la misma boleta (reimpreso
+        # por otro worker), así que se lee el disco
+        data = None if self.shared else self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            metrics.inc("printer_reprint_cache_total", result="memory")
+            return data
+        if self.disk_dir:
+            data = await asyncio.to_thread(self._read_disk, key)
+            if data is not None:
+                self._remember(key, data)
+                metrics.inc("printer_reprint_cache_total", result="disk")
+                return data
+        metrics.inc("printer_reprint_cache_total", result="miss")
+        return None
+
+    async def put(self, boleta: str, variant: str, data: bytes):
+        key = self.key(boleta, variant)
+        self._remember(key, data)
+        if self.disk_dir:
+            try:
+                await asyncio.to_thread(self._write_disk, key, data)
+            except OSError as e:
+                logger.warning("No se pudo guardar en disco el ticket de la boleta %s: %s", boleta, e)
+
+printer_service = ESCPOSPrinterService()
+print_job_cache = PrintJobCache()
+PRINTER_WORKERS = int(os.environ.get("WEB_CONCURRENCY", "1"))
+# Con varios workers la caché de reimpresión va siempre también a disco (por defecto junto a los locks)
+rendered_ticket_cache = RenderedTicketCache(
+    int(os.environ.get("PRINTER_REPRINT_CACHE_MB", "16")) * 1024 * 1024,
+    os.environ.get("PRINTER_REPRINT_CACHE_DIR")
+    or (os.path.join(PRINTER_LOCK_DIR, "reprint_cache") if PRINTER_WORKERS > 1 else None),
+    shared=PRINTER_WORKERS > 1
+)
+printer_lease = PrinterLease(PRINTER_LOCK_DIR)
+worker_affinity = WorkerAffinity(PRINTER_WORKERS, PRINTER_LOCK_DIR)
+
+async def send_print_copies(printer_config: PrinterConfig, profile: PrinterProfile, escpos_data: bytes,
+                            copias: int, document: str = "Ticket") -> PrintResponse:
+    """
+    Envía escpos_data a la impresora (todas las copias).
+    Lo usan los tickets y las versiones térmicas de otros documentos (p. ej. certificados).
+    """
+    target = printer_target(printer_config)
+    labels = {"printer": target, "connection_type": printer_config.connection_type}
+    event_fields = {"printer_id": printer_config.printer_id, "document": document, "copies": copias}
+
+    async def send_copy(i: int) -> float:
+        """
+        Envía una copia y devuelve la pausa antes de la siguiente (ver PrinterPacing)
+        """
+        copy_started = time.perf_counter()
+        event_bus.publish("job.sending", target, copy=i + 1, **event_fields)
+        with tracer.span("printer.copy", copy=i + 1, copies=copias) as span:
+            if printer_config.connection_type == "usb":
+                result = await printer_service.send_to_usb_printer(
+                    printer_name=printer_config.printer_name,
+                    data=escpos_data,
+                    timeout=printer_config.timeout,
+                    connect_timeout=printer_pacing.connect_timeout(target, printer_config.timeout)
                 )
-            
-            for i in range(request.copias):
+            else:
                 result = await printer_service.send_escpos_command(
-                    ip=request.printer_config.ip,
-                    port=request.printer_config.port,
+                    ip=printer_config.ip,
+                    port=printer_config.port,
                     escpos_data=escpos_data,
-                    timeout=request.printer_config.timeout
+                    timeout=printer_config.timeout,
+                    chunk_size=profile.chunk_size,
+                    status_polling=profile.status_polling,
+                    connect_timeout=printer_pacing.connect_timeout(target, printer_config.timeout),
+                    status_timeout=printer_pacing.status_timeout(target, printer_config.timeout)
                 )
-                if not result["success"]:
-                    raise HTTPException(
-                        status_code=500, 
-                        detail=f"Error en copia {i+1}: {result['message']}"
-                    )
-                if i < request.copias - 1:
-                    await asyncio.sleep(0.5)
-            
-            return PrintResponse(
-                success=True,
-                message=f"Ticket impreso exitosamente ({request.copias} copia(s))",
-                printer_ip=request.printer_config.ip,
-                timestamp=datetime.now().isoformat()
+            if not result["success"]:
+                span.error = result["message"]
+        if not result["success"]:
+            if result.get("reason") == "timeout":
+                printer_pacing.record_timeout(target)
+            if result.get("reason") in ("timeout", "refused", "dns"):
+                event_bus.printer_status(target, False, result["message"], printer_id=printer_config.printer_id)
+            metrics.inc("printer_failures_total", reason=result.get("reason", "error"), **labels)
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error en copia {i+1}: {result['message']}"
             )
+        event_bus.printer_status(target, True, printer_id=printer_config.printer_id)
+        metrics.observe("printer_send_seconds", time.perf_counter() - copy_started, **labels)
+        metrics.inc("printer_copies_total", **labels)
+        metrics.inc("printer_bytes_total", result.get("bytes_sent", len(escpos_data)), **labels)
+        if "connect_seconds" in result:
+            metrics.observe("printer_connect_seconds", result["connect_seconds"], **labels)
+            printer_pacing.record_connect(target, result["connect_seconds"])
+        if result.get("bytes_per_second"):
+            metrics.set("printer_bytes_per_second", result["bytes_per_second"], **labels)
+        printer_pacing.record_send(target, result)
+        return printer_pacing.copy_gap(target, len(escpos_data), result.get("send_seconds", 0.0))
+
+    job_started = time.perf_counter()
+    job_started_ns = time.time_ns()
+    metrics.inc("printer_jobs_in_flight")
+    event_bus.publish("job.queued", target, **event_fields)
+    acquired = False
+    try:
+        # Exclusión por impresora (también entre workers): las copias de un trabajo no se intercalan con otro
+        async with printer_lease.hold(target):
+            acquired = True
+            metrics.observe("printer_lease_wait_seconds", time.perf_counter() - job_started, **labels)
+            tracer.record("printer.lease_wait", job_started_ns, printer=target)
+            for i in range(copias):
+                gap = await send_copy(i)
+                if i < copias - 1 and gap > 0:
+                    with tracer.span("printer.copy_pause", seconds=round(gap, 4)):
+                        await asyncio.sleep(gap)
+
+        event_bus.publish("job.printed", target, **event_fields)
+        return PrintResponse(
+            success=True,
+            message=f"{document} impreso exitosamente ({copias} copia(s))",
+            printer_ip=f"USB:{printer_config.printer_name}" if printer_config.connection_type == "usb" else printer_config.ip,
+            timestamp=datetime.now().isoformat()
+        )
+    except HTTPException as e:
+        if not acquired:
+            # La impresora siguió ocupada (por otro trabajo o worker) hasta agotar la espera
+            metrics.inc("printer_failures_total", reason="busy", **labels)
+        event_bus.publish("job.failed", target, message=str(e.detail), **event_fields)
+        raise
+    finally:
+        metrics.inc("printer_jobs_in_flight", -1)
+        metrics.observe("printer_job_seconds", time.perf_counter() - job_started, **labels)
+
+async def run_print_job(request: TicketPrintRequest, logo_data: Optional[bytes] = None) -> PrintResponse:
+    """
+    Genera el ticket y lo envía a la impresora (todas las copias)
+    """
+    # Fuera del try: una configuración incompleta es un 400, no un fallo de impresión
+    target = printer_target(request.printer_config)
+    try:
+        profile = resolve_printer_profile(request.printer_config)
+        with tracer.span("ticket.generate_escpos", code_page=profile.code_page) as span:
+            if logo_data is None and not request.logo:
+                logo_data = logo_manifest.logo_for(profile.dots_per_line)
+            symbol_data = None
+            if request.codigo_boleta is not None:
+                symbol_data = boleta_symbol_escpos(request.boleta, request.codigo_boleta, profile,
+                                                   get_code_page_encoder(profile.code_page))
+            escpos_data = printer_service.generate_ticket_escpos(
+                producto=request.producto,
+                fecha=request.fecha,
+                boleta=request.boleta,
+                cliente=request.cliente,
+                destino=request.destino,
+                placas=request.placas,
+                vehiculo=request.vehiculo,
+                chofer=request.chofer,
+                logo_base64=request.logo,
+                code_page=profile.code_page,
+                logo_data=logo_data,
+                symbol_data=symbol_data,
+                raster_profile=profile
+            )
+            span.set(bytes=len(escpos_data))
+        await rendered_ticket_cache.put(request.boleta, rendered_variant(profile), escpos_data)
+        
+        with tracer.span("printer.job", boleta=request.boleta, copies=request.copias):
+            return await send_print_copies(request.printer_config, profile, escpos_data, request.copias)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error en print_ticket: {str(e)}")
+        logger.error("Error en print_ticket: %s", e, extra={"printer": target})
+        event_bus.publish("job.failed", target, message=str(e))
         raise HTTPException(
             status_code=500, 
             detail=f"Error al imprimir ticket: {str(e)}"
         )
 
+async def submit_print_job(request: TicketPrintRequest, idempotency_key: Optional[str] = None,
+                           logo_data: Optional[bytes] = None, forwarded: bool = False) -> PrintResponse:
+    """
+    Lanza el trabajo de impresión (o se une al existente con la misma clave de idempotencia).
+    Con varios workers, el trabajo se delega al worker dueño de la impresora.
+    """
+    key = request.idempotency_key or idempotency_key or derive_idempotency_key(request)
+    if request.printer_config.printer_id:
+        request = request.model_copy(update={"printer_config": resolve_printer_config(request.printer_config)})
+
+    if not forwarded:
+        target = printer_target(request.printer_config)
+        if worker_affinity.is_remote(target):
+            response = await worker_affinity.forward(target, request, key, logo_data)
+            if response is not None:
+                return response
+
+    # La tarea del trabajo hereda el contexto: sus eventos llevan job_id y boleta
+    token = current_print_job.set({"job_id": key, "boleta": request.boleta})
+    try:
+        task, reused = print_job_cache.get_or_start(key, lambda: run_print_job(request, logo_data))
+    finally:
+        current_print_job.reset(token)
+    if reused:
+        logger.info("Trabajo duplicado para boleta %s, se reutiliza el resultado existente", request.boleta)
+
+    # shield: si el cliente se desconecta el trabajo sigue y queda disponible para el reintento
+    response = await asyncio.shield(task)
+    return response.model_copy(update={"idempotency_key": key, "reused": reused})
+
+_background_jobs = set()
+
+async def respond_print_job(request: TicketPrintRequest, idempotency_key: Optional[str], response: Response,
+                            wait: bool, logo_data: Optional[bytes] = None) -> PrintResponse:
+    """
+    Con wait=True espera el trabajo como siempre. Con wait=False responde 202 en cuanto
+    el trabajo queda lanzado; el resultado llega por /api/printer/events (job_id = idempotency_key).
+    """
+    if wait:
+        return await submit_print_job(request, idempotency_key, logo_data)
+
+    key = request.idempotency_key or idempotency_key or derive_idempotency_key(request)
+    config = resolve_printer_config(request.printer_config)
+    printer_target(config)
+
+    async def run():
+        try:
+            await submit_print_job(request, key, logo_data)
+        except HTTPException as e:
+            # send_print_copies / run_print_job ya publicaron job.failed
+            logger.error("Trabajo en segundo plano de boleta %s fallido: %s", request.boleta, e.detail)
+        except Exception as e:
+            # Cualquier otro error (p. ej. al delegar en otro worker) no debe perderse en la tarea
+            logger.exception("Error inesperado en el trabajo en segundo plano de boleta %s", request.boleta)
+            event_bus.publish("job.failed", printer_target(config), job_id=key, boleta=request.boleta,
+                              message=f"Error al imprimir ticket: {e}")
+
+    # Se guarda la referencia: el event loop solo mantiene referencias débiles a las tareas
+    task = asyncio.ensure_future(run())
+    _background_jobs.add(task)
+    task.add_done_callback(_background_jobs.discard)
+    response.status_code = 202
+    return PrintResponse(
+        success=True,
+        message="Trabajo en cola; el resultado se publica en /api/printer/events",
+        printer_ip=f"USB:{config.printer_name}" if config.connection_type == "usb" else config.ip,
+        timestamp=datetime.now().isoformat(),
+        idempotency_key=key
+    )
+
+def parse_ticket_request(raw: bytes) -> TicketPrintRequest:
+    """
+    Decodifica el JSON del ticket con orjson (si está instalado) y lo valida
+    """
+    with tracer.span("request.parse", bytes=len(raw)):
+        try:
+            payload = json_loads(raw)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"JSON inválido: {str(e)}")
+        if not isinstance(payload, dict):
+            raise HTTPException(status_code=400, detail="Se esperaba un objeto JSON con los datos del ticket")
+        try:
+            return TicketPrintRequest(**payload)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors())
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Abre el span de cada solicitud continuando el 'traceparent' entrante (si lo hay)
+    y lo devuelve en la respuesta junto con X-Trace-Id
+    """
+    with tracer.span(f"{request.method} {request.url.path}", traceparent=request.headers.get("traceparent"),
+                     kind="SERVER", **{"http.method": request.method, "http.target": request.url.path}) as span:
+        response = await call_next(request)
+        span.set(**{"http.status_code": response.status_code})
+        if response.status_code >= 500:
+            span.error = f"HTTP {response.status_code}"
+    response.headers["traceparent"] = span.traceparent
+    response.headers["X-Trace-Id"] = span.trace_id
+    return response
+
+WAIT_QUERY = Query(True, description="False: responder 202 al encolar y notificar el resultado por /api/printer/events")
+
+@app.post("/api/printer/print-ticket", response_model=PrintResponse)
+async def print_ticket(request: TicketPrintRequest, response: Response, idempotency_key: Optional[str] = Header(None),
+                       wait: bool = WAIT_QUERY):
+    """
+    Imprime un ticket térmico con información de boleta.
+    Acepta una clave de idempotencia (campo 'idempotency_key' o header 'Idempotency-Key');
+    si no se envía se deriva de boleta+copias+destino. Un reintento con la misma clave
+    se une al trabajo en curso o devuelve el resultado ya obtenido sin volver a imprimir.
+    Con ?wait=false responde 202 de inmediato y el avance se publica como eventos.
+    """
+    # FastAPI ya leyó y validó el cuerpo: se registra esa etapa desde el inicio de la solicitud
+    request_span = current_span()
+    if request_span is not None:
+        tracer.record("request.parse", request_span.start_ns, model="TicketPrintRequest")
+    return await respond_print_job(request, idempotency_key, response, wait)
+
+@app.post("/api/printer/print-ticket/fast", response_model=PrintResponse)
+async def print_ticket_fast(http_request: Request, response: Response, idempotency_key: Optional[str] = Header(None),
+                            wait: bool = WAIT_QUERY):
+    """
+    Igual que /print-ticket, pero lee el cuerpo crudo y lo decodifica con orjson.
+    Pensado para tickets sin logo (o con el logo guardado en el servidor).
+    """
+    request = parse_ticket_request(await http_request.body())
+    return await respond_print_job(request, idempotency_key, response, wait)
+
+@app.post("/api/printer/print-ticket/multipart", response_model=PrintResponse)
+async def print_ticket_multipart(
+    response: Response,
+    ticket: str = Form(..., description="Datos del ticket en JSON (mismos campos que /print-ticket)"),
+    logo: Optional[UploadFile] = File(None, description="Logo ESC/POS binario (logo_escpos.bin)"),
+    idempotency_key: Optional[str] = Header(None),
+    wait: bool = WAIT_QUERY
+):
+    """
+    Imprime un ticket recibiendo el logo como archivo binario en lugar de base64 dentro del JSON
+    (evita el 33% extra de tamaño y la decodificación en cada impresión)
+    """
+    request = parse_ticket_request(ticket.encode('utf-8'))
+    logo_data = await logo.read() if logo is not None else None
+    return await respond_print_job(request, idempotency_key, response, wait, logo_data=logo_data)
+
+@app.post("/api/printer/reprint/{boleta}", response_model=PrintResponse)
+async def reprint_ticket(boleta: str, request: ReprintRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Reimprime un ticket ya generado enviando solo el destino y las copias (sin datos ni logo).
+    El ticket se guarda al imprimirlo por /print-ticket; si no está (o se generó para una
+    impresora con otra página de códigos, ancho o modo raster) se responde 404 y hay que
+    enviar el ticket completo.
+    Con 'Idempotency-Key' un reintento se une a la reimpresión en curso en lugar de repetirla.
+    """
+    printer_config = resolve_printer_config(request.printer_config)
+    profile = resolve_printer_profile(printer_config)
+    with tracer.span("reprint.cache_lookup", boleta=boleta, variant=rendered_variant(profile)) as span:
+        escpos_data = await rendered_ticket_cache.get(boleta, rendered_variant(profile))
+        span.set(hit=escpos_data is not None)
+    if escpos_data is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No hay ticket guardado para la boleta '{boleta}' compatible con esta impresora "
+                   f"({rendered_variant(profile)}); envíe el ticket completo"
+        )
+
+    def job():
+        return send_print_copies(printer_config, profile, escpos_data, request.copias, "Ticket (reimpresión)")
+
+    token = current_print_job.set({"job_id": f"reprint:{idempotency_key}" if idempotency_key else None, "boleta": boleta})
+    try:
+        if not idempotency_key:
+            return await job()
+        task, reused = print_job_cache.get_or_start(f"reprint:{idempotency_key}", job)
+    finally:
+        current_print_job.reset(token)
+    response = await asyncio.shield(task)
+    return response.model_copy(update={"idempotency_key": idempotency_key, "reused": reused})
+
+@app.get("/api/printer/throughput")
+async def printer_throughput():
+    """
+    Rendimiento de envío (bytes/segundo) medido por impresora y lo aprendido para
+    espaciar copias y ajustar timeouts
+    """
+    return {"printers": throughput_stats.snapshot(), "pacing": printer_pacing.snapshot(), "events": event_bus.snapshot()}
+
+def _event_filters(values: Optional[List[str]]) -> List[str]:
+    """Acepta el parámetro repetido (?printer=a&printer=b) o separado por comas"""
+    return [item.strip() for value in values or () for item in value.split(",") if item.strip()]
+
+@app.get("/api/printer/events")
+async def printer_events(
+    request: Request,
+    printer: Optional[List[str]] = Query(None, description="Destino (ip:puerto, USB:nombre) o id del registro"),
+    boleta: Optional[List[str]] = Query(None, description="Número de boleta"),
+    job_id: Optional[List[str]] = Query(None, description="idempotency_key devuelta al lanzar el trabajo"),
+    last_event_id: Optional[int] = Header(None)
+):
+    """
+    Eventos de trabajos e impresoras como Server-Sent Events (EventSource en el navegador):
+    job.queued, job.sending, job.printed, job.failed, printer.offline, printer.online.
+    Sin filtros se reciben todos. Al reconectar, el navegador envía Last-Event-ID y se
+    reenvían los eventos guardados que se perdió.
+    """
+    subscription = event_bus.subscribe(_event_filters(printer), _event_filters(boleta),
+                                       _event_filters(job_id), last_event_id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await subscription.get(PRINTER_EVENTS_HEARTBEAT)
+                if event is None:
+                    if await request.is_disconnected():
+                        break
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield ": ping\n\n"
+                    continue
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.websocket("/api/printer/events/ws")
+async def printer_events_ws(websocket: WebSocket):
+    """
+    Los mismos eventos por WebSocket (un JSON por mensaje), con los filtros de
+    /api/printer/events en la URL. El cliente puede cambiarlos en cualquier momento
+    enviando {"printers": [...], "boletas": [...], "job_ids": [...]}.
+    """
+    await websocket.accept()
+    params = websocket.query_params
+    subscription = event_bus.subscribe(_event_filters(params.getlist("printer")),
+                                       _event_filters(params.getlist("boleta")),
+                                       _event_filters(params.getlist("job_id")))
+
+    async def receive_filters():
+        try:
+            while True:
+                message = await websocket.receive_json()
+                if isinstance(message, dict):
+                    subscription.set_filters(message.get("printers"), message.get("boletas"), message.get("job_ids"))
+        except (WebSocketDisconnect, ValueError):
+            # El cliente cerró la conexión o envió algo que no es JSON
+            pass
+
+    receiver = asyncio.ensure_future(receive_filters())
+    getter = None
+    try:
+        while True:
+            getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                break
+            await websocket.send_json(getter.result())
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        # Si send_json falla (o el handler se cancela) queue.get() puede seguir pendiente
+        if getter is not None:
+            getter.cancel()
+        receiver.cancel()
+        subscription.close()
+
 @app.get("/api/printer/list-usb")
 async def list_usb_printers():
     """
-    Lista las impresoras USB disponibles en el sistema
+    Impresoras locales (colas de CUPS por IPP con su estado; en Windows o sin IPP, lpstat/win32print)
     """
-    printers = printer_service.get_usb_printers()
+    system = platform.system()
+    if cups_ipp_enabled():
+        try:
+            queues = await cups_client.get_printers()
+            return {
+                "printers": [queue["name"] for queue in queues],
+                "details": queues,
+                "count": len(queues),
+                "platform": system,
+                "message": f"{len(queues)} impresora(s) en CUPS"
+            }
+        except (OSError, ValueError, CUPSTimeoutError) as e:
+            logger.warning("No se pudieron listar las impresoras por IPP (%s), se usa lpstat", e)
+    printers = await asyncio.to_thread(printer_service.get_usb_printers)
     return {
         "printers": printers,
         "count": len(printers),
-        "platform": platform.system(),
-        "message": "Impresoras encontradas" if printers else "No se encontraron impresoras"
+        "platform": system,
+        "message": f"{len(printers)} impresora(s) encontradas"
     }
 
+@app.get("/api/printer/registry")
+async def list_registered_printers():
+    """
+    Impresoras del registro del servidor (id lógico, destino resuelto y capacidades)
+    """
+    return {"path": printer_registry.path, "printers": printer_registry.snapshot()}
+
+@app.post("/api/printer/registry/reload")
+async def reload_printer_registry():
+    """
+    Relee el archivo del registro y vuelve a resolver todas las direcciones
+    """
+    await printer_registry.refresh(force=True)
+    return {"success": True, "message": f"{len(printer_registry.snapshot())} impresora(s) registradas"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Métricas en formato Prometheus: latencias y fallos por impresora, trabajos en curso
+    y retraso del event loop (de este proceso/worker)
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {
@@ -415,7 +2663,15 @@ async def root():
         "platform": platform.system(),
         "endpoints": {
             "print_ticket": "/api/printer/print-ticket",
+            "print_ticket_fast": "/api/printer/print-ticket/fast",
+            "print_ticket_multipart": "/api/printer/print-ticket/multipart",
+            "reprint": "/api/printer/reprint/{boleta}",
             "list_usb": "/api/printer/list-usb",
+            "events": "/api/printer/events",
+            "events_ws": "/api/printer/events/ws",
+            "throughput": "/api/printer/throughput",
+            "registry": "/api/printer/registry",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
@@ -426,5 +2682,8 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    if PRINTER_WORKERS > 1:
+        uvicorn.run("main_updated:app", host="0.0.0.0", port=8001, workers=PRINTER_WORKERS, log_config=None)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8001, log_config=None)
 
@@ -1,5 +1,5 @@
 """
-Script para convertir una imagen PNG a comandos ESC/POS binarios
+Script para convertir imágenes a comandos ESC/POS binarios (raster GS v 0)
 para impresoras térmicas.
 
 Uso:
@@ -7,13 +7,85 @@ Uso:
     2. Ejecuta: python convert_logo_escpos.py
     3. Se generará logo_escpos.bin
 
+    Conversión por lotes (varias imágenes y perfiles de impresora, en paralelo):
+    python convert_logo_escpos.py logos/ "marcas/*.png" \
+        --profile 80mm-203dpi --profile 58mm-203dpi --profile 80mm-300dpi:floyd \
+        --output-dir logos_escpos
+
+    Genera logos_escpos/<imagen>_<perfil>.bin y logos_escpos/manifest.json, que la API
+    de impresión carga al arrancar (PRINTER_LOGO_MANIFEST) para usar el logo que
+    corresponde al ancho de cada impresora. Las imágenes sin cambios (mismo hash de
+    contenido y mismos parámetros) no se vuelven a convertir.
+
 Requisitos:
     pip install Pillow
 """
 
-from PIL import Image
+from PIL import Image, ImageOps
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import argparse
+import glob
+import hashlib
+import json
+import re
 import struct
 import os
+import sys
+
+def pack_raster(img, max_width=384, threshold=128, dither="threshold"):
+    """
+    Convierte una imagen PIL en un bloque raster GS v 0 (1 bit por pixel)
+    
+    Args:
+        img: Imagen PIL (cualquier modo; la transparencia se compone sobre blanco)
+        max_width: Ancho máximo en pixels
+        threshold: Pixels más oscuros que este valor se imprimen
+        dither: 'threshold' (umbral fijo, bordes nítidos) o 'floyd' (Floyd-Steinberg,
+            para fotos y degradados)
+    
+    Returns:
+        (datos_escpos, ancho, alto)
+    """
+    # La transparencia se compone sobre blanco (el color del papel)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGBA')
+        background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, img)
+    
+    # Convertir a escala de grises
+    img = img.convert('L')
+    
+    # Redimensionar si es necesario (mantener proporción)
+    if img.width > max_width:
+        ratio = max_width / img.width
+        new_height = int(img.height * ratio)
+        img = img.resize((max_width, new_height), Image.LANCZOS)
+    
+    # Asegurar que el ancho sea múltiplo de 8 (requerido por ESC/POS)
+    width = (img.width // 8) * 8
+    if width != img.width:
+        img = img.crop((0, 0, width, img.height))
+    
+    # Convertir a binario (1 bit por pixel)
+    # Pixels oscuros = 1 (imprimir), claros = 0 (no imprimir)
+    if dither == "floyd":
+        # Se invierte antes de tramar: en modo '1' el blanco es el bit 1
+        img = ImageOps.invert(img).convert('1')
+    else:
+        img = img.point(lambda x: 1 if x < threshold else 0, '1')
+    
+    # Comando GS v 0 (imprimir imagen raster)
+    # Formato: GS v 0 m xL xH yL yH [datos]
+    # m = 0 (modo normal)
+    escpos_data = b'\x1D\x76\x30\x00'  # GS v 0 m
+    escpos_data += struct.pack('<H', width // 8)  # xL xH (ancho en bytes)
+    escpos_data += struct.pack('<H', img.height)  # yL yH (alto en pixels)
+    
+    # El modo '1' de PIL ya empaqueta 8 pixels por byte (bit más significativo primero)
+    escpos_data += img.tobytes()
+    
+    return escpos_data, width, img.height
 
 def image_to_escpos(image_path, output_path, max_width=384):
     """
@@ -35,53 +107,10 @@ def image_to_escpos(image_path, output_path, max_width=384):
         img = Image.open(image_path)
         print(f"📷 Imagen cargada: {img.width}x{img.height} pixels, modo: {img.mode}")
         
-        # Convertir a escala de grises
-        img = img.convert('L')
-        
-        # Redimensionar si es necesario (mantener proporción)
-        if img.width > max_width:
-            ratio = max_width / img.width
-            new_height = int(img.height * ratio)
-            img = img.resize((max_width, new_height), Image.LANCZOS)
-            print(f"📐 Redimensionado a: {img.width}x{img.height} pixels")
-        
-        # Asegurar que el ancho sea múltiplo de 8 (requerido por ESC/POS)
-        width = (img.width // 8) * 8
-        if width != img.width:
-            img = img.crop((0, 0, width, img.height))
-            print(f"✂️ Recortado a: {width}x{img.height} pixels (múltiplo de 8)")
-        
-        # Convertir a binario (1 bit por pixel)
-        # Pixels oscuros = 1 (imprimir), claros = 0 (no imprimir)
-        threshold = 128
-        img = img.point(lambda x: 1 if x < threshold else 0, '1')
-        
         # Generar comandos ESC/POS
-        escpos_data = b''
-        
-        width_bytes = width // 8
-        height = img.height
-        
-        # Comando GS v 0 (imprimir imagen raster)
-        # Formato: GS v 0 m xL xH yL yH [datos]
-        # m = 0 (modo normal)
-        escpos_data += b'\x1D\x76\x30\x00'  # GS v 0 m
-        escpos_data += struct.pack('<H', width_bytes)  # xL xH (ancho en bytes)
-        escpos_data += struct.pack('<H', height)  # yL yH (alto en pixels)
-        
-        # Obtener datos de pixels
-        pixels = list(img.getdata())
-        
-        # Convertir pixels a bytes (8 pixels por byte)
-        for y in range(height):
-            for x in range(0, width, 8):
-                byte = 0
-                for bit in range(8):
-                    if x + bit < width:
-                        pixel_index = y * width + x + bit
-                        if pixels[pixel_index] == 1:
-                            byte |= (1 << (7 - bit))
-                escpos_data += bytes([byte])
+        escpos_data, width, height = pack_raster(img, max_width)
+        if (width, height) != img.size:
+            print(f"📐 Redimensionado a: {width}x{height} pixels (ancho múltiplo de 8)")
         
         # Guardar archivo binario
         with open(output_path, 'wb') as f:
@@ -99,7 +128,172 @@ def image_to_escpos(image_path, output_path, max_width=384):
         return False
 
 
+# Conversión por lotes
+CONVERTER_VERSION = 1
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+# Ancho imprimible por ancho de papel
+PRINTABLE_MM = {58: 48, 80: 72}
+PROFILE_RE = re.compile(r"^(\d+)mm-(\d+)dpi(?::(threshold|floyd))?$")
+MANIFEST_NAME = "manifest.json"
+
+
+def parse_profile(spec, logo_mm):
+    """
+    Interpreta un perfil 'PAPELmm-DPIdpi[:threshold|floyd]' (p. ej. 80mm-203dpi, 58mm-203dpi:floyd)
+    """
+    match = PROFILE_RE.match(spec)
+    if not match:
+        raise ValueError(f"Perfil inválido '{spec}' (formato: 80mm-203dpi o 58mm-203dpi:floyd)")
+    paper_mm, dpi, dither = int(match.group(1)), int(match.group(2)), match.group(3) or "threshold"
+    if paper_mm not in PRINTABLE_MM:
+        raise ValueError(f"Ancho de papel no soportado: {paper_mm} mm (use {', '.join(map(str, PRINTABLE_MM))})")
+    dots_per_mm = round(dpi / 25.4)
+    dots_per_line = PRINTABLE_MM[paper_mm] * dots_per_mm
+    width = min(dots_per_line, int(logo_mm * dots_per_mm)) // 8 * 8
+    name = f"{paper_mm}mm-{dpi}dpi" + (f"-{dither}" if dither != "threshold" else "")
+    return {"name": name, "paper_mm": paper_mm, "dpi": dpi, "dots_per_line": dots_per_line,
+            "width": width, "dither": dither}
+
+
+def collect_inputs(patterns):
+    """
+    Expande directorios (imágenes de primer nivel), archivos y patrones glob
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern) or [pattern]
+        paths.update(path for path in candidates
+                     if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def _convert(job):
+    """
+    Convierte una imagen con un perfil (se ejecuta en un proceso del pool)
+    """
+    source, output_path, profile = job["source"], job["output_path"], job["profile"]
+    with Image.open(source) as img:
+        escpos_data, width, height = pack_raster(img, profile["width"], dither=profile["dither"])
+    # Escritura atómica: la API nunca lee un archivo a medio escribir
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(escpos_data)
+    os.replace(tmp_path, output_path)
+    return {
+        "file": os.path.basename(output_path),
+        "source": source,
+        "source_sha256": job["source_sha256"],
+        "params_sha256": job["params_sha256"],
+        "paper_mm": profile["paper_mm"],
+        "dpi": profile["dpi"],
+        "dots_per_line": profile["dots_per_line"],
+        "dither": profile["dither"],
+        "width": width,
+        "height": height,
+        "bytes": len(escpos_data),
+        "sha256": hashlib.sha256(escpos_data).hexdigest(),
+    }
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def batch_convert(inputs, profiles, output_dir, jobs=None, force=False):
+    """
+    Convierte todas las imágenes con todos los perfiles en un pool de procesos y
+    escribe el manifiesto. Devuelve (manifiesto, convertidos, omitidos).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous = json.load(f).get("logos", {})
+
+    logos = {}
+    pending = []
+    skipped = 0
+    for source in inputs:
+        stem = os.path.splitext(os.path.basename(source))[0]
+        if stem in logos:
+            print(f"⚠️ '{source}' tiene el mismo nombre que otra imagen, se omite")
+            continue
+        logos[stem] = {}
+        source_sha256 = _file_sha256(source)
+        for profile in profiles:
+            params = json.dumps([CONVERTER_VERSION, profile], sort_keys=True)
+            params_sha256 = hashlib.sha256(params.encode("utf-8")).hexdigest()
+            output_path = os.path.join(output_dir, f"{stem}_{profile['name']}.bin")
+            entry = previous.get(stem, {}).get(profile["name"])
+            if (not force and entry and entry["source_sha256"] == source_sha256
+                    and entry["params_sha256"] == params_sha256
+                    and os.path.exists(output_path) and _file_sha256(output_path) == entry["sha256"]):
+                logos[stem][profile["name"]] = entry
+                skipped += 1
+                continue
+            pending.append({"stem": stem, "source": source, "output_path": output_path, "profile": profile,
+                            "source_sha256": source_sha256, "params_sha256": params_sha256})
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for job, entry in zip(pending, pool.map(_convert, pending)):
+                logos[job["stem"]][job["profile"]["name"]] = entry
+                print(f"✅ {job['source']} -> {entry['file']} ({entry['width']}x{entry['height']}, {entry['bytes']} bytes)")
+
+    manifest = {
+        "version": CONVERTER_VERSION,
+        "generated_at": datetime.now().isoformat(),
+        "profiles": [profile["name"] for profile in profiles],
+        "logos": logos,
+    }
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+    return manifest, len(pending), skipped
+
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(description="Conversión por lotes de logos a ESC/POS por perfil de impresora")
+    parser.add_argument("inputs", nargs="+", help="Imágenes, directorios o patrones glob")
+    parser.add_argument("--profile", action="append", dest="profiles",
+                        help="PAPELmm-DPIdpi[:threshold|floyd]; se puede repetir (por defecto 80mm-203dpi y 58mm-203dpi)")
+    parser.add_argument("--logo-mm", type=float, default=37.5,
+                        help="Ancho del logo en mm (se limita al ancho imprimible; 37.5 mm = 300 puntos a 203 dpi)")
+    parser.add_argument("--output-dir", default="logos_escpos")
+    parser.add_argument("--jobs", type=int, default=None, help="Procesos en paralelo (por defecto uno por CPU)")
+    parser.add_argument("--force", action="store_true", help="Convertir aunque no haya cambios")
+    args = parser.parse_args(argv)
+
+    try:
+        profiles = [parse_profile(spec, args.logo_mm) for spec in args.profiles or ["80mm-203dpi", "58mm-203dpi"]]
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("❌ No se encontraron imágenes")
+        return 1
+
+    manifest, converted, skipped = batch_convert(inputs, profiles, args.output_dir, args.jobs, args.force)
+    print(f"\n🎉 {len(manifest['logos'])} imagen(es) x {len(profiles)} perfil(es): "
+          f"{converted} convertido(s), {skipped} sin cambios")
+    print(f"   📄 Manifiesto: {os.path.join(args.output_dir, MANIFEST_NAME)}")
+    return 0
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(batch_main(sys.argv[1:]))
+
     # Configuración
     INPUT_IMAGE = "logo.png"
     OUTPUT_FILE = "logo_escpos.bin"
@@ -0,0 +1,106 @@
+"""
+Genera códigos de barras (CODE128, CODE39) y QR como imagen, para imprimirlos como
+raster en impresoras sin comandos nativos (GS k / GS ( k) y para dibujarlos en el emulador.
+Los módulos se calculan con los codificadores de ReportLab y se dibujan a tamaño entero
+de punto, sin escalar, para que el lector los distinga.
+
+Uso:
+    from scripts.escpos_barcodes import symbol_image
+    img = symbol_image("code128", "B-000123", module_size=2, height=80)
+    img = symbol_image("qr", "B-000123", module_size=6, error_correction="M")
+
+Requisitos:
+    pip install reportlab Pillow
+"""
+
+from PIL import Image, ImageDraw
+from reportlab.graphics.barcode import code128, code39, qrencoder
+
+SYMBOLOGIES = ("code128", "code39", "qr")
+
+QR_ERROR_CORRECTION = {
+    "L": qrencoder.QRErrorCorrectLevel.L,
+    "M": qrencoder.QRErrorCorrectLevel.M,
+    "Q": qrencoder.QRErrorCorrectLevel.Q,
+    "H": qrencoder.QRErrorCorrectLevel.H,
+}
+
+# Zona en blanco alrededor del símbolo, en módulos
+QUIET_ZONE_1D = 10
+QUIET_ZONE_QR = 4
+# Relación barra ancha / angosta en CODE39
+CODE39_WIDE = 3
+
+
+def _bars(symbology, data):
+    """
+    Devuelve la secuencia de (es_barra, ancho_en_módulos) del código de barras
+    """
+    if symbology == "code128":
+        barcode = code128.Code128(data)
+        barcode.validate()
+        barcode.encode()
+        # Mayúscula = barra, minúscula = espacio; la letra indica el ancho (A/a = 1 ... D/d = 4)
+        return [(ch.isupper(), ord(ch.lower()) - ord('a') + 1) for ch in barcode.decompose()]
+    if symbology == "code39":
+        barcode = code39.Standard39(data, checksum=0)
+        barcode.validate()
+        barcode.encode()
+        widths = {"b": (True, 1), "B": (True, CODE39_WIDE), "s": (False, 1), "S": (False, CODE39_WIDE), "i": (False, 1)}
+        return [widths[ch] for ch in barcode.decompose()]
+    raise ValueError(f"Simbología no soportada como raster: {symbology}")
+
+
+def symbol_width(symbology, data, module_size=2, error_correction="M"):
+    """
+    Ancho en puntos que ocupará el símbolo (con zona en blanco); en el QR depende del
+    nivel de corrección (más corrección, más módulos)
+    """
+    if symbology == "qr":
+        return (_qr(data, error_correction).getModuleCount() + 2 * QUIET_ZONE_QR) * module_size
+    return (sum(width for _, width in _bars(symbology, data)) + 2 * QUIET_ZONE_1D) * module_size
+
+
+def _qr(data, error_correction):
+    qr = qrencoder.QRCode(None, QR_ERROR_CORRECTION[error_correction])
+    qr.addData(data)
+    qr.make()
+    return qr
+
+
+def symbol_image(symbology, data, module_size=2, height=80, error_correction="M"):
+    """
+    Dibuja el símbolo en negro sobre blanco (modo 'L'), con su zona en blanco.
+
+    Args:
+        symbology: 'code128', 'code39' o 'qr'
+        data: Texto a codificar
+        module_size: Ancho de la barra angosta o lado del módulo QR, en puntos
+        height: Alto de las barras en puntos (solo códigos de barras)
+        error_correction: Nivel de corrección del QR (L, M, Q, H)
+    """
+    if symbology == "qr":
+        qr = _qr(data, error_correction)
+        count = qr.getModuleCount()
+        side = (count + 2 * QUIET_ZONE_QR) * module_size
+        img = Image.new("L", (side, side), 255)
+        draw = ImageDraw.Draw(img)
+        for row in range(count):
+            for col in range(count):
+                if qr.isDark(row, col):
+                    x = (col + QUIET_ZONE_QR) * module_size
+                    y = (row + QUIET_ZONE_QR) * module_size
+                    draw.rectangle((x, y, x + module_size - 1, y + module_size - 1), fill=0)
+        return img
+
+    bars = _bars(symbology, data)
+    width = (sum(w for _, w in bars) + 2 * QUIET_ZONE_1D) * module_size
+    img = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(img)
+    x = QUIET_ZONE_1D * module_size
+    for is_bar, modules in bars:
+        w = modules * module_size
+        if is_bar:
+            draw.rectangle((x, 0, x + w - 1, height - 1), fill=0)
+        x += w
+    return img
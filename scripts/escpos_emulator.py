@@ -0,0 +1,907 @@
+"""
+Emulador local de impresora térmica ESC/POS para pruebas de carga y
+verificación visual de los tickets que genera la API de impresión.
+
+Escucha en TCP (puerto 9100 por defecto) como una impresora de red,
+interpreta el subconjunto de ESC/POS que emite ESCPOSPrinterService
+(texto, alineación, negritas, tamaños, página de códigos, raster GS v 0 y
+GS ( L / GS 8 L con sus modos de escala, avances ESC J, códigos de barras GS k, QR/PDF417 GS ( k, corte y consultas de estado
+DLE EOT) y guarda cada trabajo recibido como .txt y, si Pillow está
+instalado, como .png.
+
+Uso:
+    # Impresora de red emulada
+    python escpos_emulator.py serve --port 9100 --output-dir trabajos
+
+    # Impresora lenta, con buffer pequeño y desconexiones aleatorias
+    python escpos_emulator.py serve --byte-latency 0.0001 --buffer-size 1024 --disconnect-rate 0.05
+
+    # CUPS emulado por IPP para la ruta USB (la API con CUPS_SERVER=127.0.0.1:8631)
+    python escpos_emulator.py ipp --port 8631 --printer TM20 --job-seconds 0.5
+
+    # Sustituto de 'lp' / 'lpstat' para la ruta USB en Linux/macOS
+    ln -s $(pwd)/escpos_emulator.py ~/bin/lp
+    ln -s $(pwd)/escpos_emulator.py ~/bin/lpstat
+    (o bien: python escpos_emulator.py lp -d EMULADOR -o raw < ticket.bin)
+
+Requisitos:
+    pip install Pillow      (opcional, solo para generar PNG)
+    pip install reportlab   (opcional, para dibujar códigos de barras y QR en el PNG)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import time
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+try:
+    from escpos_barcodes import symbol_image
+except ImportError:
+    symbol_image = None
+
+try:
+    import ipp_protocol as ipp
+except ImportError:
+    ipp = None
+
+# GS k m: número de simbología -> nombre (funciones A y B)
+BARCODE_TYPES = {4: "code39", 69: "code39", 73: "code128"}
+
+# Valor n de ESC t n -> página de códigos (tabla estándar Epson)
+CODE_PAGES = {
+    0: "cp437",
+    2: "cp850",
+    3: "cp860",
+    4: "cp863",
+    5: "cp865",
+    16: "cp1252",
+    17: "cp866",
+    18: "cp852",
+    19: "cp858",
+}
+
+# Ancho de papel de 80 mm a 203 dpi
+PAPER_WIDTH_DOTS = 576
+CHAR_WIDTH_DOTS = 12
+LINE_HEIGHT_DOTS = 30
+
+# Fuentes monoespaciadas con acentos; si no hay ninguna se usa la de Pillow
+MONOSPACE_FONTS = ["DejaVuSansMono.ttf", "LiberationMono-Regular.ttf", "consola.ttf", "cour.ttf", "Menlo.ttc"]
+
+# Byte -> los dos bytes que resultan de duplicar cada punto en horizontal (doble ancho)
+DOUBLED_BYTES = [
+    sum(((b >> bit) & 1) * (0b11 << (2 * bit)) for bit in range(8)).to_bytes(2, 'big') for b in range(256)
+]
+
+STATUS_ONLINE = 0x16
+STATUS_OFFLINE = 0x1E
+
+
+class ESCPOSParser:
+    """
+    Intérprete incremental de ESC/POS. Los datos se entregan con feed() en los
+    fragmentos en que llegan por el socket; los comandos incompletos quedan en
+    espera hasta recibir el resto. Las consultas DLE EOT se responden al
+    momento mediante status_callback, igual que en una impresora real.
+    """
+
+    def __init__(self, status_callback=None):
+        self.status_callback = status_callback
+        self._buffer = bytearray()
+        self.elements = []
+        self.commands = 0
+        self.unknown_commands = 0
+        self._reset_state()
+        self._line = []
+
+    def _reset_state(self):
+        self.align = 0
+        self.bold = False
+        self.underline = False
+        self.double_height = False
+        self.double_width = False
+        self.code_page = "cp437"
+        self.barcode_height = 162
+        self.barcode_module = 3
+        self.barcode_hri = 0
+        self.qr_module = 3
+        self.qr_error_correction = "L"
+        self.pdf417_module = 3
+        self._symbol_data = {}
+        self._graphics = None
+
+    def _style(self):
+        return (self.bold, self.underline, self.double_height, self.double_width)
+
+    def _flush_line(self):
+        self.elements.append(("text", self.align, self._line))
+        self._line = []
+
+    def _text(self, data: bytes):
+        text = data.decode(self.code_page, errors="replace")
+        if self._line and self._line[-1][1] == self._style():
+            self._line[-1] = (self._line[-1][0] + text, self._style())
+        else:
+            self._line.append((text, self._style()))
+
+    def feed(self, data: bytes):
+        self._buffer.extend(data)
+        pos = 0
+        buf = self._buffer
+        while pos < len(buf):
+            consumed = self._parse_one(buf, pos)
+            if consumed == 0:
+                break
+            pos += consumed
+        del buf[:pos]
+
+    def close(self):
+        """
+        Termina el trabajo: vacía la línea pendiente
+        """
+        if self._line:
+            self._flush_line()
+        if self._buffer:
+            self.elements.append(("truncated", len(self._buffer)))
+            self._buffer.clear()
+        return self.elements
+
+    def _parse_one(self, buf: bytearray, pos: int) -> int:
+        """
+        Interpreta un comando a partir de pos. Devuelve los bytes consumidos o 0
+        si el comando todavía no está completo.
+        """
+        available = len(buf) - pos
+        byte = buf[pos]
+
+        if byte >= 0x20:
+            end = pos
+            while end < len(buf) and buf[end] >= 0x20:
+                end += 1
+            self._text(bytes(buf[pos:end]))
+            return end - pos
+
+        if byte == 0x0A:  # LF
+            self._flush_line()
+            return 1
+
+        if byte == 0x0D:  # CR
+            return 1
+
+        if byte == 0x10:  # DLE
+            if available < 3:
+                return 0
+            if buf[pos + 1] == 0x04:  # DLE EOT n
+                self.commands += 1
+                if self.status_callback:
+                    self.status_callback(buf[pos + 2])
+                return 3
+            self.unknown_commands += 1
+            return 2
+
+        if byte == 0x1B:  # ESC
+            if available < 2:
+                return 0
+            op = buf[pos + 1]
+            if op == 0x40:  # ESC @
+                if self._line:
+                    self._flush_line()
+                self._reset_state()
+                self.commands += 1
+                return 2
+            if available < 3:
+                return 0
+            n = buf[pos + 2]
+            self.commands += 1
+            if op == 0x61:  # ESC a n
+                self.align = n % 48
+            elif op == 0x45:  # ESC E n
+                self.bold = bool(n & 1)
+            elif op == 0x2D:  # ESC - n
+                self.underline = bool(n % 48)
+            elif op == 0x4D:  # ESC M n (fuente; no cambia el render)
+                pass
+            elif op == 0x21:  # ESC ! n
+                self.bold = bool(n & 0x08)
+                self.double_height = bool(n & 0x10)
+                self.double_width = bool(n & 0x20)
+            elif op == 0x74:  # ESC t n
+                self.code_page = CODE_PAGES.get(n, "cp437")
+            elif op == 0x64:  # ESC d n (avanzar n líneas)
+                if self._line:
+                    self._flush_line()
+                self.elements.append(("feed", n * LINE_HEIGHT_DOTS))
+            elif op == 0x4A:  # ESC J n (avanzar n puntos)
+                if self._line:
+                    self._flush_line()
+                self.elements.append(("feed", n))
+            else:
+                self.commands -= 1
+                self.unknown_commands += 1
+            return 3
+
+        if byte == 0x1D:  # GS
+            if available < 2:
+                return 0
+            op = buf[pos + 1]
+            if op == 0x56:  # GS V m [n] (corte)
+                if available < 3:
+                    return 0
+                m = buf[pos + 2]
+                length = 4 if m in (65, 66, 97, 98, 103, 104) else 3
+                if available < length:
+                    return 0
+                if self._line:
+                    self._flush_line()
+                self.elements.append(("cut",))
+                self.commands += 1
+                return length
+            if op == 0x76:  # GS v 0 m xL xH yL yH d1...dk (raster; m = 1, 2, 3: doble ancho/alto)
+                if available < 8:
+                    return 0
+                width_bytes = buf[pos + 4] | (buf[pos + 5] << 8)
+                height = buf[pos + 6] | (buf[pos + 7] << 8)
+                length = 8 + width_bytes * height
+                if available < length:
+                    return 0
+                m = buf[pos + 3] % 48
+                self._raster(width_bytes, height, bytes(buf[pos + 8:pos + length]), 1 + (m & 1), 1 + (m >> 1 & 1))
+                self.commands += 1
+                return length
+            if op == 0x38:  # GS 8 L p1 p2 p3 p4 m fn ... (gráficos con longitud de 4 bytes)
+                if available < 7:
+                    return 0
+                length = 7 + int.from_bytes(buf[pos + 3:pos + 7], 'little')
+                if available < length:
+                    return 0
+                if buf[pos + 2] == 0x4C:
+                    self._graphics_function(bytes(buf[pos + 7:pos + length]))
+                else:
+                    self.unknown_commands += 1
+                return length
+            if op == 0x21:  # GS ! n (tamaño de carácter)
+                if available < 3:
+                    return 0
+                n = buf[pos + 2]
+                self.double_width = bool(n & 0x70)
+                self.double_height = bool(n & 0x07)
+                self.commands += 1
+                return 3
+            if op in (0x68, 0x77, 0x48):  # GS h n (alto), GS w n (módulo), GS H n (texto legible)
+                if available < 3:
+                    return 0
+                n = buf[pos + 2]
+                if op == 0x68:
+                    self.barcode_height = n
+                elif op == 0x77:
+                    self.barcode_module = n
+                else:
+                    self.barcode_hri = n % 48
+                self.commands += 1
+                return 3
+            if op == 0x6B:  # GS k m ... (código de barras)
+                return self._parse_barcode(buf, pos, available)
+            if op == 0x28:  # GS ( k pL pH cn fn ... (QR / PDF417)
+                if available < 5:
+                    return 0
+                length = 5 + (buf[pos + 3] | (buf[pos + 4] << 8))
+                if available < length:
+                    return 0
+                if buf[pos + 2] == 0x6B and length >= 7:
+                    self._symbol_2d(buf[pos + 5], buf[pos + 6], bytes(buf[pos + 7:pos + length]))
+                elif buf[pos + 2] == 0x4C:  # GS ( L pL pH m fn ... (gráficos)
+                    self._graphics_function(bytes(buf[pos + 5:pos + length]))
+                else:
+                    self.unknown_commands += 1
+                return length
+            self.unknown_commands += 1
+            return 2
+
+        # Otros caracteres de control se ignoran
+        return 1
+
+    def _raster(self, width_bytes: int, height: int, data: bytes, scale_x: int = 1, scale_y: int = 1):
+        """
+        Imagen raster a resolución de impresión (los modos de escala duplican puntos y filas)
+        """
+        if self._line:
+            self._flush_line()
+        if scale_x == 2:
+            data = b''.join(DOUBLED_BYTES[b] for b in data)
+            width_bytes *= 2
+        if scale_y == 2:
+            rows = [data[i:i + width_bytes] for i in range(0, len(data), width_bytes)]
+            data = b''.join(row + row for row in rows)
+            height *= 2
+        self.elements.append(("raster", width_bytes, height, data, self.align))
+
+    def _graphics_function(self, params: bytes):
+        # m fn [parámetros]: función 112 guarda un raster en el buffer de gráficos y 50 lo imprime
+        if len(params) < 2 or params[0] != 48 or params[1] not in (50, 112):
+            self.unknown_commands += 1
+            return
+        self.commands += 1
+        if params[1] == 112 and len(params) >= 10:
+            # a bx by c xL xH yL yH d1...dk
+            scale_x, scale_y = params[3], params[4]
+            width = params[6] | (params[7] << 8)
+            height = params[8] | (params[9] << 8)
+            self._graphics = ((width + 7) // 8, height, params[10:], scale_x, scale_y)
+        elif params[1] == 50 and self._graphics is not None:
+            self._raster(*self._graphics)
+            self._graphics = None
+
+    def _parse_barcode(self, buf: bytearray, pos: int, available: int) -> int:
+        if available < 4:
+            return 0
+        m = buf[pos + 2]
+        if m >= 65:  # función B: GS k m n d1...dn
+            length = 4 + buf[pos + 3]
+            if available < length:
+                return 0
+            data = bytes(buf[pos + 4:pos + length])
+        else:  # función A: GS k m d1...dk NUL
+            end = buf.find(b'\x00', pos + 3)
+            if end < 0:
+                return 0
+            length = end + 1 - pos
+            data = bytes(buf[pos + 3:end])
+        symbology = BARCODE_TYPES.get(m)
+        if symbology is None:
+            self.unknown_commands += 1
+            return length
+        text = data.decode("ascii", errors="replace")
+        if symbology == "code128" and text[:1] == "{":
+            # Se quita el selector de juego de caracteres ({A, {B, {C) y se deshace el escape {{
+            text = text[2:].replace("{{", "{")
+        if self._line:
+            self._flush_line()
+        self.elements.append(("barcode", symbology, text, self.barcode_module, self.barcode_height,
+                              self.barcode_hri, self.align))
+        self.commands += 1
+        return length
+
+    def _symbol_2d(self, cn: int, fn: int, params: bytes):
+        kind = {49: "qr", 48: "pdf417"}.get(cn)
+        if kind is None:
+            self.unknown_commands += 1
+            return
+        self.commands += 1
+        if fn == 67 and params:  # tamaño del módulo
+            if kind == "qr":
+                self.qr_module = params[0]
+            else:
+                self.pdf417_module = params[0]
+        elif fn == 69 and kind == "qr" and params:  # corrección de errores del QR
+            self.qr_error_correction = "LMQH"[min(3, max(0, params[0] - 48))]
+        elif fn == 80:  # guardar datos (el primer byte es m = 48)
+            self._symbol_data[kind] = params[1:]
+        elif fn == 81:  # imprimir lo guardado
+            if self._line:
+                self._flush_line()
+            text = self._symbol_data.get(kind, b'').decode("utf-8", errors="replace")
+            module = self.qr_module if kind == "qr" else self.pdf417_module
+            self.elements.append(("symbol2d", kind, text, module, self.qr_error_correction, self.align))
+
+
+def render_text(elements, columns: int = PAPER_WIDTH_DOTS // CHAR_WIDTH_DOTS) -> str:
+    """
+    Representa el trabajo como texto plano (un bloque por ticket)
+    """
+    lines = []
+    for element in elements:
+        kind = element[0]
+        if kind == "text":
+            _, align, segments = element
+            text = "".join(segment[0] for segment in segments)
+            if align == 1:
+                text = text.center(columns).rstrip()
+            elif align == 2:
+                text = text.rjust(columns)
+            lines.append(text)
+        elif kind == "raster":
+            _, width_bytes, height, _, _ = element
+            lines.append(f"[RASTER {width_bytes * 8}x{height}]".center(columns).rstrip())
+        elif kind == "barcode":
+            _, symbology, text, _, _, hri, _ = element
+            lines.append(f"[{symbology.upper()} {text}]".center(columns).rstrip())
+            if hri:
+                lines.append(text.center(columns).rstrip())
+        elif kind == "symbol2d":
+            lines.append(f"[{element[1].upper()} {element[2]}]".center(columns).rstrip())
+        elif kind == "feed":
+            lines.append("")
+        elif kind == "cut":
+            lines.append("-" * columns + " [CORTE]")
+        elif kind == "truncated":
+            lines.append(f"[TRABAJO TRUNCADO: {element[1]} bytes sin interpretar]")
+    return "\n".join(lines) + "\n"
+
+
+def _raster_image(width_bytes: int, height: int, data: bytes):
+    # En ESC/POS 1 = punto negro; en modo '1' de Pillow 1 = blanco
+    inverted = bytes(255 - b for b in data)
+    return Image.frombytes("1", (width_bytes * 8, height), inverted)
+
+
+def _symbol_render(element, font):
+    """
+    Dibuja un código de barras o QR recibido como comando; sin reportlab (o para PDF417)
+    se dibuja un recuadro con el contenido
+    """
+    kind = element[0]
+    if kind == "barcode":
+        _, symbology, text, module, height, hri, _ = element
+        error_correction = "M"
+    else:
+        _, symbology, text, module, error_correction, _ = element
+        height = 0
+    image = None
+    if symbol_image is not None and symbology != "pdf417":
+        try:
+            image = symbol_image(symbology, text, module_size=max(1, module), height=max(1, height),
+                                 error_correction=error_correction).convert("1")
+        except Exception:
+            image = None
+    if image is None:
+        image = Image.new("1", (min(PAPER_WIDTH_DOTS, 24 + len(text) * CHAR_WIDTH_DOTS), max(height, 60)), 1)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((0, 0, image.width - 1, image.height - 1), outline=0)
+        draw.text((8, 4), f"{symbology.upper()}", font=font, fill=0)
+        draw.text((8, 30), text, font=font, fill=0)
+    if kind == "barcode" and hri:
+        labelled = Image.new("1", (max(image.width, len(text) * CHAR_WIDTH_DOTS), image.height + LINE_HEIGHT_DOTS), 1)
+        labelled.paste(image, ((labelled.width - image.width) // 2, 0))
+        ImageDraw.Draw(labelled).text(((labelled.width - len(text) * CHAR_WIDTH_DOTS) // 2, image.height + 4),
+                                      text, font=font, fill=0)
+        image = labelled
+    return image
+
+
+def render_png(elements, path: str, width_dots: int = PAPER_WIDTH_DOTS):
+    """
+    Dibuja el trabajo como lo imprimiría la impresora (requiere Pillow)
+    """
+    font = None
+    for name in MONOSPACE_FONTS:
+        try:
+            font = ImageFont.truetype(name, 20)
+            break
+        except OSError:
+            continue
+    if font is None:
+        try:
+            font = ImageFont.load_default(size=20)
+        except TypeError:
+            font = ImageFont.load_default()
+
+    rows = []
+    for element in elements:
+        kind = element[0]
+        if kind == "text":
+            _, align, segments = element
+            tall = any(segment[1][2] for segment in segments)
+            rows.append(("text", LINE_HEIGHT_DOTS * (2 if tall else 1), element))
+        elif kind == "raster":
+            image = _raster_image(element[1], element[2], element[3])
+            rows.append(("raster", image.height, (image, element[4])))
+        elif kind in ("barcode", "symbol2d"):
+            image = _symbol_render(element, font)
+            rows.append(("raster", image.height, (image, element[-1])))
+        elif kind == "feed":
+            rows.append(("feed", element[1], None))
+        elif kind == "cut":
+            rows.append(("cut", 12, None))
+
+    canvas = Image.new("1", (width_dots, max(1, sum(row[1] for row in rows))), 1)
+    draw = ImageDraw.Draw(canvas)
+    y = 0
+    for kind, height, payload in rows:
+        if kind == "text":
+            _, align, segments = payload
+            widths = [len(text) * CHAR_WIDTH_DOTS * (2 if style[3] else 1) for text, style in segments]
+            x = [0, (width_dots - sum(widths)) // 2, width_dots - sum(widths)][min(align, 2)]
+            for (text, style), seg_width in zip(segments, widths):
+                bold, underline, double_height, double_width = style
+                # Texto a tamaño normal; los tamaños dobles se escalan como en la impresora
+                normal_width = len(text) * CHAR_WIDTH_DOTS
+                segment = Image.new("1", (max(1, normal_width), LINE_HEIGHT_DOTS), 1)
+                segment_draw = ImageDraw.Draw(segment)
+                segment_draw.text((0, 4), text, font=font, fill=0)
+                if bold:
+                    segment_draw.text((1, 4), text, font=font, fill=0)
+                if double_height or double_width:
+                    segment = segment.resize((max(1, seg_width), LINE_HEIGHT_DOTS * (2 if double_height else 1)))
+                canvas.paste(segment, (x, y + height - segment.height))
+                if underline:
+                    draw.line((x, y + height - 3, x + seg_width, y + height - 3), fill=0)
+                x += seg_width
+        elif kind == "raster":
+            payload, align = payload
+            if payload.width > width_dots:
+                payload = payload.crop((0, 0, width_dots, payload.height))
+            x = [0, (width_dots - payload.width) // 2, width_dots - payload.width][min(align, 2)]
+            canvas.paste(payload, (x, y))
+        elif kind == "cut":
+            for x in range(0, width_dots, 16):
+                draw.line((x, y + 6, x + 8, y + 6), fill=0)
+        y += height
+    canvas.save(path)
+
+
+class EmulatedPrinter:
+    """
+    Servidor TCP que se comporta como una impresora de red ESC/POS
+    """
+
+    def __init__(self, output_dir: str, byte_latency: float = 0.0, buffer_size: int = 4096,
+                 disconnect_rate: float = 0.0, status: str = "online", busy_polls: int = 0,
+                 render: str = "both", quiet: bool = False, journal: str = None):
+        self.output_dir = output_dir
+        self.byte_latency = byte_latency
+        self.buffer_size = buffer_size
+        self.disconnect_rate = disconnect_rate
+        self.status = status
+        self.busy_polls = busy_polls
+        self.render = render
+        self.quiet = quiet
+        self.jobs = 0
+        self.total_bytes = 0
+        self.journal = journal
+        self.waits = 0
+        # Una impresora real procesa un trabajo a la vez; las demás conexiones esperan
+        self._printing = asyncio.Lock()
+
+    def _status_reply(self, writer: asyncio.StreamWriter, state: dict, n: int):
+        if self.status == "none":
+            return
+        offline = self.status == "offline" or state["busy_polls"] > 0
+        state["busy_polls"] -= 1
+        writer.write(bytes([STATUS_OFFLINE if offline else STATUS_ONLINE]))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            # Un buffer de recepción pequeño reduce la ventana TCP como en una impresora real
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer_size)
+
+        waited = self._printing.locked()
+        if waited:
+            self.waits += 1
+        async with self._printing:
+            await self._process(reader, writer, waited)
+
+    async def _process(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, waited: bool):
+        self.jobs += 1
+        job_id = self.jobs
+        state = {"busy_polls": self.busy_polls}
+        parser = ESCPOSParser(status_callback=lambda n: self._status_reply(writer, state, n))
+        disconnect_at = None
+        if self.disconnect_rate and random.random() < self.disconnect_rate:
+            disconnect_at = random.randint(1, 64 * 1024)
+
+        started = time.perf_counter()
+        received = 0
+        disconnected = False
+        try:
+            while True:
+                data = await reader.read(self.buffer_size)
+                if not data:
+                    break
+                received += len(data)
+                parser.feed(data)
+                await writer.drain()
+                if self.byte_latency:
+                    await asyncio.sleep(len(data) * self.byte_latency)
+                if disconnect_at is not None and received >= disconnect_at:
+                    disconnected = True
+                    writer.transport.abort()
+                    break
+        except ConnectionError:
+            disconnected = True
+        finally:
+            if not writer.is_closing():
+                writer.close()
+
+        elapsed = time.perf_counter() - started
+        self.total_bytes += received
+        elements = parser.close()
+        self._save_job(job_id, elements)
+        if self.journal:
+            self._write_journal(job_id, started, elapsed, received, waited, disconnected, elements)
+        if not self.quiet:
+            rate = received / elapsed if elapsed > 0 else 0
+            note = " (desconexión simulada)" if disconnected else ""
+            print(f"🧾 Trabajo {job_id}: {received} bytes, {parser.commands} comandos, "
+                  f"{parser.unknown_commands} desconocidos, {rate:,.0f} B/s{note}")
+
+    def _write_journal(self, job_id, started, elapsed, received, waited, disconnected, elements):
+        boletas = []
+        for element in elements:
+            if element[0] == "text":
+                text = "".join(segment[0] for segment in element[2])
+                if text.startswith("BOLETA"):
+                    boletas.append(text.split(":", 1)[-1].strip())
+        entry = {
+            "job": job_id,
+            "start": started,
+            "end": started + elapsed,
+            "bytes": received,
+            "waited": waited,
+            "disconnected": disconnected,
+            "boletas": boletas,
+        }
+        with open(self.journal, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _save_job(self, job_id: int, elements):
+        if self.render == "none":
+            return
+        base = os.path.join(self.output_dir, f"job_{job_id:05d}")
+        if self.render in ("text", "both"):
+            with open(base + ".txt", "w", encoding="utf-8") as f:
+                f.write(render_text(elements))
+        if self.render in ("png", "both") and Image is not None:
+            render_png(elements, base + ".png")
+
+    async def serve(self, host: str, port: int):
+        os.makedirs(self.output_dir, exist_ok=True)
+        # SO_RCVBUF en el socket de escucha: la ventana TCP se negocia pequeña desde la conexión
+        # (fijarlo después de aceptar no reduce la ventana ya anunciada)
+        listener = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.buffer_size)
+        listener.bind((host, port))
+        server = await asyncio.start_server(self.handle, sock=listener)
+        print(f"🖨️  Emulador ESC/POS escuchando en {host}:{port} -> {self.output_dir}")
+        if Image is None and self.render in ("png", "both"):
+            print("💡 Pillow no está instalado: solo se generarán archivos .txt")
+        async with server:
+            await server.serve_forever()
+
+
+class EmulatedCUPS:
+    """
+    Servidor IPP mínimo que sustituye a cupsd para probar la ruta USB de la API:
+    Print-Job (guarda e interpreta el trabajo como el emulador TCP), Get-Jobs,
+    Get-Job-Attributes y CUPS-Get-Printers. Cada cola procesa un trabajo a la vez
+    y tarda --job-seconds en pasarlo a 'completed' (o 'aborted' según --abort-rate).
+    """
+
+    def __init__(self, output_dir: str, printers, job_seconds: float = 0.5, abort_rate: float = 0.0,
+                 render: str = "both", quiet: bool = False):
+        self.output_dir = output_dir
+        self.printers = {name: asyncio.Lock() for name in printers}
+        self.job_seconds = job_seconds
+        self.abort_rate = abort_rate
+        self.renderer = EmulatedPrinter(output_dir, render=render, quiet=True)
+        self.quiet = quiet
+        self.jobs = {}
+        self.requests = 0
+
+    def _job_attributes(self, job_id: int):
+        job = self.jobs[job_id]
+        return [
+            ("job-id", ipp.TAG_INTEGER, job_id),
+            ("job-uri", ipp.TAG_URI, f"ipp://localhost/jobs/{job_id}"),
+            ("job-state", ipp.TAG_ENUM, job["state"]),
+            ("job-state-reasons", ipp.TAG_KEYWORD, job["reasons"]),
+            ("job-printer-uri", ipp.TAG_URI, f"ipp://localhost/printers/{job['printer']}"),
+        ]
+
+    async def _run_job(self, job_id: int, data: bytes):
+        job = self.jobs[job_id]
+        async with self.printers[job["printer"]]:
+            job["state"], job["reasons"] = ipp.JOB_PROCESSING, "job-printing"
+            await asyncio.sleep(self.job_seconds)
+            if self.abort_rate and random.random() < self.abort_rate:
+                job["state"], job["reasons"] = ipp.JOB_ABORTED, "job-aborted-by-system"
+            else:
+                escpos = ESCPOSParser()
+                escpos.feed(data)
+                self.renderer._save_job(job_id, escpos.close())
+                job["state"], job["reasons"] = ipp.JOB_COMPLETED, "job-completed-successfully"
+        if not self.quiet:
+            print(f"🧾 Trabajo {job_id} ({job['printer']}): {len(data)} bytes, "
+                  f"{ipp.JOB_STATE_NAMES[job['state']]}")
+
+    def _dispatch(self, request):
+        operation = request.attribute
+        status, groups = ipp.STATUS_OK, []
+        if request.code == ipp.OP_PRINT_JOB:
+            name = (operation("printer-uri", ipp.TAG_OPERATION) or "").rsplit("/", 1)[-1]
+            if name not in self.printers:
+                return ipp.STATUS_NOT_FOUND, [], f"Impresora no encontrada: {name}"
+            job_id = len(self.jobs) + 1
+            self.jobs[job_id] = {"printer": name, "state": ipp.JOB_PENDING, "reasons": "none"}
+            asyncio.get_running_loop().create_task(self._run_job(job_id, request.data))
+            groups.append((ipp.TAG_JOB, self._job_attributes(job_id)))
+        elif request.code == ipp.OP_GET_JOB_ATTRIBUTES:
+            job_id = operation("job-id", ipp.TAG_OPERATION)
+            if job_id is None:
+                job_id = int((operation("job-uri", ipp.TAG_OPERATION) or "0").rsplit("/", 1)[-1])
+            if job_id not in self.jobs:
+                return ipp.STATUS_NOT_FOUND, [], f"Trabajo no encontrado: {job_id}"
+            groups.append((ipp.TAG_JOB, self._job_attributes(job_id)))
+        elif request.code == ipp.OP_GET_JOBS:
+            completed = operation("which-jobs", ipp.TAG_OPERATION) == "completed"
+            for job_id, job in self.jobs.items():
+                if (job["state"] in ipp.TERMINAL_JOB_STATES) == completed:
+                    groups.append((ipp.TAG_JOB, self._job_attributes(job_id)))
+        elif request.code == ipp.OP_CUPS_GET_PRINTERS:
+            for name, lock in self.printers.items():
+                groups.append((ipp.TAG_PRINTER, [
+                    ("printer-name", ipp.TAG_NAME, name),
+                    ("printer-state", ipp.TAG_ENUM, 4 if lock.locked() else 3),
+                    ("printer-is-accepting-jobs", ipp.TAG_BOOLEAN, True),
+                    ("printer-state-message", ipp.TAG_TEXT, ""),
+                ]))
+        else:
+            return ipp.STATUS_OPERATION_NOT_SUPPORTED, [], "Operación no soportada"
+        return status, groups, "successful-ok"
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if "chunked" in headers.get("transfer-encoding", ""):
+                body = bytearray()
+                while True:
+                    size = int((await reader.readline()).split(b";")[0], 16)
+                    if size == 0:
+                        break
+                    body += await reader.readexactly(size)
+                    await reader.readline()
+            else:
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+            self.requests += 1
+            if not request_line.startswith(b"POST"):
+                writer.write(b"HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+            request = ipp.decode_message(bytes(body))
+            status, groups, message = self._dispatch(request)
+            response = ipp.encode_message(status, request.request_id, [
+                (ipp.TAG_OPERATION, ipp.operation_attributes() + [("status-message", ipp.TAG_TEXT, message)])
+            ] + groups)
+            writer.write(
+                f"HTTP/1.1 200 OK\r\nContent-Type: application/ipp\r\nContent-Length: {len(response)}\r\n"
+                f"Connection: close\r\n\r\n".encode("ascii") + response
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            if not self.quiet:
+                print(f"⚠️ Solicitud IPP inválida: {e}")
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        os.makedirs(self.output_dir, exist_ok=True)
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"🖨️  CUPS emulado (IPP) en {host}:{port}, colas: {', '.join(self.printers)} -> {self.output_dir}")
+        async with server:
+            await server.serve_forever()
+
+
+def lp_main(argv) -> int:
+    """
+    Sustituto mínimo de 'lp -d IMPRESORA -o raw': interpreta el trabajo de stdin
+    y lo guarda en ESCPOS_EMULATOR_DIR (por defecto ./trabajos_lp)
+    """
+    parser = argparse.ArgumentParser(prog="lp")
+    parser.add_argument("-d", dest="destination", default="EMULADOR")
+    parser.add_argument("-o", dest="options", action="append", default=[])
+    args, _ = parser.parse_known_args(argv)
+
+    data = sys.stdin.buffer.read()
+    output_dir = os.environ.get("ESCPOS_EMULATOR_DIR", "trabajos_lp")
+    os.makedirs(output_dir, exist_ok=True)
+    job_id = len([name for name in os.listdir(output_dir) if name.endswith(".txt")]) + 1
+
+    escpos = ESCPOSParser()
+    escpos.feed(data)
+    printer = EmulatedPrinter(output_dir, quiet=True)
+    printer._save_job(job_id, escpos.close())
+    print(f"request id is {args.destination}-{job_id} (1 file(s))")
+    return 0
+
+
+def lpstat_main(argv) -> int:
+    """
+    Sustituto mínimo de 'lpstat -p' con una impresora emulada
+    """
+    name = os.environ.get("ESCPOS_EMULATOR_PRINTER", "EMULADOR")
+    print(f"printer {name} is idle.  enabled since {time.strftime('%a %d %b %Y %H:%M:%S')}")
+    return 0
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    program = os.path.basename(sys.argv[0])
+    if program == "lp":
+        return lp_main(argv)
+    if program == "lpstat":
+        return lpstat_main(argv)
+
+    parser = argparse.ArgumentParser(description="Emulador de impresora térmica ESC/POS")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve", help="Impresora de red emulada (TCP)")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=9100)
+    serve.add_argument("--output-dir", default="trabajos")
+    serve.add_argument("--byte-latency", type=float, default=0.0, help="Segundos de procesamiento por byte")
+    serve.add_argument("--buffer-size", type=int, default=4096, help="Buffer de recepción en bytes")
+    serve.add_argument("--disconnect-rate", type=float, default=0.0, help="Probabilidad de cortar la conexión a mitad de trabajo")
+    serve.add_argument("--status", choices=["online", "offline", "none"], default="online",
+                       help="Respuesta a DLE EOT ('none' = no responde)")
+    serve.add_argument("--busy-polls", type=int, default=0, help="Consultas de estado que se responden como ocupada en cada conexión")
+    serve.add_argument("--render", choices=["both", "text", "png", "none"], default="both")
+    serve.add_argument("--quiet", action="store_true")
+    serve.add_argument("--journal", help="Archivo JSONL con un registro por trabajo (orden y boletas impresas)")
+
+    cups = subparsers.add_parser("ipp", help="CUPS emulado: servidor IPP para la ruta USB (PRINTER_CUPS_IPP / CUPS_SERVER)")
+    cups.add_argument("--host", default="127.0.0.1")
+    cups.add_argument("--port", type=int, default=8631)
+    cups.add_argument("--printer", action="append", help="Nombre de cola (se puede repetir; por defecto EMULADOR)")
+    cups.add_argument("--output-dir", default="trabajos_ipp")
+    cups.add_argument("--job-seconds", type=float, default=0.5, help="Tiempo que tarda cada trabajo en completarse")
+    cups.add_argument("--abort-rate", type=float, default=0.0, help="Probabilidad de que un trabajo termine como 'aborted'")
+    cups.add_argument("--render", choices=["both", "text", "png", "none"], default="both")
+    cups.add_argument("--quiet", action="store_true")
+
+    subparsers.add_parser("lp", help="Sustituto de 'lp' (lee el trabajo de stdin)", add_help=False)
+    subparsers.add_parser("lpstat", help="Sustituto de 'lpstat -p'", add_help=False)
+
+    args, rest = parser.parse_known_args(argv)
+    if args.command == "lp":
+        return lp_main(rest)
+    if args.command == "lpstat":
+        return lpstat_main(rest)
+    if args.command == "ipp":
+        if ipp is None:
+            print("❌ ipp_protocol.py no encontrado junto al emulador")
+            return 1
+        cups = EmulatedCUPS(args.output_dir, args.printer or ["EMULADOR"], args.job_seconds,
+                            args.abort_rate, args.render, args.quiet)
+        try:
+            asyncio.run(cups.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            print(f"\n✅ {len(cups.jobs)} trabajo(s), {cups.requests} solicitud(es) IPP")
+        return 0
+
+    printer = EmulatedPrinter(
+        output_dir=args.output_dir,
+        byte_latency=args.byte_latency,
+        buffer_size=args.buffer_size,
+        disconnect_rate=args.disconnect_rate,
+        status=args.status,
+        busy_polls=args.busy_polls,
+        render=args.render,
+        quiet=args.quiet,
+        journal=args.journal,
+    )
+    try:
+        asyncio.run(printer.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print(f"\n✅ {printer.jobs} trabajo(s), {printer.total_bytes} bytes recibidos, "
+              f"{printer.waits} conexión(es) en espera de otro trabajo")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Codificación compacta de imágenes raster ESC/POS, sin dependencias.
+Recibe un bloque GS v 0 (como los que genera convert_logo_escpos.py) y lo reescribe
+con menos bytes y el mismo resultado impreso (imagen centrada):
+
+    - Se recortan las columnas en blanco de los bordes (lo mismo por cada lado, para
+      no mover la imagen centrada).
+    - Con dot_feed=True las filas en blanco (bordes superior e inferior y huecos internos)
+      se sustituyen por avances de papel ESC J n cuando eso ocupa menos que enviarlas.
+      ESC J avanza n unidades de movimiento vertical (GS P), no n puntos: solo se usa en
+      impresoras cuya unidad vertical es el paso del punto; si no, las filas se envían.
+    - La imagen se divide en bandas de como máximo band_height filas, que la impresora
+      procesa sin llenar su buffer de recepción.
+    - Las bandas cuyas filas vienen repetidas de dos en dos, o cuyos puntos vienen
+      duplicados en horizontal (códigos de barras, QR con módulos pares, logos
+      ampliados), se envían a la mitad de resolución con el modo de escala de la
+      impresora (GS v 0 m = 1, 2, 3 o bx/by = 2 en GS ( L).
+    - Con graphics_buffer=True las bandas se envían con GS ( L / GS 8 L (función 112:
+      guardar en el buffer de gráficos; función 50: imprimir) en lugar de GS v 0.
+
+Uso:
+    from scripts.escpos_raster import compact_escpos_raster
+    compacto = compact_escpos_raster(open("logo_escpos.bin", "rb").read())
+    compacto = compact_escpos_raster(datos, dot_feed=True)   (ESC J n = n puntos)
+
+Requisitos:
+    Ninguno (solo biblioteca estándar)
+"""
+
+import struct
+
+GS_V0 = b'\x1D\x76\x30'
+ESC_J = b'\x1B\x4A'
+# GS ( L pL pH 48 50: imprimir el gráfico guardado en el buffer
+GRAPHICS_PRINT = b'\x1D\x28\x4C\x02\x00\x30\x32'
+
+DEFAULT_BAND_HEIGHT = 256
+MAX_FEED_DOTS = 255
+
+# Byte -> los 16 bits que resultan de duplicar cada punto en horizontal, y su inversa
+_DOUBLED = [sum(((b >> bit) & 1) * (0b11 << (2 * bit)) for bit in range(8)) for b in range(256)]
+_HALVED = {doubled: b for b, doubled in enumerate(_DOUBLED)}
+
+
+def parse_raster(data):
+    """
+    Devuelve (ancho_en_bytes, alto, mapa_de_bits) si data es exactamente un bloque
+    GS v 0 en modo normal (m = 0); None para cualquier otra cosa
+    """
+    if len(data) < 8 or data[:3] != GS_V0 or data[3] not in (0, 48):
+        return None
+    width_bytes, height = struct.unpack('<HH', data[4:8])
+    if not width_bytes or not height or len(data) != 8 + width_bytes * height:
+        return None
+    return width_bytes, height, data[8:]
+
+
+def _feed(dots):
+    out = b''
+    while dots > 0:
+        step = min(dots, MAX_FEED_DOTS)
+        out += ESC_J + bytes([step])
+        dots -= step
+    return out
+
+
+def _halve_rows(rows):
+    """Filas a la mitad de alto si vienen repetidas de dos en dos (None si no)"""
+    if len(rows) % 2 or any(rows[i] != rows[i + 1] for i in range(0, len(rows), 2)):
+        return None
+    return rows[::2]
+
+
+def _halve_columns(rows):
+    """Filas a la mitad de ancho si cada punto viene duplicado en horizontal (None si no)"""
+    if len(rows[0]) % 2:
+        return None
+    halved = []
+    for row in rows:
+        out = bytearray()
+        for i in range(0, len(row), 2):
+            b = _HALVED.get((row[i] << 8) | row[i + 1])
+            if b is None:
+                return None
+            out.append(b)
+        halved.append(bytes(out))
+    return halved
+
+
+def _band(rows, graphics_buffer):
+    """Una banda con el mayor factor de escala que la reproduce exactamente"""
+    scale_y = 1
+    halved = _halve_rows(rows)
+    if halved is not None:
+        rows, scale_y = halved, 2
+    scale_x = 1
+    halved = _halve_columns(rows)
+    if halved is not None:
+        rows, scale_x = halved, 2
+    width_bytes = len(rows[0])
+    data = b''.join(rows)
+    if not graphics_buffer:
+        m = (scale_x - 1) | ((scale_y - 1) << 1)
+        return GS_V0 + bytes([m]) + struct.pack('<HH', width_bytes, len(rows)) + data
+    # Función 112: a = 48 (monocromo), bx, by, c = 49 (color 1), ancho y alto en puntos
+    body = b'\x30\x70\x30' + bytes([scale_x, scale_y, 0x31]) + struct.pack('<HH', width_bytes * 8, len(rows)) + data
+    if len(body) <= 0xFFFF:
+        store = b'\x1D\x28\x4C' + struct.pack('<H', len(body)) + body
+    else:
+        store = b'\x1D\x38\x4C' + struct.pack('<I', len(body)) + body
+    return store + GRAPHICS_PRINT
+
+
+def _feed_segments(rows, header):
+    """
+    Tramos [(es_avance, filas)]: las rachas en blanco se avanzan con ESC J si ocupan más
+    que enviarlas más la cabecera de la banda siguiente
+    """
+    height = len(rows)
+    width_bytes = len(rows[0])
+    blank = bytes(width_bytes)
+    segments = []
+    i = 0
+    while i < height:
+        j = i
+        while j < height and rows[j] == blank:
+            j += 1
+        run = j - i
+        if run and run * width_bytes > 3 * -(-run // MAX_FEED_DOTS) + header:
+            segments.append((True, run))
+            i = j
+            continue
+        # Filas con contenido (y rachas en blanco cortas) hasta la siguiente racha larga
+        j = i + run
+        while j < height:
+            if rows[j] != blank:
+                j += 1
+                continue
+            k = j
+            while k < height and rows[k] == blank:
+                k += 1
+            if (k - j) * width_bytes > 3 * -(-(k - j) // MAX_FEED_DOTS) + header:
+                break
+            j = k
+        segments.append((False, rows[i:j]))
+        i = j
+    return segments
+
+
+def compact_raster(width_bytes, height, bitmap, band_height=DEFAULT_BAND_HEIGHT, graphics_buffer=False,
+                   dot_feed=False):
+    """
+    Codifica un mapa de bits (1 = punto negro, filas de width_bytes bytes) con el menor
+    número de bytes que imprime lo mismo que un único GS v 0.
+
+    Args:
+        width_bytes: Ancho de cada fila en bytes
+        height: Número de filas
+        bitmap: Datos de la imagen (width_bytes * height bytes)
+        band_height: Alto máximo de cada banda impresa, en puntos
+        graphics_buffer: Usar GS ( L / GS 8 L (función 112 + 50) en lugar de GS v 0
+        dot_feed: ESC J n avanza n puntos en esta impresora (se usa para las filas en blanco)
+    """
+    band_height = max(2, band_height - band_height % 2)
+    rows = [bytes(bitmap[i * width_bytes:(i + 1) * width_bytes]) for i in range(height)]
+    blank = bytes(width_bytes)
+    content = [row for row in rows if row != blank]
+    if not content and dot_feed:
+        return _feed(height)
+
+    # Recorte simétrico de columnas en blanco
+    trim = 0
+    if content:
+        left = min(len(row) - len(row.lstrip(b'\x00')) for row in content)
+        right = min(len(row) - len(row.rstrip(b'\x00')) for row in content)
+        trim = min(left, right)
+    if trim:
+        rows = [row[trim:width_bytes - trim] for row in rows]
+        width_bytes -= 2 * trim
+
+    header = 8 if not graphics_buffer else 17 + len(GRAPHICS_PRINT)
+    segments = _feed_segments(rows, header) if dot_feed else [(False, rows)]
+
+    out = b''
+    for is_feed, segment in segments:
+        if is_feed:
+            out += _feed(segment)
+            continue
+        for start in range(0, len(segment), band_height):
+            out += _band(segment[start:start + band_height], graphics_buffer)
+    return out
+
+
+def compact_escpos_raster(data, band_height=DEFAULT_BAND_HEIGHT, graphics_buffer=False, dot_feed=False):
+    """
+    Versión compacta de un bloque GS v 0; cualquier otro contenido (varios bloques,
+    otros modos o datos ya compactados) se devuelve sin cambios
+    """
+    raster = parse_raster(data)
+    if raster is None:
+        return data
+    compacted = compact_raster(*raster, band_height=band_height, graphics_buffer=graphics_buffer, dot_feed=dot_feed)
+    return compacted if len(compacted) < len(data) else data
@@ -0,0 +1,197 @@
+"""
+Codificación y decodificación de mensajes IPP (RFC 8010), sin dependencias.
+Lo usan el cliente IPP de la API de impresión (envío de trabajos a CUPS) y el
+CUPS emulado para pruebas (subcomando 'ipp' de escpos_emulator.py).
+
+Uso:
+    from scripts.ipp_protocol import encode_message, decode_message, OP_PRINT_JOB, TAG_OPERATION
+    body = encode_message(OP_PRINT_JOB, 1, [(TAG_OPERATION, operation_attributes("ipp://localhost/printers/TM20"))])
+    message = decode_message(respuesta)
+    message.attribute("job-id")
+
+Requisitos:
+    Ninguno (solo biblioteca estándar)
+"""
+
+import struct
+
+# Operaciones
+OP_PRINT_JOB = 0x0002
+OP_GET_JOB_ATTRIBUTES = 0x0009
+OP_GET_JOBS = 0x000A
+OP_GET_PRINTER_ATTRIBUTES = 0x000B
+OP_CUPS_GET_PRINTERS = 0x4002
+
+# Códigos de estado
+STATUS_OK = 0x0000
+STATUS_OK_IGNORED = 0x0001
+STATUS_BAD_REQUEST = 0x0400
+STATUS_NOT_FOUND = 0x0406
+STATUS_OPERATION_NOT_SUPPORTED = 0x0501
+
+# Delimitadores de grupos
+TAG_OPERATION = 0x01
+TAG_JOB = 0x02
+TAG_END = 0x03
+TAG_PRINTER = 0x04
+TAG_UNSUPPORTED = 0x05
+
+# Tipos de valor
+TAG_UNKNOWN = 0x12
+TAG_NO_VALUE = 0x13
+TAG_INTEGER = 0x21
+TAG_BOOLEAN = 0x22
+TAG_ENUM = 0x23
+TAG_OCTET_STRING = 0x30
+TAG_TEXT = 0x41
+TAG_NAME = 0x42
+TAG_KEYWORD = 0x44
+TAG_URI = 0x45
+TAG_CHARSET = 0x47
+TAG_LANGUAGE = 0x48
+TAG_MIME_TYPE = 0x49
+
+INTEGER_TAGS = (TAG_INTEGER, TAG_ENUM)
+STRING_TAGS = (TAG_TEXT, TAG_NAME, TAG_KEYWORD, TAG_URI, TAG_CHARSET, TAG_LANGUAGE, TAG_MIME_TYPE, 0x46)
+
+# job-state (RFC 8011 5.3.7)
+JOB_PENDING = 3
+JOB_HELD = 4
+JOB_PROCESSING = 5
+JOB_STOPPED = 6
+JOB_CANCELED = 7
+JOB_ABORTED = 8
+JOB_COMPLETED = 9
+JOB_STATE_NAMES = {
+    3: "pending", 4: "pending-held", 5: "processing", 6: "processing-stopped",
+    7: "canceled", 8: "aborted", 9: "completed",
+}
+TERMINAL_JOB_STATES = (JOB_CANCELED, JOB_ABORTED, JOB_COMPLETED)
+
+# printer-state
+PRINTER_STATE_NAMES = {3: "idle", 4: "processing", 5: "stopped"}
+
+
+class IPPMessage:
+    """Mensaje IPP decodificado: grupos de atributos como [(tag, {nombre: [valores]})]"""
+
+    def __init__(self, version, code, request_id, groups, data=b''):
+        self.version = version
+        self.code = code
+        self.request_id = request_id
+        self.groups = groups
+        self.data = data
+
+    def attribute(self, name, group=None, default=None):
+        """Primer valor del atributo (en el primer grupo que lo tenga)"""
+        for tag, attributes in self.groups:
+            if (group is None or tag == group) and name in attributes:
+                return attributes[name][0]
+        return default
+
+    def group_list(self, group):
+        """Todos los grupos de un tipo (p. ej. un grupo de trabajo por cada trabajo de Get-Jobs)"""
+        return [attributes for tag, attributes in self.groups if tag == group]
+
+
+def _value_bytes(tag, value):
+    if tag in INTEGER_TAGS:
+        return struct.pack(">i", value)
+    if tag == TAG_BOOLEAN:
+        return b'\x01' if value else b'\x00'
+    if tag in (TAG_NO_VALUE, TAG_UNKNOWN):
+        return b''
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+
+def encode_message(code, request_id, groups, data=b'', version=(2, 0)):
+    """
+    Codifica un mensaje IPP.
+
+    Args:
+        code: Operación (solicitud) o código de estado (respuesta)
+        request_id: Identificador de la solicitud
+        groups: [(tag_de_grupo, [(nombre, tag_de_valor, valor o lista de valores)])]
+        data: Documento que sigue a los atributos (p. ej. el ticket ESC/POS)
+    """
+    out = bytearray(struct.pack(">bbhi", version[0], version[1], code, request_id))
+    for group_tag, attributes in groups:
+        out.append(group_tag)
+        for name, value_tag, values in attributes:
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            for i, value in enumerate(values):
+                encoded_name = name.encode('utf-8') if i == 0 else b''
+                encoded_value = _value_bytes(value_tag, value)
+                out.append(value_tag)
+                out += struct.pack(">h", len(encoded_name)) + encoded_name
+                out += struct.pack(">h", len(encoded_value)) + encoded_value
+    out.append(TAG_END)
+    return bytes(out) + data
+
+
+def decode_message(body):
+    """
+    Decodifica un mensaje IPP (solicitud o respuesta)
+    """
+    if len(body) < 9:
+        raise ValueError("Mensaje IPP incompleto")
+    major, minor, code, request_id = struct.unpack(">bbhi", body[:8])
+    pos = 8
+    groups = []
+    current = None
+    last_name = None
+    while pos < len(body):
+        tag = body[pos]
+        pos += 1
+        if tag == TAG_END:
+            break
+        if tag < 0x10:
+            current = {}
+            groups.append((tag, current))
+            last_name = None
+            continue
+        if current is None:
+            raise ValueError("Atributo IPP fuera de un grupo")
+        name_length = struct.unpack(">h", body[pos:pos + 2])[0]
+        pos += 2
+        name = body[pos:pos + name_length].decode('utf-8')
+        pos += name_length
+        value_length = struct.unpack(">h", body[pos:pos + 2])[0]
+        pos += 2
+        raw = body[pos:pos + value_length]
+        pos += value_length
+        if tag in INTEGER_TAGS and value_length == 4:
+            value = struct.unpack(">i", raw)[0]
+        elif tag == TAG_BOOLEAN:
+            value = raw != b'\x00'
+        elif tag in STRING_TAGS:
+            value = raw.decode('utf-8', errors='replace')
+        elif tag in (TAG_NO_VALUE, TAG_UNKNOWN):
+            value = None
+        else:
+            value = raw
+        if name:
+            last_name = name
+            current[name] = [value]
+        elif last_name is not None:
+            # Nombre vacío: valor adicional del atributo anterior (1setOf)
+            current[last_name].append(value)
+    return IPPMessage((major, minor), code, request_id, groups, bytes(body[pos:]))
+
+
+def operation_attributes(uri=None, user=None, uri_name="printer-uri"):
+    """
+    Atributos de operación obligatorios (charset, idioma) más el destino y el usuario
+    """
+    attributes = [
+        ("attributes-charset", TAG_CHARSET, "utf-8"),
+        ("attributes-natural-language", TAG_LANGUAGE, "es-mx"),
+    ]
+    if uri:
+        attributes.append((uri_name, TAG_URI, uri))
+    if user:
+        attributes.append(("requesting-user-name", TAG_NAME, user))
+    return attributes
@@ -0,0 +1,340 @@
+"""
+Generador de carga para la API de impresión de tickets (main_updated.py).
+
+Envía solicitudes a /api/printer/print-ticket (o a sus variantes /fast y
+/multipart, con --mode) con la concurrencia y la mezcla de solicitudes
+indicadas (con/sin logo, número de copias, destinos de red o USB) y
+reporta rendimiento, latencias p50/p95/p99,
+tasa de error y el retraso del event loop del servidor, medido con
+sondeos periódicos a /health mientras corre la prueba.
+
+Pensado para usarse contra escpos_emulator.py, para no ocupar impresoras
+reales:
+
+    python escpos_emulator.py serve --port 9100 --render none &
+    python loadtest_printer_api.py --requests 500 --concurrency 20 \\
+        --targets network:127.0.0.1:9100 --logo-ratio 0.5 --copias 1-3 \\
+        --output resultados.json
+
+Requisitos:
+    pip install httpx
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import struct
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+
+
+ENDPOINTS = {
+    "json": "/api/printer/print-ticket",
+    "fast": "/api/printer/print-ticket/fast",
+    "multipart": "/api/printer/print-ticket/multipart",
+}
+
+
+def percentile(values, pct: float) -> float:
+    """
+    Percentil por rango más cercano (values debe estar ordenado)
+    """
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def latency_summary(values) -> dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean_ms": (sum(ordered) / len(ordered) * 1000) if ordered else 0.0,
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p95_ms": percentile(ordered, 95) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "max_ms": (ordered[-1] * 1000) if ordered else 0.0,
+    }
+
+
+def synthetic_logo(width: int = 304, height: int = 120) -> bytes:
+    """
+    Raster GS v 0 sintético del tamaño típico del logo, para no depender de un archivo
+    """
+    width_bytes = width // 8
+    rows = bytearray()
+    for y in range(height):
+        rows.extend(bytes((0xFF if (x + y // 8) % 3 else 0x00) for x in range(width_bytes)))
+    return b'\x1D\x76\x30\x00' + struct.pack('<HH', width_bytes, height) + bytes(rows)
+
+
+def parse_targets(spec: str) -> list:
+    """
+    'network:IP:PUERTO,usb:NOMBRE' -> lista de printer_config
+    """
+    targets = []
+    for item in spec.split(","):
+        kind, _, rest = item.strip().partition(":")
+        if kind == "network":
+            ip, _, port = rest.partition(":")
+            targets.append({"connection_type": "network", "ip": ip, "port": int(port or 9100)})
+        elif kind == "usb":
+            targets.append({"connection_type": "usb", "printer_name": rest})
+        else:
+            raise ValueError(f"Destino inválido: {item}")
+    return targets
+
+
+def parse_range(spec: str) -> tuple:
+    low, _, high = spec.partition("-")
+    return int(low), int(high or low)
+
+
+class LoadTest:
+
+    def __init__(self, args):
+        self.args = args
+        self.targets = parse_targets(args.targets)
+        self.copias_range = parse_range(args.copias)
+        self.logo = None
+        self.logo_b64 = None
+        if args.logo_ratio > 0:
+            self.logo = open(args.logo_file, "rb").read() if args.logo_file else synthetic_logo()
+            self.logo_b64 = base64.b64encode(self.logo).decode("ascii")
+        self.run_id = uuid.uuid4().hex[:8]
+        self.latencies = []
+        self.errors = []
+        self.status_codes = {}
+        self.request_bytes = 0
+        self.health_latencies = []
+        self.local_loop_lag = []
+        self._issued = 0
+        self._recent_boletas = []
+
+    def build_request(self, n: int) -> dict:
+        args = self.args
+        # Boleta única por solicitud, salvo los duplicados intencionales (prueban la idempotencia)
+        if self._recent_boletas and random.random() < args.duplicate_ratio:
+            return random.choice(self._recent_boletas)
+        body = {
+            "printer_config": dict(random.choice(self.targets), timeout=args.printer_timeout),
+            "producto": "SOYA",
+            "fecha": datetime.now().strftime("%d/%m/%Y"),
+            "boleta": f"LT-{self.run_id}-{n:06d}",
+            "cliente": "Cliente de Prueba Núñez",
+            "destino": "Culiacán, Sinaloa",
+            "placas": "ABC-1234",
+            "vehiculo": "Tráiler",
+            "chofer": "José Peña",
+            "copias": random.randint(*self.copias_range),
+        }
+        if self.logo_b64 and random.random() < args.logo_ratio:
+            body["logo"] = self.logo_b64 if args.mode != "multipart" else True
+        self._recent_boletas = (self._recent_boletas + [body])[-50:]
+        return body
+
+    def build_http_request(self, client: httpx.AsyncClient, url: str, body: dict) -> httpx.Request:
+        if self.args.mode == "multipart":
+            body = dict(body)
+            files = {"logo": ("logo_escpos.bin", self.logo, "application/octet-stream")} if body.pop("logo", None) else None
+            request = client.build_request("POST", url, data={"ticket": json.dumps(body)}, files=files)
+        else:
+            payload = json.dumps(body).encode("utf-8")
+            request = client.build_request("POST", url, content=payload, headers={"Content-Type": "application/json"})
+        request.read()
+        return request
+
+    async def worker(self, client: httpx.AsyncClient, deadline: float):
+        url = self.args.url.rstrip("/") + (self.args.endpoint or ENDPOINTS[self.args.mode])
+        while True:
+            if self.args.requests and self._issued >= self.args.requests:
+                return
+            if deadline and time.perf_counter() >= deadline:
+                return
+            self._issued += 1
+            request = self.build_http_request(client, url, self.build_request(self._issued))
+            self.request_bytes += len(request.content)
+            started = time.perf_counter()
+            try:
+                response = await client.send(request)
+                elapsed = time.perf_counter() - started
+                self.status_codes[response.status_code] = self.status_codes.get(response.status_code, 0) + 1
+                if response.status_code == 200:
+                    self.latencies.append(elapsed)
+                else:
+                    self.errors.append(f"HTTP {response.status_code}: {response.text[:200]}")
+            except httpx.HTTPError as e:
+                self.status_codes["exception"] = self.status_codes.get("exception", 0) + 1
+                self.errors.append(f"{type(e).__name__}: {e}")
+
+    async def probe_health(self, client: httpx.AsyncClient, stop: asyncio.Event):
+        """
+        Latencia de /health durante la prueba: si el servidor bloquea su event loop
+        (p. ej. con sockets bloqueantes) esta latencia crece en la misma medida
+        """
+        url = self.args.url.rstrip("/") + "/health"
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                await client.get(url)
+                self.health_latencies.append(time.perf_counter() - started)
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(self.args.probe_interval)
+
+    async def measure_local_lag(self, stop: asyncio.Event):
+        """
+        Retraso del event loop del propio generador (para descartar que sea el cuello de botella)
+        """
+        interval = 0.05
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.local_loop_lag.append(max(0.0, time.perf_counter() - started - interval))
+
+    async def run(self) -> dict:
+        args = self.args
+        limits = httpx.Limits(max_connections=args.concurrency + 2)
+        timeout = httpx.Timeout(args.timeout)
+        async with httpx.AsyncClient(limits=limits, timeout=timeout) as client, \
+                httpx.AsyncClient(timeout=timeout) as probe_client:
+            stop = asyncio.Event()
+            monitors = [
+                asyncio.create_task(self.probe_health(probe_client, stop)),
+                asyncio.create_task(self.measure_local_lag(stop)),
+            ]
+            started = time.perf_counter()
+            deadline = started + args.duration if args.duration else 0
+            await asyncio.gather(*(self.worker(client, deadline) for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await asyncio.gather(*monitors)
+
+        total = len(self.latencies) + len(self.errors)
+        return {
+            "timestamp": datetime.now().isoformat(),
+            "config": {
+                "url": args.url,
+                "mode": args.mode,
+                "endpoint": args.endpoint or ENDPOINTS[args.mode],
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "duration": args.duration,
+                "targets": self.targets,
+                "copias": args.copias,
+                "logo_ratio": args.logo_ratio,
+                "duplicate_ratio": args.duplicate_ratio,
+            },
+            "elapsed_s": elapsed,
+            "requests_total": total,
+            "requests_ok": len(self.latencies),
+            "throughput_rps": len(self.latencies) / elapsed if elapsed > 0 else 0.0,
+            "error_rate": (len(self.errors) / total) if total else 0.0,
+            "status_codes": {str(code): count for code, count in self.status_codes.items()},
+            "avg_request_bytes": (self.request_bytes / total) if total else 0,
+            "latency": latency_summary(self.latencies),
+            "server_loop_lag": latency_summary(self.health_latencies),
+            "client_loop_lag": latency_summary(self.local_loop_lag),
+            "sample_errors": self.errors[:10],
+        }
+
+
+def verify_journal(path: str) -> dict:
+    """
+    Revisa el journal del emulador: las copias de cada boleta deben llegar juntas a la
+    impresora, sin trabajos de otra boleta intercalados
+    """
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    entries.sort(key=lambda entry: entry["start"])
+    waited = sum(1 for entry in entries if entry["waited"])
+    sequence = [boleta for entry in entries for boleta in entry["boletas"]]
+    seen = set()
+    interleaved = []
+    previous = None
+    for boleta in sequence:
+        if boleta != previous and boleta in seen:
+            interleaved.append(boleta)
+        seen.add(boleta)
+        previous = boleta
+    return {
+        "jobs": len(entries),
+        "waited_jobs": waited,
+        "interleaved_boletas": len(interleaved),
+        "sample_interleaved": interleaved[:10],
+        "ok": not interleaved,
+    }
+
+
+def print_report(report: dict):
+    latency = report["latency"]
+    lag = report["server_loop_lag"]
+    print("=" * 50)
+    print("📈 Resultados de la prueba de carga")
+    print("=" * 50)
+    print(f"   Solicitudes: {report['requests_total']} ({report['requests_ok']} OK) en {report['elapsed_s']:.1f} s")
+    print(f"   Rendimiento: {report['throughput_rps']:.2f} req/s")
+    print(f"   Tasa de error: {report['error_rate'] * 100:.1f}%  {report['status_codes']}")
+    print(f"   Tamaño medio de solicitud: {report['avg_request_bytes']:,.0f} bytes")
+    print(f"   Latencia p50/p95/p99/max: {latency['p50_ms']:.0f} / {latency['p95_ms']:.0f} / "
+          f"{latency['p99_ms']:.0f} / {latency['max_ms']:.0f} ms")
+    print(f"   /health (lag del servidor) p50/p99/max: {lag['p50_ms']:.1f} / {lag['p99_ms']:.1f} / {lag['max_ms']:.1f} ms")
+    print(f"   Lag del generador p99: {report['client_loop_lag']['p99_ms']:.1f} ms")
+    for error in report["sample_errors"][:3]:
+        print(f"   ❌ {error}")
+    if "ordering" in report:
+        ordering = report["ordering"]
+        mark = "✅" if ordering["ok"] else "❌"
+        print(f"   {mark} Orden: {ordering['jobs']} trabajos, {ordering['interleaved_boletas']} boletas intercaladas "
+              f"({ordering['waited_jobs']} conexiones esperaron a la impresora)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga para la API de impresión")
+    parser.add_argument("--url", default="http://localhost:8001", help="URL base de la API")
+    parser.add_argument("--mode", choices=sorted(ENDPOINTS), default="json",
+                        help="json (logo base64), fast (JSON con orjson) o multipart (logo binario)")
+    parser.add_argument("--endpoint", help="Ruta a usar en lugar de la del modo")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="Total de solicitudes (0 = usar --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Duración en segundos")
+    parser.add_argument("--targets", default="network:127.0.0.1:9100",
+                        help="Destinos separados por coma: network:IP:PUERTO o usb:NOMBRE")
+    parser.add_argument("--copias", default="1", help="Copias por ticket, valor o rango (ej. 1-100)")
+    parser.add_argument("--logo-ratio", type=float, default=0.0, help="Fracción de solicitudes con logo")
+    parser.add_argument("--logo-file", help="Logo ESC/POS (.bin); por defecto uno sintético")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="Fracción de reintentos de una boleta previa")
+    parser.add_argument("--printer-timeout", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout HTTP por solicitud (s)")
+    parser.add_argument("--probe-interval", type=float, default=0.2, help="Intervalo de sondeo a /health (s)")
+    parser.add_argument("--output", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--journal", help="Journal del emulador (--journal) para verificar orden y exclusión por impresora")
+    args = parser.parse_args()
+
+    if not args.requests and not args.duration:
+        parser.error("Indique --requests o --duration")
+
+    if args.journal and os.path.exists(args.journal):
+        os.remove(args.journal)
+    report = asyncio.run(LoadTest(args).run())
+    if args.journal:
+        time.sleep(0.5)  # el emulador escribe el journal al cerrar cada conexión
+        report["ordering"] = verify_journal(args.journal)
+    print_report(report)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n✅ Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
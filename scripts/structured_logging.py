@@ -0,0 +1,212 @@
+"""
+Configuración de logging compartida por la API de impresión y la de certificados:
+los registros se encolan sin bloquear y un hilo (QueueListener) los formatea y los
+escribe en stderr, así una consola o un disco lento no detienen el event loop.
+
+    - Al encolar solo se resuelve el mensaje (msg % args, para que un argumento que
+      cambie después no altere el registro) y el texto de la excepción; el JSON y la
+      escritura se hacen en el hilo escritor. Los registros de nivel inferior al
+      configurado no se formatean: use logger.info("Enviado %d bytes a %s", n, destino).
+    - JSON por línea (LOG_FORMAT=json, por defecto) con ts, level, logger, message, pid,
+      los campos pasados en extra={...} y los del proveedor de contexto (trace_id, boleta).
+      LOG_FORMAT=text para leerlo en consola.
+    - Límite de repetición: a partir de WARNING cada mensaje idéntico (mismo texto y mismos
+      argumentos, p. ej. el mismo timeout a la misma impresora) se escribe como máximo
+      LOG_RATE_BURST veces por ventana de LOG_RATE_WINDOW segundos; el siguiente que pasa
+      lleva en 'suppressed' cuántos se omitieron.
+    - Cola acotada (LOG_QUEUE_SIZE): si se llena los registros se descartan y se cuentan
+      en lugar de bloquear.
+
+Uso:
+    from scripts.structured_logging import configure_logging
+    configure_logging(context=lambda: {"trace_id": ...})   (en el lifespan de la app)
+    logger.error("Timeout con impresora %s", destino, extra={"printer": destino})
+
+Requisitos:
+    Ninguno (solo biblioteca estándar)
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Atributos propios de LogRecord (y el texto con colores de uvicorn): el resto son campos de extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName", "color_message"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Un objeto JSON por registro"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formato de consola; añade los mensajes suprimidos por el límite de repetición"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" ({suppressed} iguales omitidos)"
+        dropped = getattr(record, "dropped", 0)
+        if dropped:
+            text += f" ({dropped} registros descartados con la cola llena)"
+        return text
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Deja pasar como máximo 'burst' registros idénticos por ventana de 'window' segundos
+    (solo a partir de 'level'); cuenta los omitidos y los informa en el siguiente que pasa
+    """
+
+    def __init__(self, burst=5, window=10.0, level=logging.WARNING, max_keys=2048):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.level = level
+        self.max_keys = max_keys
+        self._windows = {}  # clave -> [inicio de la ventana, emitidos, omitidos]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level or self.burst <= 0:
+            return True
+        key = (record.name, record.levelno, record.msg, repr(record.args))
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                if len(self._windows) >= self.max_keys:
+                    self._prune(now)
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+    def _prune(self, now):
+        expired = [key for key, state in self._windows.items() if now - state[0] >= self.window]
+        for key in expired or list(self._windows)[:len(self._windows) // 2]:
+            del self._windows[key]
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Encola una copia del registro con el mensaje ya resuelto (el JSON se arma en el hilo
+    del QueueListener) y, con la cola llena, la descarta en lugar de esperar
+    """
+
+    def __init__(self, log_queue, context=None):
+        super().__init__(log_queue)
+        self.context = context
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Como QueueHandler.prepare: los argumentos y el traceback se resuelven aquí, porque
+        # pueden cambiar (o dejar de existir) antes de que el hilo escritor los procese
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        # El contexto (trace_id, boleta) vive en ContextVars: se toma en el hilo que registra
+        if self.context is not None:
+            try:
+                for key, value in self.context().items():
+                    if value is not None and not hasattr(record, key):
+                        setattr(record, key, value)
+            except Exception:
+                pass
+        if self.dropped:
+            record.dropped = self.dropped
+            self.dropped = 0
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_traceback_formatter = logging.Formatter()
+_listener = None
+
+
+def configure_logging(level=None, log_format=None, context=None):
+    """
+    Sustituye los handlers del logger raíz (y los de uvicorn) por la cola no bloqueante.
+    Solo la primera llamada del proceso tiene efecto.
+
+    Args:
+        level: Nivel mínimo (por defecto LOG_LEVEL o INFO)
+        log_format: 'json' o 'text' (por defecto LOG_FORMAT o json)
+        context: Función sin argumentos que devuelve campos extra para cada registro
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    level = (level or os.environ.get("LOG_LEVEL", "INFO")).upper()
+    log_format = (log_format or os.environ.get("LOG_FORMAT", "json")).lower()
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JSONFormatter() if log_format == "json" else TextFormatter())
+    log_queue = queue.Queue(int(os.environ.get("LOG_QUEUE_SIZE", "10000")))
+    handler = NonBlockingQueueHandler(log_queue, context)
+    handler.addFilter(RateLimitFilter(
+        burst=int(os.environ.get("LOG_RATE_BURST", "5")),
+        window=float(os.environ.get("LOG_RATE_WINDOW", "10"))
+    ))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+    # uvicorn instala sus propios handlers (síncronos): se redirigen a la cola
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # Al salir se escriben los registros pendientes
+    atexit.register(_listener.stop)
+    return _listener
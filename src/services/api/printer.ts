@@ -4,6 +4,8 @@ export interface PrinterConfig {
   ip?: string;
   port?: number;
   timeout?: number;
+  profile?: string; // Perfil de impresora (define la página de códigos)
+  code_page?: string; // Página de códigos explícita (ej. 'cp850', 'cp858')
 }
 
 export interface PrintTicketRequest {
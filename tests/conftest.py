@@ -0,0 +1,121 @@
+"""
+Fixtures compartidas por las pruebas de la API de impresión: el emulador ESC/POS
+(scripts/escpos_emulator.py serve) como impresora de red, con su journal JSONL para
+comprobar qué recibió y en qué orden, y la API con locks y caché en un directorio temporal.
+
+Uso:
+    python -m pytest -q
+
+Requisitos:
+    pip install pytest httpx
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Antes de importar main_updated: estado entre procesos (locks, caché de reimpresión) propio de la sesión
+STATE_DIR = tempfile.mkdtemp(prefix="escpos_tests_")
+os.environ["PRINTER_LOCK_DIR"] = os.path.join(STATE_DIR, "locks")
+os.environ["PRINTER_REGISTRY_PATH"] = os.path.join(STATE_DIR, "printers.json")
+os.environ["PRINTER_CUPS_IPP"] = "off"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Emulator:
+    """Proceso del emulador y lectura de su journal (un registro por trabajo recibido)"""
+
+    def __init__(self, port: int, journal: str, process: subprocess.Popen):
+        self.port = port
+        self.journal = journal
+        self.process = process
+
+    def printer_config(self, **fields) -> dict:
+        return {"connection_type": "network", "ip": "127.0.0.1", "port": self.port, **fields}
+
+    def jobs(self, count: int = 0, timeout: float = 10.0) -> list:
+        """Trabajos del journal; espera a que haya al menos 'count'"""
+        deadline = time.monotonic() + timeout
+        while True:
+            entries = []
+            if os.path.exists(self.journal):
+                with open(self.journal, "r", encoding="utf-8") as f:
+                    entries = [json.loads(line) for line in f if line.strip()]
+            if len(entries) >= count or time.monotonic() >= deadline:
+                return entries
+            time.sleep(0.02)
+
+
+@pytest.fixture
+def start_emulator(tmp_path):
+    """Lanza el emulador con las opciones de 'serve' dadas y lo detiene al terminar la prueba"""
+    started = []
+
+    def start(*options) -> Emulator:
+        port = free_port()
+        journal = str(tmp_path / f"journal_{port}.jsonl")
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "scripts", "escpos_emulator.py"), "serve",
+             "--host", "127.0.0.1", "--port", str(port), "--output-dir", str(tmp_path / "trabajos"),
+             "--render", "none", "--quiet", "--journal", journal, *options],
+            stdout=subprocess.DEVNULL
+        )
+        started.append(process)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() >= deadline:
+                    raise RuntimeError("El emulador ESC/POS no arrancó")
+                time.sleep(0.05)
+        # La conexión de sondeo también se registra como trabajo (vacío)
+        emulator = Emulator(port, journal, process)
+        emulator.jobs(1)
+        os.remove(journal)
+        return emulator
+
+    yield start
+    for process in started:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+@pytest.fixture
+def api():
+    """Cliente de la API de impresión (con su lifespan)"""
+    from fastapi.testclient import TestClient
+    import main_updated
+    with TestClient(main_updated.app) as client:
+        yield client
+
+
+def ticket(boleta: str, printer_config: dict, **fields) -> dict:
+    return {
+        "printer_config": printer_config,
+        "producto": "Diesel",
+        "fecha": "2026-01-15 10:30",
+        "boleta": boleta,
+        "cliente": "Cliente de prueba",
+        "destino": "Almacén 1",
+        "placas": "ABC-123",
+        "vehiculo": "Pipa",
+        "chofer": "Juan Pérez",
+        **fields,
+    }
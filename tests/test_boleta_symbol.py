@@ -0,0 +1,68 @@
+"""
+Código de la boleta en el ticket (boleta_symbol_escpos) con comandos nativos:
+GS k para CODE128/CODE39 ajustado al ancho del papel y GS ( k para QR.
+"""
+
+import pytest
+from fastapi import HTTPException
+
+from escpos_common import PRINTER_PROFILES, get_code_page_encoder
+from main_updated import BoletaCodeOptions, boleta_symbol_escpos
+
+CENTER, LEFT = b"\x1ba\x01", b"\x1ba\x00"
+ENCODER = get_code_page_encoder("cp850")
+
+
+def symbol(boleta: str, profile: str = "default", **options) -> bytes:
+    return boleta_symbol_escpos(boleta, BoletaCodeOptions(**options), PRINTER_PROFILES[profile], ENCODER)
+
+
+def test_code128_uses_gs_k_with_code_set_b():
+    assert symbol("B-1234") == (CENTER + b"\x1dh\x50" + b"\x1dw\x03" + b"\x1dH\x02"
+                                + b"\x1dkI\x08{BB-1234" + b"\n" + LEFT)
+
+
+def test_code128_escapes_braces_in_the_data():
+    assert b"\x1dkI\x06{BA{{B" in symbol("A{B")
+
+
+def test_code39_is_uppercased_without_hri():
+    assert symbol("b-12", symbology="code39", hri=False, height=50) == (
+        CENTER + b"\x1dh\x32" + b"\x1dw\x03" + b"\x1dH\x00" + b"\x1dkE\x04B-12" + b"\n" + LEFT
+    )
+
+
+def test_module_shrinks_to_fit_narrow_paper():
+    # 167 módulos: a 3 puntos no caben en 384, a 2 sí
+    assert b"\x1dw\x02" in symbol("ABCDEFGHIJKL", profile="basic58")
+
+
+def test_barcode_that_does_not_fit_at_module_two_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        symbol("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123", profile="basic58")
+    assert error.value.status_code == 400
+    assert "384" in error.value.detail
+
+
+def test_barcode_longer_than_gs_k_length_byte_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        symbol("1" * 300)
+    assert error.value.status_code == 400
+
+
+def test_invalid_code39_characters_are_rejected():
+    with pytest.raises(HTTPException) as error:
+        symbol("B_12", symbology="code39")
+    assert error.value.status_code == 400
+
+
+def test_native_qr_sets_model_module_and_error_correction():
+    assert symbol("B-1234", symbology="qr", module_size=6, error_correction="Q") == (
+        CENTER
+        + b"\x1d(k\x04\x001A2\x00"      # modelo 2
+        + b"\x1d(k\x03\x001C\x06"       # módulo de 6 puntos
+        + b"\x1d(k\x03\x001E2"          # corrección Q
+        + b"\x1d(k\x09\x001P0B-1234"    # datos
+        + b"\x1d(k\x03\x001Q0"          # imprimir
+        + b"\n" + LEFT
+    )
@@ -0,0 +1,45 @@
+"""
+Codificación por página de códigos (CodePageEncoder): los caracteres que la página
+tiene van a su byte, los que no se transliteran y el resto se sustituye por '?'.
+"""
+
+import pytest
+
+from escpos_common import CodePageEncoder, get_code_page_encoder
+
+
+def test_ascii_text_is_passed_through():
+    assert get_code_page_encoder("cp850").encode("Placas ABC-123 #7") == b"Placas ABC-123 #7"
+
+
+@pytest.mark.parametrize("code_page, expected", [
+    ("cp437", b"Se\xa4or \xa5and\xa3 20\xf8C \xa8"),
+    ("cp850", b"Se\xa4or \xa5and\xa3 20\xf8C \xa8"),
+    ("cp1252", b"Se\xf1or \xd1and\xfa 20\xb0C \xbf"),
+])
+def test_characters_in_the_code_page_map_to_their_byte(code_page, expected):
+    assert get_code_page_encoder(code_page).encode("Señor Ñandú 20°C ¿") == expected
+
+
+def test_missing_characters_are_transliterated():
+    encoder = get_code_page_encoder("cp850")
+
+    assert encoder.encode("“Diesel” – 5€") == b'"Diesel" - 5EUR'
+    # Sin descomposición útil ni transliteración: signo de sustitución
+    assert encoder.encode("Łódź ☃") == b"L\xa2dz ?"
+
+
+def test_euro_is_native_in_cp858_but_not_in_cp850():
+    assert get_code_page_encoder("cp858").encode("5€") == b"5\xd5"
+    assert get_code_page_encoder("cp850").encode("5€") == b"5EUR"
+
+
+def test_select_command_uses_the_epson_table_number():
+    assert get_code_page_encoder("cp437").select_command == b"\x1bt\x00"
+    assert get_code_page_encoder("cp858").select_command == b"\x1bt\x13"
+    assert get_code_page_encoder("cp1252").select_command == b"\x1bt\x10"
+
+
+def test_unsupported_code_page_is_rejected():
+    with pytest.raises(ValueError):
+        CodePageEncoder("cp1251")
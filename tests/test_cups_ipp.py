@@ -0,0 +1,122 @@
+"""
+Ruta USB por IPP: codificación de mensajes (scripts/ipp_protocol.py) y CUPSIPPClient
+contra el CUPS emulado (subcomando 'ipp' de scripts/escpos_emulator.py).
+"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import ROOT, free_port
+from main_updated import CUPSIPPClient
+from scripts import ipp_protocol as ipp
+
+TICKET = b"\x1B\x40Hola\n\x1D\x56\x00"
+
+
+@pytest.fixture
+def start_cups(tmp_path):
+    """Lanza el CUPS emulado con las opciones de 'ipp' dadas; devuelve un cliente IPP para él"""
+    started = []
+
+    def start(*options) -> CUPSIPPClient:
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "scripts", "escpos_emulator.py"), "ipp",
+             "--host", "127.0.0.1", "--port", str(port), "--output-dir", str(tmp_path / "trabajos_ipp"),
+             "--printer", "TM20", "--job-seconds", "0.05", "--render", "none", "--quiet", *options],
+            stdout=subprocess.DEVNULL
+        )
+        started.append(process)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() >= deadline:
+                    raise RuntimeError("El CUPS emulado no arrancó")
+                time.sleep(0.05)
+        return CUPSIPPClient(f"127.0.0.1:{port}", job_timeout=5.0, poll_interval=0.02, request_timeout=2.0)
+
+    yield start
+    for process in started:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def test_message_round_trip_keeps_attributes_and_document():
+    body = ipp.encode_message(ipp.OP_PRINT_JOB, 7, [
+        (ipp.TAG_OPERATION, ipp.operation_attributes("ipp://localhost/printers/TM20", user="caja1") + [
+            ("requested-attributes", ipp.TAG_KEYWORD, ["job-id", "job-state"]),
+        ]),
+        (ipp.TAG_JOB, [("copies", ipp.TAG_INTEGER, 2), ("ipp-attribute-fidelity", ipp.TAG_BOOLEAN, False)]),
+    ], data=TICKET)
+
+    message = ipp.decode_message(body)
+
+    assert (message.version, message.code, message.request_id) == ((2, 0), ipp.OP_PRINT_JOB, 7)
+    assert message.attribute("printer-uri") == "ipp://localhost/printers/TM20"
+    assert message.attribute("requesting-user-name", ipp.TAG_OPERATION) == "caja1"
+    assert message.group_list(ipp.TAG_OPERATION)[0]["requested-attributes"] == ["job-id", "job-state"]
+    assert message.attribute("copies", ipp.TAG_JOB) == 2
+    assert message.attribute("ipp-attribute-fidelity") is False
+    assert message.data == TICKET
+
+
+def test_truncated_message_is_rejected():
+    with pytest.raises(ValueError):
+        ipp.decode_message(b"\x02\x00\x00\x02")
+
+
+def test_print_raw_waits_until_the_job_completes(start_cups):
+    client = start_cups()
+
+    result = asyncio.run(client.print_raw("TM20", TICKET))
+
+    assert result["success"], result["message"]
+    assert result["job_state"] == "completed"
+    assert result["bytes_sent"] == len(TICKET)
+
+
+def test_aborted_job_is_reported_as_failure(start_cups):
+    client = start_cups("--abort-rate", "1")
+
+    result = asyncio.run(client.print_raw("TM20", TICKET))
+
+    assert not result["success"]
+    assert result["job_state"] == "aborted"
+    assert "job-aborted-by-system" in result["message"]
+
+
+def test_unknown_queue_is_rejected_by_cups(start_cups):
+    client = start_cups()
+
+    result = asyncio.run(client.print_raw("NO_EXISTE", TICKET))
+
+    assert not result["success"]
+    assert "NO_EXISTE" in result["message"]
+
+
+def test_cupsd_that_never_answers_times_out():
+    async def scenario():
+        # Acepta la conexión pero nunca responde (cupsd colgado)
+        server = await asyncio.start_server(lambda reader, writer: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = CUPSIPPClient(f"127.0.0.1:{port}")
+        async with server:
+            started = time.monotonic()
+            result = await client.print_raw("TM20", TICKET, connect_timeout=1.0, timeout=0.3)
+            return result, time.monotonic() - started, client.available
+
+    result, elapsed, available = asyncio.run(scenario())
+
+    assert result["reason"] == "timeout"
+    assert elapsed < 2.0
+    # No se vuelve a intentar IPP hasta pasado UNAVAILABLE_RETRY
+    assert not available
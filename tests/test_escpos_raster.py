@@ -0,0 +1,55 @@
+"""
+Compactación de bloques GS v 0 (scripts/escpos_raster.py): recorte simétrico de
+columnas en blanco y avance ESC J en lugar de filas en blanco cuando dot_feed=True.
+"""
+
+import struct
+
+from scripts.escpos_raster import GS_V0, compact_escpos_raster, compact_raster
+
+ROW = b"\x81\x01"
+BLANK = bytes(2)
+
+
+def gs_v0(width_bytes: int, rows: list) -> bytes:
+    return GS_V0 + b"\x00" + struct.pack("<HH", width_bytes, len(rows)) + b"".join(rows)
+
+
+def test_blank_columns_are_trimmed_the_same_on_both_sides():
+    bitmap = b"\x00\x81\x01\x00" + b"\x00\x01\x81\x00"
+
+    assert compact_raster(4, 2, bitmap) == gs_v0(2, [b"\x81\x01", b"\x01\x81"])
+
+
+def test_trim_keeps_the_image_centered():
+    # Dos bytes en blanco a la izquierda y uno a la derecha: solo se recorta uno por lado
+    assert compact_raster(4, 1, b"\x00\x00\x81\x00") == gs_v0(2, [b"\x00\x81"])
+
+
+def test_blank_rows_are_sent_without_dot_feed():
+    bitmap = ROW + BLANK * 20 + ROW
+
+    assert compact_raster(2, 22, bitmap) == gs_v0(2, [ROW] + [BLANK] * 20 + [ROW])
+
+
+def test_long_blank_run_becomes_esc_j_with_dot_feed():
+    bitmap = ROW + BLANK * 20 + ROW
+
+    assert compact_raster(2, 22, bitmap, dot_feed=True) == gs_v0(2, [ROW]) + b"\x1bJ\x14" + gs_v0(2, [ROW])
+
+
+def test_short_blank_run_is_cheaper_to_send_than_to_feed():
+    bitmap = ROW + BLANK * 3 + ROW
+
+    assert compact_raster(2, 5, bitmap, dot_feed=True) == gs_v0(2, [ROW] + [BLANK] * 3 + [ROW])
+
+
+def test_blank_image_is_a_feed_split_at_255_dots():
+    assert compact_raster(2, 300, BLANK * 300, dot_feed=True) == b"\x1bJ\xff\x1bJ\x2d"
+
+
+def test_compact_escpos_raster_only_rewrites_single_gs_v0_blocks():
+    block = gs_v0(2, [ROW] + [BLANK] * 20 + [ROW])
+
+    assert compact_escpos_raster(block, dot_feed=True) == gs_v0(2, [ROW]) + b"\x1bJ\x14" + gs_v0(2, [ROW])
+    assert compact_escpos_raster(b"\x1b@Hola\n") == b"\x1b@Hola\n"
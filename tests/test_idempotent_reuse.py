@@ -0,0 +1,53 @@
+"""
+Reintentos con la misma clave de idempotencia (endpoint multipart con logo binario):
+el ticket se imprime una sola vez y el reintento devuelve el resultado existente.
+"""
+
+import json
+import struct
+import uuid
+
+from conftest import ticket
+
+# Logo mínimo: GS v 0 de 8x8 puntos
+LOGO = b"\x1D\x76\x30\x00" + struct.pack("<HH", 1, 8) + bytes([0xFF, 0x81, 0x81, 0x81, 0x81, 0x81, 0x81, 0xFF])
+
+
+def post_multipart(api, payload: dict, key: str):
+    return api.post(
+        "/api/printer/print-ticket/multipart",
+        data={"ticket": json.dumps(payload)},
+        files={"logo": ("logo_escpos.bin", LOGO, "application/octet-stream")},
+        headers={"Idempotency-Key": key}
+    )
+
+
+def test_retry_with_same_key_reuses_the_printed_job(api, start_emulator):
+    emulator = start_emulator()
+    boleta = f"T-{uuid.uuid4().hex[:8]}"
+    payload = ticket(boleta, emulator.printer_config())
+    key = uuid.uuid4().hex
+
+    first = post_multipart(api, payload, key)
+    retry = post_multipart(api, payload, key)
+
+    assert first.status_code == 200, first.text
+    assert retry.status_code == 200, retry.text
+    assert first.json()["idempotency_key"] == retry.json()["idempotency_key"] == key
+    assert not first.json()["reused"]
+    assert retry.json()["reused"]
+    jobs = emulator.jobs(1)
+    assert [job["boletas"] for job in jobs] == [[boleta]]
+
+
+def test_different_key_prints_again(api, start_emulator):
+    emulator = start_emulator()
+    boleta = f"T-{uuid.uuid4().hex[:8]}"
+    payload = ticket(boleta, emulator.printer_config())
+
+    first = post_multipart(api, payload, uuid.uuid4().hex)
+    second = post_multipart(api, payload, uuid.uuid4().hex)
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert not second.json()["reused"]
+    assert [job["boletas"] for job in emulator.jobs(2)] == [[boleta], [boleta]]
@@ -0,0 +1,81 @@
+"""
+Exclusión por impresora (PrinterLease): dos clientes que imprimen a la vez en la misma
+impresora, en el mismo proceso o desde otro worker, nunca intercalan sus copias.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import uuid
+
+from conftest import ROOT, ticket
+
+# Otro worker: otro proceso con la misma PRINTER_LOCK_DIR (heredada del entorno)
+OTHER_WORKER = """
+import json, sys
+sys.path.insert(0, sys.argv[1])
+from fastapi.testclient import TestClient
+import main_updated
+with TestClient(main_updated.app) as client:
+    print("listo", flush=True)
+    sys.stdin.readline()
+    response = client.post("/api/printer/print-ticket", json=json.loads(sys.argv[2]))
+    print(response.status_code, flush=True)
+"""
+
+
+def groups(jobs: list) -> list:
+    """Boletas en el orden recibido, agrupando las copias consecutivas"""
+    order = []
+    for job in jobs:
+        for boleta in job["boletas"]:
+            if not order or order[-1] != boleta:
+                order.append(boleta)
+    return order
+
+
+def test_concurrent_clients_do_not_interleave_copies(api, start_emulator):
+    emulator = start_emulator("--byte-latency", "0.0002")
+    boletas = [f"L-{uuid.uuid4().hex[:8]}" for _ in range(2)]
+    responses = {}
+
+    def client(boleta):
+        payload = ticket(boleta, emulator.printer_config(), copias=3)
+        responses[boleta] = api.post("/api/printer/print-ticket", json=payload)
+
+    threads = [threading.Thread(target=client, args=(boleta,)) for boleta in boletas]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(response.status_code == 200 for response in responses.values())
+    jobs = emulator.jobs(6)
+    assert len(jobs) == 6
+    assert sorted(groups(jobs)) == sorted(boletas)
+
+
+def test_lease_serializes_jobs_across_workers(api, start_emulator):
+    emulator = start_emulator("--byte-latency", "0.0002")
+    local, remote = f"L-{uuid.uuid4().hex[:8]}", f"R-{uuid.uuid4().hex[:8]}"
+    worker = subprocess.Popen(
+        [sys.executable, "-c", OTHER_WORKER, ROOT,
+         json.dumps(ticket(remote, emulator.printer_config(), copias=3))],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env={**os.environ, "WEB_CONCURRENCY": "1"}
+    )
+    try:
+        assert worker.stdout.readline().strip() == "listo"
+        worker.stdin.write("\n")
+        worker.stdin.flush()
+        response = api.post("/api/printer/print-ticket", json=ticket(local, emulator.printer_config(), copias=3))
+        assert worker.stdout.readline().strip() == "200"
+    finally:
+        worker.stdin.close()
+        worker.wait(timeout=30)
+
+    assert response.status_code == 200, response.text
+    jobs = emulator.jobs(6)
+    assert len(jobs) == 6
+    assert sorted(groups(jobs)) == sorted([local, remote])
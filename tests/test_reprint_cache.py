@@ -0,0 +1,51 @@
+"""
+Reimpresión desde la caché de tickets generados: solo se reutiliza el ticket si se
+generó para la misma variante (página de códigos, ancho en puntos y modo raster).
+"""
+
+import uuid
+
+from conftest import ticket
+
+
+def test_reprint_sends_the_cached_ticket(api, start_emulator):
+    emulator = start_emulator()
+    boleta = f"C-{uuid.uuid4().hex[:8]}"
+    config = emulator.printer_config(profile="pc437")
+
+    printed = api.post("/api/printer/print-ticket", json=ticket(boleta, config))
+    reprinted = api.post(f"/api/printer/reprint/{boleta}", json={"printer_config": config})
+
+    assert printed.status_code == 200, printed.text
+    assert reprinted.status_code == 200, reprinted.text
+    original, reprint = emulator.jobs(2)
+    assert reprint["boletas"] == [boleta]
+    assert reprint["bytes"] == original["bytes"]
+
+
+def test_reprint_for_another_variant_is_not_served_from_cache(api, start_emulator):
+    emulator = start_emulator()
+    boleta = f"C-{uuid.uuid4().hex[:8]}"
+    printed = api.post("/api/printer/print-ticket", json=ticket(boleta, emulator.printer_config(profile="pc437")))
+    assert printed.status_code == 200, printed.text
+
+    # Misma página de códigos (cp437) pero 384 puntos y sin QR nativo
+    narrower = api.post(f"/api/printer/reprint/{boleta}",
+                        json={"printer_config": emulator.printer_config(profile="basic58")})
+    # Mismo ancho pero otra página de códigos
+    other_code_page = api.post(f"/api/printer/reprint/{boleta}",
+                               json={"printer_config": emulator.printer_config(profile="pc437", code_page="cp850")})
+
+    assert narrower.status_code == 404
+    assert "384" in narrower.json()["detail"]
+    assert other_code_page.status_code == 404
+    assert "cp850" in other_code_page.json()["detail"]
+    assert len(emulator.jobs(1, timeout=0.5)) == 1
+
+
+def test_reprint_of_unknown_boleta_is_404(api, start_emulator):
+    emulator = start_emulator()
+    response = api.post(f"/api/printer/reprint/C-{uuid.uuid4().hex[:8]}",
+                        json={"printer_config": emulator.printer_config()})
+    assert response.status_code == 404
+    assert emulator.jobs(timeout=0) == []
@@ -0,0 +1,58 @@
+"""
+Envío por bloques con control de flujo (ESCPOSStreamWriter) contra el emulador:
+una impresora lenta con buffer pequeño frena al emisor sin perder bytes, y la
+consulta de estado espera a que deje de estar ocupada.
+"""
+
+import asyncio
+
+import main_updated
+from main_updated import ESCPOSStreamWriter, printer_service
+
+
+def send(emulator, data: bytes, **options) -> dict:
+    return asyncio.run(printer_service.send_escpos_command(
+        ip="127.0.0.1", port=emulator.port, escpos_data=data, **options
+    ))
+
+
+def test_slow_printer_applies_backpressure_without_losing_bytes(start_emulator):
+    emulator = start_emulator("--buffer-size", "4096", "--byte-latency", "0.00001")
+    data = b"\x1B\x40" + b"Linea de prueba 0123456789\n" * 10000
+
+    result = send(emulator, data, chunk_size=4096)
+
+    assert result["success"], result["message"]
+    assert result["bytes_sent"] == len(data)
+    assert result["stalled"]
+    (job,) = emulator.jobs(1)
+    assert not job["disconnected"]
+    # La consulta de estado inicial (DLE EOT 1) más el ticket completo
+    assert job["bytes"] == len(data) + len(main_updated.ESCPOSCommands.STATUS_PRINTER)
+
+
+def test_busy_printer_is_polled_until_ready(start_emulator):
+    emulator = start_emulator("--busy-polls", "3")
+
+    result = send(emulator, b"\x1B\x40Hola\n")
+
+    assert result["success"], result["message"]
+    assert result["status_supported"]
+    (job,) = emulator.jobs(1)
+    assert job["bytes"] == len(b"\x1B\x40Hola\n") + 4 * len(main_updated.ESCPOSCommands.STATUS_PRINTER)
+
+
+def test_printer_without_status_is_probed_again_after_cool_down(start_emulator):
+    emulator = start_emulator("--status", "none")
+    target = f"127.0.0.1:{emulator.port}"
+    data = b"\x1B\x40Hola\n"
+    probe = len(main_updated.ESCPOSCommands.STATUS_PRINTER)
+
+    first = send(emulator, data)
+    second = send(emulator, data)
+    ESCPOSStreamWriter.status_unsupported[target] -= ESCPOSStreamWriter.STATUS_RETRY_AFTER
+    third = send(emulator, data)
+
+    assert first["success"] and second["success"] and third["success"]
+    assert first["status_supported"] is False and second["status_supported"] is False
+    assert [job["bytes"] for job in emulator.jobs(3)] == [len(data) + probe, len(data), len(data) + probe]